@@ -0,0 +1,440 @@
+"""
+asyncio client for the SyncroX file transfer server.
+
+Same wire protocol as SyncroXFileClient, but every transfer is a coroutine
+waiting on its own datagram endpoint, so one process can run many uploads
+and downloads at once:
+
+    async with AsyncSyncroXFileClient(host, port) as client:
+        results = await asyncio.gather(
+            client.upload_bytes(room, "a.bin", a),
+            client.download_bytes(room, "b.bin"),
+        )
+"""
+import asyncio
+import json
+import time
+from typing import List, Optional, Tuple
+
+try:
+    from .protocol import (
+        FileReceiver, FileSender, FileTransferMetrics,
+        CHUNK_SIZE, WIRE_JSON, WIRE_BINARY, parse_datagram, encode_ack, data_payload, ack_requested,
+        probe_path_mtu, chunk_size_for_payload, content_id, manifest, MANIFEST_MAX_BLOCKS,
+        parse_compression, compression_spec, RWND_BYTES
+    )
+    from .delta import compute_delta, parse_signature
+    from .client import (
+        METRICS_DIR, SERVER_HOST, FILE_PORT, SYNCROX_LOSS_PROB,
+        HANDSHAKE_TIMEOUT, TERMINATION_TIMEOUT, MAX_RETRIES,
+        TOTAL_DOWNLOAD_TIMEOUT, DELTA_MAX_LITERAL_FRACTION
+    )
+except (ImportError, ValueError):
+    from protocol import (
+        FileReceiver, FileSender, FileTransferMetrics,
+        CHUNK_SIZE, WIRE_JSON, WIRE_BINARY, parse_datagram, encode_ack, data_payload, ack_requested,
+        probe_path_mtu, chunk_size_for_payload, content_id, manifest, MANIFEST_MAX_BLOCKS,
+        parse_compression, compression_spec, RWND_BYTES
+    )
+    from delta import compute_delta, parse_signature
+    from client import (
+        METRICS_DIR, SERVER_HOST, FILE_PORT, SYNCROX_LOSS_PROB,
+        HANDSHAKE_TIMEOUT, TERMINATION_TIMEOUT, MAX_RETRIES,
+        TOTAL_DOWNLOAD_TIMEOUT, DELTA_MAX_LITERAL_FRACTION
+    )
+
+
+class _TransferEndpoint(asyncio.DatagramProtocol):
+    """One UDP socket per transfer: the server keys sessions by client address."""
+
+    def __init__(self):
+        self.transport = None
+        self.queue = asyncio.Queue()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        self.queue.put_nowait(data)
+
+    def error_received(self, exc):
+        pass
+
+    async def recv(self, timeout: float) -> Optional[dict]:
+        """Next parseable datagram, or None once `timeout` passes."""
+        try:
+            data = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        try:
+            return parse_datagram(data)
+        except ValueError:
+            return {}
+
+
+class AsyncSyncroXFileClient:
+    def __init__(self, host=None, port=None, algo="reno", sack=True, probe_mtu=True,
+                 compress: Optional[str] = "zlib", fec: bool = False):
+        self.host = host if host is not None else SERVER_HOST
+        self.tcp_port = port if port is not None else FILE_PORT
+        self.udp_port = self.tcp_port + 1
+        self.algo = algo.lower()
+        self.sack = sack
+        self.probe_mtu = probe_mtu
+        self.compress = compress
+        self.fec = fec
+        self.chunk_size = None
+        # The first transfers to start share one path MTU probe
+        self._probe_lock = asyncio.Lock()
+
+        self.reader = None
+        self.writer = None
+        # TCP commands are request/response; concurrent callers take turns
+        self._tcp_lock = asyncio.Lock()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.tcp_port)
+        return self
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _open_endpoint(self) -> _TransferEndpoint:
+        loop = asyncio.get_running_loop()
+        _, endpoint = await loop.create_datagram_endpoint(_TransferEndpoint, local_addr=("0.0.0.0", 0))
+        return endpoint
+
+    async def _propose_chunk_size(self) -> int:
+        async with self._probe_lock:
+            if self.chunk_size is None:
+                payload = None
+                if self.probe_mtu:
+                    loop = asyncio.get_running_loop()
+                    payload = await loop.run_in_executor(None, probe_path_mtu, (self.host, self.udp_port))
+                self.chunk_size = chunk_size_for_payload(payload) if payload else CHUNK_SIZE
+            return self.chunk_size
+
+    def _send(self, endpoint: _TransferEndpoint, msg: dict):
+        endpoint.transport.sendto(json.dumps(msg).encode("utf-8"), (self.host, self.udp_port))
+
+    async def upload_bytes(self, room: str, filename: str, data: bytes, algo: Optional[str] = None) -> str:
+        # The server resumes interrupted uploads by content id and skips
+        # the blocks (or whole file) it already stores
+        cid, blocks = manifest(data)
+        if len(blocks) > MANIFEST_MAX_BLOCKS:
+            blocks = []
+        return await self._upload_session(room, filename, data, (algo or self.algo).lower(),
+                                          {"content_id": cid, "size": len(data), "manifest": blocks})
+
+    async def upload_delta(self, room: str, filename: str, data: bytes, algo: Optional[str] = None) -> str:
+        """Upload a new version of `filename` as an rsync delta; see SyncroXFileClient.upload_delta."""
+        algo = (algo or self.algo).lower()
+        sig = await self.get_signature(room, filename)
+        if sig is not None:
+            block, base_size, tag, records = sig
+            loop = asyncio.get_running_loop()
+            # Rolling checksums are CPU-bound; keep them off the loop
+            ops = await loop.run_in_executor(None, lambda: compute_delta(
+                records, block, base_size, data, max_literal=int(len(data) * DELTA_MAX_LITERAL_FRACTION)))
+            if ops is not None and len(ops) < len(data):
+                target_id, _ = manifest(data)
+                spec = {"base": filename, "base_tag": tag, "block": block,
+                        "target_id": target_id, "target_size": len(data)}
+                result = await self._upload_session(room, filename, ops, algo,
+                                                    {"content_id": content_id(ops), "size": len(ops), "delta": spec})
+                if not result.startswith("ERROR Delta"):
+                    return result
+        return await self.upload_bytes(room, filename, data, algo)
+
+    async def _upload_session(self, room: str, filename: str, data: bytes, algo: str, fields: dict) -> str:
+        endpoint = await self._open_endpoint()
+        try:
+            return await self._upload(endpoint, room, filename, data, algo, fields)
+        finally:
+            endpoint.transport.close()
+
+    async def _upload(self, endpoint: _TransferEndpoint, room: str, filename: str, data: bytes, algo: str,
+                      fields: dict) -> str:
+        session_id = None
+        wire = WIRE_JSON
+        sack = False
+        chunk_size = CHUNK_SIZE
+        compression = None
+        fec = False
+        byte_window = False
+        resume = None
+        proposed = await self._propose_chunk_size()
+        syn = {"type": "SYN", "room": room, "filename": filename, "wire": WIRE_BINARY,
+               "chunk_size": proposed, "rwnd": RWND_BYTES, **fields}
+        if self.compress:
+            syn["compress"] = self.compress
+        if self.fec:
+            syn["fec"] = True
+
+        start_h = time.time()
+        while time.time() - start_h < HANDSHAKE_TIMEOUT:
+            self._send(endpoint, syn)
+            msg = await endpoint.recv(1.0)
+            if msg and msg.get("type") == "SYN-ACK" and msg.get("filename") == filename:
+                if msg.get("have"):
+                    return "OK SAVED"
+                if msg.get("error"):
+                    return f"ERROR {msg['error']}"
+                session_id = msg.get("session_id")
+                # Servers that predate binary framing or SACK don't echo them
+                wire = msg.get("wire", WIRE_JSON)
+                sack = self.sack and msg.get("sack") is True
+                chunk_size = int(msg.get("chunk_size", CHUNK_SIZE))
+                compression = parse_compression(msg.get("compress"))
+                fec = self.fec and msg.get("fec") is True
+                byte_window = msg.get("rwnd") == RWND_BYTES
+                resume = msg.get("resume")
+                self._send(endpoint, {"type": "ACK", "room": room, "filename": filename, "session_id": session_id})
+                break
+
+        if not session_id:
+            return "ERROR Handshake failed"
+
+        metrics = FileTransferMetrics(room, filename, METRICS_DIR, algo=algo, direction="upload")
+        metrics.on_start()
+        sender = FileSender(room, filename, data, (self.host, self.udp_port), endpoint.transport, metrics,
+                            loss_prob=SYNCROX_LOSS_PROB, session_id=session_id, wire=wire, sack=sack,
+                            chunk_size=chunk_size, compression=compression, fec=fec,
+                            byte_window=byte_window)
+        if resume:
+            sender.resume_from(int(resume.get("ack", 0)), resume.get("sack"))
+
+        next_seq = metrics.last_ack + 1
+        while metrics.last_ack < sender.total_packets:
+            next_seq = sender.send_window(next_seq, metrics.last_ack + 1)
+
+            # Sleep until an ACK arrives or the pacer/RTO timer is due
+            ack = await endpoint.recv(sender.poll_timeout(metrics.last_ack + 1))
+            if ack and ack.get("type") == "ACK" and ack.get("session_id") == session_id and "ack" in ack:
+                if "rwnd" in ack:
+                    sender.update_rwnd(int(ack["rwnd"]))
+                sender.handle_ack(int(ack["ack"]), ack.get("sack"), ack.get("repaired"))
+                next_seq = max(next_seq, metrics.last_ack + 1)
+
+            base = metrics.last_ack + 1
+            if base in sender.sent_times:
+                new_next, ok = sender.handle_timeout(base, MAX_RETRIES)
+                if not ok:
+                    metrics.close()
+                    sender.close()
+                    return "ERROR Max retries exceeded"
+                if new_next != -1:
+                    next_seq = new_next
+
+        error = None
+        start_term = time.time()
+        while time.time() - start_term < TERMINATION_TIMEOUT:
+            msg = await endpoint.recv(1.0)
+            if msg and msg.get("type") == "FIN" and msg.get("filename") == filename and msg.get("session_id") == session_id:
+                error = msg.get("error")
+                self._send(endpoint, {"type": "FIN-ACK", "room": room, "filename": filename, "session_id": session_id})
+                break
+
+        metrics.on_complete(sender.logical_bytes, sender.wire_bytes,
+                            sender.compression and compression_spec(sender.compression))
+        metrics.close()
+        sender.close()
+        return f"ERROR {error}" if error else "OK SAVED"
+
+    async def download_bytes(self, room: str, filename: str, algo: Optional[str] = None,
+                             offset: int = 0, length: Optional[int] = None) -> Optional[bytes]:
+        algo = (algo or self.algo).lower()
+        endpoint = await self._open_endpoint()
+        try:
+            return await self._download(endpoint, room, filename, algo, offset, length)
+        finally:
+            endpoint.transport.close()
+
+    async def _download(self, endpoint: _TransferEndpoint, room: str, filename: str, algo: str,
+                        offset: int, length: Optional[int]) -> Optional[bytes]:
+        session_id = None
+        wire = WIRE_JSON
+        chunk_size = CHUNK_SIZE
+        compression = None
+        byte_window = False
+        rtt = None
+        ranged = bool(offset) or length is not None
+        trim = False
+        empty = False
+        request = {"type": "DOWNLOAD", "room": room, "filename": filename, "algo": algo,
+                   "wire": WIRE_BINARY, "sack": self.sack, "rwnd": RWND_BYTES,
+                   "chunk_size": await self._propose_chunk_size()}
+        if self.compress:
+            request["compress"] = self.compress
+        if self.fec:
+            request["fec"] = True
+        if ranged:
+            request.update({"offset": offset, "length": length})
+
+        start_h = time.time()
+        while time.time() - start_h < HANDSHAKE_TIMEOUT:
+            self._send(endpoint, request)
+            sent_at = time.time()
+            msg = await endpoint.recv(1.0)
+            if msg and msg.get("type") == "SYN-ACK" and msg.get("filename") == filename:
+                # The handshake's round trip seeds receive-window autotuning
+                rtt = time.time() - sent_at
+                session_id = msg.get("session_id")
+                wire = msg.get("wire", WIRE_JSON)
+                chunk_size = int(msg.get("chunk_size", CHUNK_SIZE))
+                compression = parse_compression(msg.get("compress"))
+                byte_window = msg.get("rwnd") == RWND_BYTES
+                # Servers without range support send the whole file
+                trim = ranged and "offset" not in msg
+                # An empty range (or file) has no DATA to wait for
+                empty = msg.get("length") == 0
+                self._send(endpoint, {"type": "ACK", "room": room, "filename": filename, "session_id": session_id})
+                break
+
+        if not session_id:
+            return None
+
+        async def close_session():
+            self._send(endpoint, {"type": "FIN", "room": room, "filename": filename, "session_id": session_id})
+            start_fa = time.time()
+            while time.time() - start_fa < 2:
+                msg2 = await endpoint.recv(0.5)
+                if msg2 and msg2.get("type") == "FIN-ACK" and msg2.get("session_id") == session_id:
+                    break
+
+        if empty:
+            await close_session()
+            return b""
+
+        def send_ack(receiver: FileReceiver):
+            receiver.ack_sent()
+            ack = encode_ack(session_id, receiver.get_ack_seq(), receiver.advertised_window(byte_window),
+                             wire=wire, room=room, filename=filename,
+                             sack=receiver.get_sack_blocks(), repaired=receiver.repaired)
+            endpoint.transport.sendto(ack, (self.host, self.udp_port))
+
+        receiver = None
+        start_t = time.time()
+        while time.time() - start_t < TOTAL_DOWNLOAD_TIMEOUT:
+            # Wake up in time to send a delayed ACK
+            delay = receiver.ack_delay() if receiver is not None else None
+            msg = await endpoint.recv(1.0 if delay is None else max(delay, 0.001))
+            if msg is None:
+                if receiver is not None and receiver.unacked:
+                    send_ack(receiver)
+                elif receiver is None:
+                    if time.time() - start_t > 5.0:
+                        return None
+                    self._send(endpoint, request)
+                continue
+
+            if msg.get("type") == "ERROR":
+                return None
+            if msg.get("session_id") != session_id:
+                continue
+            if msg.get("type") == "PARITY" and receiver is not None:
+                # Rebuilds a lost chunk of its group, if exactly one is missing
+                if not receiver.add_parity(int(msg["first"]), int(msg["k"]), int(msg["len_xor"]),
+                                           data_payload(msg)):
+                    continue
+            elif msg.get("type") == "DATA":
+                if receiver is None:
+                    receiver = FileReceiver(int(msg["total"]), chunk_size=chunk_size, rtt=rtt,
+                                            sock=endpoint.transport)
+                try:
+                    payload = data_payload(msg, compression, chunk_size)
+                except ValueError:
+                    continue
+                receiver.add_chunk(int(msg["seq"]), payload)
+                if not receiver.ack_due(ack_requested(msg)):
+                    continue
+            else:
+                continue
+            send_ack(receiver)
+
+            if receiver.is_complete():
+                await close_session()
+                data = receiver.finalize_to_bytes()
+                if trim:
+                    data = data[offset:None if length is None else offset + length]
+                return data
+
+        print(f"[UDP CLIENT] Download timed out after {TOTAL_DOWNLOAD_TIMEOUT}s")
+        return None
+
+    async def download_tcp(self, room: str, filename: str, offset: int = 0,
+                           length: Optional[int] = None) -> Optional[bytes]:
+        """Fetch a file, or a byte range of it, over the TCP control connection."""
+        if offset or length is not None:
+            line = f"RANGE {room} {offset} {'*' if length is None else length} {filename}"
+        else:
+            line = f"DOWNLOAD {room} {filename}"
+        async with self._tcp_lock:
+            header = await self._command(line)
+            if not header.startswith("OK "):
+                return None
+            try:
+                return await self.reader.readexactly(int(header.split()[1]))
+            except asyncio.IncompleteReadError:
+                return None
+
+    async def get_signature(self, room: str, filename: str) -> Optional[Tuple[int, int, str, list]]:
+        """rsync signature of a file in the room: (block size, file size, tag, records), or None."""
+        async with self._tcp_lock:
+            header = (await self._command(f"SIGNATURE {room} {filename}")).split()
+            if len(header) != 5 or header[0] != "OK":
+                return None
+            try:
+                raw = await self.reader.readexactly(int(header[2]))
+            except asyncio.IncompleteReadError:
+                return None
+        return int(header[1]), int(header[3]), header[4], parse_signature(raw)
+
+    async def _command(self, line: str) -> str:
+        self.writer.write((line + "\n").encode("utf-8"))
+        await self.writer.drain()
+        return (await self.reader.readline()).decode("utf-8").strip()
+
+    async def list_files(self, room: str) -> List[Tuple[str, int, str]]:
+        async with self._tcp_lock:
+            header = await self._command(f"LIST {room}")
+            if not header.startswith("FILES"):
+                return []
+            try:
+                n = int(header.split()[1])
+            except (IndexError, ValueError):
+                return []
+
+            result = []
+            for _ in range(n):
+                line = (await self.reader.readline()).decode("utf-8").strip()
+                parts = line.split(maxsplit=2)
+                if len(parts) < 3:
+                    continue
+                result.append((parts[2], int(parts[0]), parts[1]))
+            return result
+
+    async def get_stats(self) -> Optional[dict]:
+        """Fetch the server's live session and memory instrumentation."""
+        async with self._tcp_lock:
+            line = await self._command("STATS")
+        if not line.startswith("STATS "):
+            return None
+        try:
+            return json.loads(line[len("STATS "):])
+        except ValueError:
+            return None
+
+    async def close(self):
+        if self.writer is None:
+            return
+        try:
+            async with self._tcp_lock:
+                await self._command("BYE")
+        except (ConnectionError, OSError):
+            pass
+        self.writer.close()
+        self.writer = None
@@ -0,0 +1,121 @@
+"""
+asyncio implementation of the SyncroX file transfer server.
+
+Speaks exactly the same TCP (LIST / DOWNLOAD / RANGE / STATS / BYE) and UDP
+(SYN / DOWNLOAD / ACK / DATA / FIN / FIN-ACK) protocol as server.py and
+reuses its datagram and command handlers, so old and new clients work
+against either. The differences are the plumbing:
+- one event loop instead of a UDP thread, a timer thread and TCP threads
+- retransmission, pacing and idle timers are loop.call_at/call_later handles
+- TCP DOWNLOAD bodies go out with loop.sendfile
+
+Run with: python backend/file_transfer/async_server.py
+"""
+import asyncio
+import os
+import sys
+
+# Add project root to path for imports
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer.server import (
+    HOST, TCP_PORT, CHUNK_SIZE, ROOT_UPLOAD_DIR,
+    TcpClient, handle_tcp_command, handle_datagram, discard_session, store
+)
+from backend.file_transfer.protocol import RCV_MEMORY_BUDGET, size_socket_buffers
+
+
+class FileTransferProtocol(asyncio.DatagramProtocol):
+    """UDP side: every datagram is handled inline on the event loop."""
+
+    def __init__(self, sessions: dict):
+        self.sessions = sessions
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        # Room for every upload's receive window at once, as in server.py
+        size_socket_buffers(transport, RCV_MEMORY_BUDGET, RCV_MEMORY_BUDGET)
+        print(f"[UDP FILE] Async server listening on {transport.get_extra_info('sockname')}")
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            handle_datagram(self.sessions, self.transport, asyncio.get_running_loop(), data, addr)
+        except Exception as e:
+            print(f"[UDP FILE] Error: {e}")
+
+    def error_received(self, exc):
+        # ICMP port unreachable from a client that went away; its timers clean up
+        print(f"[UDP FILE] Socket error: {exc}")
+
+
+async def handle_tcp_stream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, sessions: dict):
+    loop = asyncio.get_running_loop()
+    addr = writer.get_extra_info("peername")
+    print(f"[TCP FILE] New connection from {addr}")
+    # TcpClient only buffers the reply here; the stream writes it out
+    client = TcpClient(None, addr)
+    try:
+        while not client.closing:
+            line_bytes = await reader.readline()
+            if not line_bytes:
+                break
+            try:
+                line = line_bytes.decode("utf-8").strip()
+            except UnicodeDecodeError:
+                print(f"[TCP FILE] Invalid encoding from {addr}")
+                writer.write(b"ERROR Invalid command encoding\n")
+                continue
+            if not line:
+                continue
+
+            # Room lookups and directory scans block; keep them off the loop
+            await loop.run_in_executor(None, handle_tcp_command, client, line, sessions)
+            writer.write(bytes(client.outbuf))
+            client.outbuf.clear()
+            await writer.drain()
+
+            if client.body is not None:
+                f, offset, remaining = client.body
+                client.body = None
+                with f:
+                    await loop.sendfile(writer.transport, f, offset, remaining)
+    except (ConnectionError, OSError) as e:
+        print(f"[TCP FILE] Error with client {addr}: {e}")
+    finally:
+        writer.close()
+
+
+async def serve(host: str = HOST, tcp_port: int = TCP_PORT):
+    loop = asyncio.get_running_loop()
+    sessions = {}
+    store.prune()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: FileTransferProtocol(sessions), local_addr=(host, tcp_port + 1)
+    )
+    server = await asyncio.start_server(
+        lambda r, w: handle_tcp_stream(r, w, sessions), host, tcp_port, limit=CHUNK_SIZE * 16
+    )
+    print(f"[TCP FILE] Async server listening on {host}:{tcp_port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        transport.close()
+        for sess in list(sessions.values()):
+            discard_session(sess)
+
+
+def main():
+    print(f"[FILE SERVER] Starting (asyncio)...")
+    print(f"[FILE SERVER] Root upload dir: {ROOT_UPLOAD_DIR}")
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("[FILE SERVER] Shutting down...")
+
+
+if __name__ == "__main__":
+    main()
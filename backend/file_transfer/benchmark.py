@@ -0,0 +1,1406 @@
+"""
+Micro-benchmarks for the reliable-UDP file transfer protocol.
+
+Usage:
+    python backend/file_transfer/benchmark.py framing [--mb 32]
+    python backend/file_transfer/benchmark.py sender-memory [--mb 64] [--clients 16]
+    python backend/file_transfer/benchmark.py sack [--mb 4] [--loss 0.1] [--runs 3]
+    python backend/file_transfer/benchmark.py pacing [--mb 2] [--mbit 20] [--rtt 20] [--buffer 8]
+    python backend/file_transfer/benchmark.py yield [--fg-mb 2] [--bg-mb 6] [--mbit 20] [--buffer 48]
+    python backend/file_transfer/benchmark.py timers [--sessions 10000] [--due 10]
+    python backend/file_transfer/benchmark.py workers [--max-workers 4] [--clients 8] [--mb 4]
+    python backend/file_transfer/benchmark.py gso [--mb 64] [--window 64]
+    python backend/file_transfer/benchmark.py parallel [--mb 48] [--rtt 40] [--max-streams 8]
+    python backend/file_transfer/benchmark.py delta [--mb 100] [--edit 0.01] [--regions 10]
+    python backend/file_transfer/benchmark.py compress [--mb 4] [--mbit 10] [--rtt 20]
+    python backend/file_transfer/benchmark.py fec [--mb 4] [--rtt 40] [--loss 0.01 0.05 0.1]
+    python backend/file_transfer/benchmark.py acks [--mb 8] [--mbit 50] [--rtt 20] [--every 1 2 4]
+    python backend/file_transfer/benchmark.py rwnd [--mb 16] [--mbit 100] [--rtt 80] [--fixed 32]
+    python backend/file_transfer/benchmark.py admission [--mb 32] [--delay 50] [--interval 50]
+    python backend/file_transfer/benchmark.py writes [--mb 32] [--upload-mb 1] [--disk-ms 30]
+    python backend/file_transfer/benchmark.py file-cache [--mb 64] [--clients 40]
+    python backend/file_transfer/benchmark.py egress [--mbit 40] [--mb 8] [--small-kb 256]
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import socket
+import select
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import threading
+import contextlib
+from pathlib import Path
+from typing import Optional
+
+# Add project root to path for imports
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer.timers import TimerScheduler
+from backend.file_transfer.protocol import (
+    CHUNK_SIZE, FileSender, FileReceiver, FileTransferMetrics,
+    WIRE_JSON, WIRE_BINARY, parse_datagram, data_payload, encode_ack, ack_requested, ACK_EVERY,
+    map_file, process_memory, DatagramReader, gso_supported, enable_gro
+)
+
+
+def _remove_room_metrics(metrics_dir: Path, room: str):
+    """Delete the per-transfer and summary CSVs a benchmark's transfers wrote for `room`."""
+    for csv_name in (f"room_{room}_file_metrics.csv", f"room_{room}_transfer_summary.csv"):
+        path = metrics_dir / csv_name
+        if path.exists():
+            path.unlink()
+
+
+def _report(label: str, packets: int, nbytes: int, wall: float, cpu: float, wire_bytes: int):
+    mb = nbytes / (1024 * 1024)
+    print(
+        f"  {label:<8} {packets / wall:>10.0f} pkt/s  "
+        f"{cpu * 1000.0 / mb:>8.2f} ms CPU/MB  "
+        f"{wire_bytes / packets:>7.0f} B/pkt on wire"
+    )
+
+
+def bench_codec(data: bytes, wire: str):
+    """Encode every chunk and decode it again, without touching the network."""
+    sender = FileSender("0000", "bench.bin", data, ("127.0.0.1", 0), None, None,
+                        session_id="0badcafe", wire=wire)
+    wire_bytes = 0
+    t0, c0 = time.perf_counter(), time.process_time()
+    for seq in range(1, sender.total_packets + 1):
+        pkt = sender.build_packet(seq)
+        wire_bytes += len(pkt)
+        data_payload(parse_datagram(pkt))
+    wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+    _report(wire, sender.total_packets, len(data), wall, cpu, wire_bytes)
+
+
+def bench_loopback(data: bytes, wire: str):
+    """Push every chunk through a real loopback socket pair and parse it on the far side."""
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    rx.bind(("127.0.0.1", 0))
+    rx.settimeout(0.5)
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    sender = FileSender("0000", "bench.bin", data, rx.getsockname(), tx, None,
+                        session_id="0badcafe", wire=wire)
+    received = [0]
+
+    def drain():
+        while True:
+            try:
+                pkt, _ = rx.recvfrom(65536)
+            except socket.timeout:
+                return
+            data_payload(parse_datagram(pkt))
+            received[0] += 1
+
+    t = threading.Thread(target=drain, daemon=True)
+    t0, c0 = time.perf_counter(), time.process_time()
+    t.start()
+    wire_bytes = 0
+    for seq in range(1, sender.total_packets + 1):
+        pkt = sender.build_packet(seq)
+        wire_bytes += len(pkt)
+        tx.sendto(pkt, sender.addr)
+        # Keep the socket buffer from overflowing on slow machines
+        if seq % 256 == 0:
+            time.sleep(0.001)
+    t.join()
+    # The drain thread idles for one recv timeout before giving up
+    wall, cpu = time.perf_counter() - t0 - 0.5, time.process_time() - c0
+    tx.close()
+    rx.close()
+    _report(wire, max(received[0], 1), len(data), wall, cpu, wire_bytes)
+    if received[0] < sender.total_packets:
+        print(f"           ({sender.total_packets - received[0]} datagrams dropped by the kernel)")
+
+
+def cmd_framing(args):
+    data = os.urandom(args.mb * 1024 * 1024)
+    print(f"Framing: {args.mb} MB in {CHUNK_SIZE}-byte chunks")
+    print(" encode + decode only:")
+    for wire in (WIRE_JSON, WIRE_BINARY):
+        bench_codec(data, wire)
+    print(" loopback UDP:")
+    for wire in (WIRE_JSON, WIRE_BINARY):
+        bench_loopback(data, wire)
+
+
+def cmd_sender_memory(args):
+    """Many concurrent download senders of one large file: read() vs mmap."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "big.bin"
+        with path.open("wb") as f:
+            for _ in range(args.mb):
+                f.write(os.urandom(1024 * 1024))
+
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(("127.0.0.1", 0))
+        tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        print(f"Sender memory: {args.clients} concurrent downloads of a {args.mb} MB file")
+        for mode in ("mmap", "read"):
+            before = process_memory().get("RssAnon", 0)
+            senders = []
+            for i in range(args.clients):
+                if mode == "mmap":
+                    data = map_file(path)
+                else:
+                    with path.open("rb") as f:
+                        data = f.read()
+                senders.append(FileSender("0000", "big.bin", data, sink.getsockname(), tx, None,
+                                          session_id=f"{i:08x}", wire=WIRE_BINARY))
+            # Touch every chunk as a full transfer would
+            for sender in senders:
+                for seq in range(1, sender.total_packets + 1):
+                    sender.retransmit(seq)
+            after = process_memory().get("RssAnon", 0)
+            resident = sum(s.resident_bytes for s in senders)
+            print(
+                f"  {mode:<5} anon RSS +{(after - before) / (1024 * 1024):8.1f} MB  "
+                f"sessions report {resident / (1024 * 1024):8.1f} MB resident"
+            )
+            for sender in senders:
+                sender.close()
+            del senders
+        tx.close()
+        sink.close()
+
+
+def _ack_responder(sock: socket.socket, stop: threading.Event, result: dict, ack_every: int = ACK_EVERY,
+                   max_buf: Optional[int] = None, rtt: Optional[float] = None):
+    """
+    Receiver half of an in-process transfer: the server's upload DATA path,
+    delayed ACKs included. The receive window is `max_buf` packets, or
+    autotuned from `rtt` seconds when None.
+    """
+    receiver = None
+    result["acks"] = 0
+
+    def send_ack():
+        receiver.ack_sent()
+        sock.sendto(encode_ack(session_id, receiver.get_ack_seq(), receiver.rwnd,
+                               wire=WIRE_BINARY, sack=receiver.get_sack_blocks()), addr)
+        result["acks"] += 1
+
+    while not stop.is_set():
+        delay = receiver.ack_delay() if receiver is not None else None
+        sock.settimeout(0.1 if delay is None else max(delay, 0.001))
+        try:
+            pkt, addr = sock.recvfrom(65536)
+        except socket.timeout:
+            if receiver is not None and receiver.unacked:
+                send_ack()
+            continue
+        msg = parse_datagram(pkt)
+        if msg.get("type") != "DATA":
+            continue
+        if receiver is None:
+            receiver = FileReceiver(int(msg["total"]), max_buf=max_buf, ack_every=ack_every, rtt=rtt, sock=sock)
+            session_id = msg["session_id"]
+        receiver.add_chunk(int(msg["seq"]), data_payload(msg))
+        result["window"] = receiver.window_bytes
+        if receiver.ack_due(ack_requested(msg)):
+            send_ack()
+        if receiver.is_complete() and "data" not in result:
+            result["data"] = receiver.finalize_to_bytes()
+
+
+class LinkEmulator:
+    """
+    UDP relay that behaves like a bottleneck link shared by every flow
+    routed through it: DATA is serialized at `rate_bps` through one
+    drop-tail queue of `buffer_pkts` datagrams and both directions are
+    delayed by half of `rtt_ms`. Random loss is applied on the forward
+    path before the queue. Every sender gets its own upstream socket, as
+    behind a NAT, so the receiver sees one address per sender.
+    """
+
+    def __init__(self, rate_bps: float, rtt_ms: float, buffer_pkts: int, loss: float = 0.0):
+        self.rate = rate_bps / 8.0
+        self.one_way = rtt_ms / 2000.0
+        self.buffer_pkts = buffer_pkts
+        self.loss = loss
+        self.drops = 0
+        self.random_drops = 0
+
+        self._flows = {}     # relay socket -> receiver address
+        self._nat = {}       # (relay socket, sender address) -> upstream socket
+        self._upstream = {}  # upstream socket -> (relay socket, sender address)
+        self._link_free = 0.0
+        self._queued = []   # departure times of datagrams still in the bottleneck queue
+        self._pending = []  # heap of (release time, order, relay socket, datagram, address)
+        self._order = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def route(self, dest) -> tuple:
+        """Open a flow towards `dest`; senders address the returned relay instead."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind(("127.0.0.1", 0))
+        with self._lock:
+            self._flows[sock] = dest
+        return sock.getsockname()
+
+    def _open_upstream(self, relay: socket.socket, sender) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind(("127.0.0.1", 0))
+        with self._lock:
+            self._nat[(relay, sender)] = sock
+            self._upstream[sock] = (relay, sender)
+        return sock
+
+    def _schedule(self, when: float, sock: socket.socket, pkt: bytes, addr):
+        self._order += 1
+        heapq.heappush(self._pending, (when, self._order, sock, pkt, addr))
+
+    def _forward(self, sock: socket.socket, pkt: bytes, dest, now: float):
+        if self.loss and random.random() < self.loss:
+            self.random_drops += 1
+            return
+        while self._queued and self._queued[0] <= now:
+            self._queued.pop(0)
+        if len(self._queued) >= self.buffer_pkts:
+            self.drops += 1
+            return
+        self._link_free = max(now, self._link_free) + len(pkt) / self.rate
+        self._queued.append(self._link_free)
+        self._schedule(self._link_free + self.one_way, sock, pkt, dest)
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            while self._pending and self._pending[0][0] <= now:
+                _, _, sock, pkt, addr = heapq.heappop(self._pending)
+                sock.sendto(pkt, addr)
+            wait = 0.05 if not self._pending else max(0.0, self._pending[0][0] - now)
+            with self._lock:
+                socks = list(self._flows) + list(self._upstream)
+            if not socks:
+                time.sleep(wait)
+                continue
+            for sock in select.select(socks, [], [], wait)[0]:
+                pkt, addr = sock.recvfrom(65536)
+                now = time.perf_counter()
+                if sock in self._upstream:
+                    relay, sender = self._upstream[sock]
+                    self._schedule(now + self.one_way, relay, pkt, sender)
+                else:
+                    upstream = self._nat.get((sock, addr)) or self._open_upstream(sock, addr)
+                    self._forward(upstream, pkt, self._flows[sock], now)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        for sock in list(self._flows) + list(self._upstream):
+            sock.close()
+
+
+def run_transfer(data: bytes, algo: str = "reno", loss: float = 0.0, sack: bool = False,
+                 metrics_dir: Optional[Path] = None, max_retries: int = 50,
+                 link: Optional[LinkEmulator] = None, quiet: bool = True,
+                 ack_every: int = ACK_EVERY, max_buf: Optional[int] = None) -> dict:
+    """
+    Send `data` over loopback with the same loop as SyncroXFileClient.upload_bytes
+    and return the completion time, retransmission and ACK counts and the
+    receiver's final window. With `link` the flow crosses that emulated
+    bottleneck. `max_buf` fixes the receive window in packets instead of
+    autotuning it. Concurrent callers must pass quiet=False and silence
+    stdout themselves.
+    """
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    rx.bind(("127.0.0.1", 0))
+    rx.settimeout(0.1)
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    stop = threading.Event()
+    result = {}
+    rtt = 2 * link.one_way if link else None
+    responder = threading.Thread(target=_ack_responder, args=(rx, stop, result, ack_every, max_buf, rtt),
+                                 daemon=True)
+    responder.start()
+    dest = link.route(rx.getsockname()) if link else rx.getsockname()
+    drops_before = link.drops if link else 0
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+        metrics = FileTransferMetrics("0000", "bench.bin", metrics_dir or Path(tmp), algo=algo)
+        sender = FileSender("0000", "bench.bin", data, dest, tx, metrics,
+                            loss_prob=loss, session_id="0badcafe", wire=WIRE_BINARY, sack=sack)
+        rexmits = [0]
+        original = sender.retransmit
+
+        def counting_retransmit(seq):
+            rexmits[0] += 1
+            original(seq)
+        sender.retransmit = counting_retransmit
+
+        start = time.perf_counter()
+        next_seq, ok = 1, True
+        while metrics.last_ack < sender.total_packets:
+            next_seq = sender.send_window(next_seq, metrics.last_ack + 1)
+            try:
+                tx.settimeout(sender.poll_timeout(metrics.last_ack + 1))
+                ack = parse_datagram(tx.recvfrom(65536)[0])
+                if "rwnd" in ack:
+                    sender.update_rwnd(int(ack["rwnd"]))
+                sender.handle_ack(int(ack["ack"]), ack.get("sack"))
+                next_seq = max(next_seq, metrics.last_ack + 1)
+            except socket.timeout:
+                pass
+
+            base = metrics.last_ack + 1
+            if base in sender.sent_times:
+                new_next, ok = sender.handle_timeout(base, max_retries)
+                if not ok:
+                    break
+                if new_next != -1:
+                    next_seq = new_next
+        elapsed = time.perf_counter() - start
+        timeouts = sum(sender.retries.values())
+        metrics.close()
+
+    stop.set()
+    responder.join()
+    tx.close()
+    rx.close()
+    return {
+        "seconds": elapsed,
+        "ok": ok and result.get("data") == data,
+        "retransmits": rexmits[0],
+        "timeouts": timeouts,
+        "queue_drops": link.drops - drops_before if link else 0,
+        "acks": result["acks"],
+        "packets": sender.total_packets,
+        "window": result.get("window", 0),
+    }
+
+
+def cmd_sack(args):
+    data = os.urandom(args.mb * 1024 * 1024)
+    print(f"SACK: {args.mb} MB over loopback, loss={args.loss:.0%}, best of {args.runs}")
+    for algo in ("tahoe", "reno"):
+        for sack in (False, True):
+            runs = [run_transfer(data, algo=algo, loss=args.loss, sack=sack) for _ in range(args.runs)]
+            best = min(runs, key=lambda r: r["seconds"])
+            label = f"{algo}{'+sack' if sack else ''}"
+            print(
+                f"  {label:<11} {best['seconds']:7.2f} s  "
+                f"retransmits={best['retransmits']:<5} RTOs={best['timeouts']:<4} "
+                f"{'ok' if all(r['ok'] for r in runs) else 'CORRUPT'}"
+            )
+
+
+def cmd_pacing(args):
+    data = os.urandom(args.mb * 1024 * 1024)
+    bdp = args.mbit * 1e6 / 8.0 * args.rtt / 1000.0 / CHUNK_SIZE
+    print(
+        f"Pacing: {args.mb} MB through {args.mbit} Mbit/s, {args.rtt} ms RTT, "
+        f"{args.buffer}-packet drop-tail buffer (BDP ≈ {bdp:.0f} packets)"
+    )
+    for loss in (0.0, args.loss):
+        print(f" random loss {loss:.0%}:")
+        for algo in ("reno", "cubic", "bbr"):
+            link = LinkEmulator(args.mbit * 1e6, args.rtt, args.buffer, loss=loss)
+            r = run_transfer(data, algo=algo, sack=True, link=link)
+            link.close()
+            goodput = len(data) * 8 / r["seconds"] / 1e6
+            print(
+                f"  {algo:<6} {r['seconds']:7.2f} s  {goodput:6.2f} Mbit/s  "
+                f"queue drops={r['queue_drops']:<5} retransmits={r['retransmits']:<5} "
+                f"RTOs={r['timeouts']:<4} {'ok' if r['ok'] else 'CORRUPT'}"
+            )
+
+
+def cmd_yield(args):
+    """A foreground Reno upload joins a bulk sync already running on the same bottleneck."""
+    fg_data = os.urandom(args.fg_mb * 1024 * 1024)
+    bg_data = os.urandom(args.bg_mb * 1024 * 1024)
+    print(
+        f"Yield: {args.fg_mb} MB Reno upload joins a {args.bg_mb} MB bulk sync after "
+        f"{args.delay:.1f} s on {args.mbit} Mbit/s, {args.rtt} ms RTT, {args.buffer}-packet buffer"
+    )
+    for bg_algo in (None, "reno", "ledbat"):
+        link = LinkEmulator(args.mbit * 1e6, args.rtt, args.buffer)
+        results = {}
+
+        def transfer(key, data, algo):
+            results[key] = run_transfer(data, algo=algo, sack=True, link=link, quiet=False)
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            threads = []
+            if bg_algo:
+                threads.append(threading.Thread(target=transfer, args=("bg", bg_data, bg_algo)))
+                threads[-1].start()
+                time.sleep(args.delay)
+            threads.append(threading.Thread(target=transfer, args=("fg", fg_data, "reno")))
+            threads[-1].start()
+            for t in threads:
+                t.join()
+        link.close()
+
+        fg = results["fg"]
+        line = (
+            f"  {'alone' if bg_algo is None else 'vs ' + bg_algo:<10} foreground {fg['seconds']:6.2f} s "
+            f"({len(fg_data) * 8 / fg['seconds'] / 1e6:5.2f} Mbit/s)"
+        )
+        if bg_algo:
+            bg = results["bg"]
+            line += f"  background {bg['seconds']:6.2f} s"
+        ok = all(r["ok"] for r in results.values())
+        print(line + ("" if ok else "  CORRUPT"))
+
+
+def cmd_timers(args):
+    """Cost of one timer wakeup: sweeping every session vs popping due heap entries."""
+    now = time.monotonic()
+    fired = [0]
+
+    def on_due():
+        fired[0] += 1
+
+    # Most sessions are idle or mid-RTT; only a handful have a deadline due
+    deadlines = {i: now + 30.0 for i in range(args.sessions)}
+    for i in range(args.due):
+        deadlines[i] = now - 0.001
+
+    print(f"Timers: {args.sessions} sessions, {args.due} due per wakeup, {args.rounds} wakeups")
+
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for sid, deadline in deadlines.items():
+            if deadline <= now:
+                on_due()
+    sweep = (time.perf_counter() - t0) / args.rounds
+
+    scheduler = TimerScheduler()
+    for sid, deadline in deadlines.items():
+        if deadline > now:
+            scheduler.call_at(deadline, on_due)
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for i in range(args.due):
+            scheduler.call_at(now - 0.001, on_due)
+        scheduler.run_due(now)
+    heap = (time.perf_counter() - t0) / args.rounds
+
+    print(f"  sweep   {sweep * 1e6:10.1f} us/wakeup")
+    print(f"  heap    {heap * 1e6:10.1f} us/wakeup (including re-arming {args.due} timers)")
+
+
+class _AnyRoom:
+    """The room service isn't part of what `workers` measures; accept every room."""
+
+    def room_exists(self, room: str) -> bool:
+        return True
+
+
+def _upload_client(port: int, room: str, index: int, mb: int, barrier, results):
+    from backend.file_transfer import client as file_client
+    file_client.SYNCROX_LOSS_PROB = 0.0
+    sys.stdout = open(os.devnull, "w")
+    data = os.urandom(mb * 1024 * 1024)
+    c = file_client.SyncroXFileClient("127.0.0.1", port, algo="reno")
+    barrier.wait()
+    resp = c.upload_bytes(room, f"bench_{index}.bin", data)
+    results.put((resp, time.perf_counter()))
+    c.close()
+
+
+def cmd_workers(args):
+    """Aggregate upload throughput of concurrent clients against 1..N UDP workers."""
+    from backend.file_transfer import server
+
+    server.room_client = _AnyRoom()
+    server.SYNCROX_LOSS_PROB = 0.0
+    room = "0000"
+    ctx = multiprocessing.get_context("fork")
+    counts = [n for n in (1, 2, 4, 8, 16) if n <= args.max_workers]
+    print(
+        f"Workers: {args.clients} clients x {args.mb} MB uploads over loopback "
+        f"({os.cpu_count()} CPUs)"
+    )
+    for n in counts:
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+        probe.close()
+
+        # Server threads keep printing per packet; silence the whole round
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            server.start_servers({}, workers=n, host="127.0.0.1", tcp_port=port)
+            time.sleep(0.3)
+
+            barrier = ctx.Barrier(args.clients + 1)
+            results = ctx.Queue()
+            clients = [ctx.Process(target=_upload_client, args=(port, room, i, args.mb, barrier, results))
+                       for i in range(args.clients)]
+            for proc in clients:
+                proc.start()
+            barrier.wait()
+            start = time.perf_counter()
+            done = [results.get() for _ in clients]
+            wall = max(end for _, end in done) - start
+            for proc in clients:
+                proc.join()
+            server.stop_udp_workers()
+
+        ok = all(resp.startswith("OK") for resp, _ in done)
+        total_mb = args.clients * args.mb
+        print(
+            f"  {n:>2} worker{'s' if n > 1 else ' '} {total_mb / wall:8.1f} MB/s aggregate  "
+            f"{wall:6.2f} s  {'ok' if ok else 'FAILED'}"
+        )
+
+    shutil.rmtree(server.ROOT_UPLOAD_DIR / room, ignore_errors=True)
+    _remove_room_metrics(server.METRICS_DIR, room)
+
+
+def bench_offload(data: bytes, window: int, gso: bool, gro: bool, metrics_dir: Path) -> dict:
+    """Send `data` through FileSender.send_window over loopback and count syscalls on both ends."""
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    rx.bind(("127.0.0.1", 0))
+    rx.settimeout(0.5)
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    reader = DatagramReader(rx, gro=gro)
+
+    metrics = FileTransferMetrics("0000", "bench.bin", metrics_dir, algo="reno", direction="upload")
+    metrics.cwnd = float(window)
+    sender = FileSender("0000", "bench.bin", data, rx.getsockname(), tx, metrics,
+                        session_id="0badcafe", wire=WIRE_BINARY, gso=gso)
+    received = [0]
+
+    def drain():
+        while True:
+            try:
+                datagrams = reader.recv()
+            except socket.timeout:
+                return
+            for pkt, _ in datagrams:
+                data_payload(parse_datagram(pkt))
+                received[0] += 1
+
+    t = threading.Thread(target=drain, daemon=True)
+    t0, c0 = time.perf_counter(), time.process_time()
+    t.start()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        next_seq = 1
+        while next_seq <= sender.total_packets:
+            next_seq = sender.send_window(next_seq, next_seq, window)
+            # Keep the socket buffer from overflowing on slow machines
+            if next_seq % 256 < window:
+                time.sleep(0.001)
+    t.join()
+    # The drain thread idles for one recv timeout before giving up
+    wall, cpu = time.perf_counter() - t0 - 0.5, time.process_time() - c0
+    tx.close()
+    rx.close()
+    metrics.close()
+    return {
+        "sends": sender.send_calls,
+        "recvs": reader.calls - 1,
+        "received": received[0],
+        "total": sender.total_packets,
+        "wall": wall,
+        "cpu": cpu,
+        "gso": sender._gso,
+        "gro": reader.gro,
+    }
+
+
+def cmd_gso(args):
+    """Syscalls per MB with one sendmsg per packet vs UDP_SEGMENT batches and UDP_GRO reads."""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    print(
+        f"GSO: {args.mb} MB over loopback, window {args.window} packets "
+        f"(kernel UDP_SEGMENT: {'yes' if gso_supported(probe) else 'no'}, "
+        f"UDP_GRO: {'yes' if enable_gro(probe) else 'no'})"
+    )
+    probe.close()
+
+    data = os.urandom(args.mb * 1024 * 1024)
+    metrics_dir = Path(tempfile.mkdtemp(prefix="syncrox_gso_"))
+    try:
+        for label, gso, gro in (("per-pkt", False, False), ("gso", True, False), ("gso+gro", True, True)):
+            r = bench_offload(data, args.window, gso, gro, metrics_dir)
+            note = "" if (r["gso"] or not gso) and (r["gro"] or not gro) else "  (fell back: no kernel support)"
+            print(
+                f"  {label:<8} {r['sends'] / args.mb:>8.1f} send/MB  {r['recvs'] / args.mb:>8.1f} recv/MB  "
+                f"{args.mb / r['wall']:>7.1f} MB/s  {r['cpu'] * 1000.0 / args.mb:>7.2f} ms CPU/MB  "
+                f"{r['received']}/{r['total']} delivered{note}"
+            )
+    finally:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def _serve_forever(port: int):
+    from backend.file_transfer import server
+    sys.stdout = open(os.devnull, "w")
+    server.start_servers({}, host="127.0.0.1", tcp_port=port)
+    while True:
+        time.sleep(1)
+
+
+def cmd_parallel(args):
+    """Single-session vs multi-stream download of one file across an emulated high-latency path."""
+    from backend.file_transfer import server
+    from backend.file_transfer import client as file_client
+
+    server.room_client = _AnyRoom()
+    server.SYNCROX_LOSS_PROB = 0.0
+    file_client.SYNCROX_LOSS_PROB = 0.0
+    room, name = "0000", "parallel_bench.bin"
+    data = os.urandom(args.mb * 1024 * 1024)
+    room_dir = server.get_room_dir(room)
+    (room_dir / name).write_bytes(data)
+
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    proc = multiprocessing.get_context("fork").Process(target=_serve_forever, args=(port,), daemon=True)
+    proc.start()
+    time.sleep(0.5)
+
+    link = LinkEmulator(rate_bps=1e9, rtt_ms=args.rtt, buffer_pkts=1000, loss=args.loss)
+    relay_port = link.route(("127.0.0.1", port + 1))[1]
+    print(
+        f"Parallel: {args.mb} MB download, {args.rtt:.0f} ms RTT, loss={args.loss:.0%} "
+        f"({os.cpu_count()} CPUs)"
+    )
+    tmp = Path(tempfile.mkdtemp(prefix="syncrox_parallel_"))
+    baseline = None
+    try:
+        for streams in [n for n in (1, 2, 4, 8) if n <= args.max_streams] + [None]:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                c = file_client.SyncroXFileClient("127.0.0.1", port)
+                # Data sessions cross the emulated path; TCP goes direct
+                c.udp_port = relay_port
+                dest = tmp / "out.bin"
+                stats = c.download_parallel(room, name, dest, max_streams=args.max_streams, streams=streams)
+                c.close()
+            ok = stats is not None and dest.read_bytes() == data
+            if not ok:
+                print(f"  {streams or 'adaptive':>8}  FAILED")
+                continue
+            baseline = baseline or stats["seconds"]
+            label = f"{streams} stream{'s' if streams > 1 else ' '}" if streams else "adaptive"
+            extra = f"  (up to {stats['peak_streams']} streams)" if streams is None else ""
+            print(
+                f"  {label:<10} {stats['seconds']:6.2f} s  {args.mb / stats['seconds']:6.2f} MB/s  "
+                f"x{baseline / stats['seconds']:.2f}{extra}"
+            )
+    finally:
+        link.close()
+        proc.terminate()
+        proc.join()
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.rmtree(room_dir, ignore_errors=True)
+        _remove_room_metrics(server.METRICS_DIR, room)
+
+
+def edit_bytes(data: bytes, fraction: float, regions: int, rng: random.Random) -> bytes:
+    """Rewrite `fraction` of `data` in `regions` places; every third edit inserts instead of overwriting."""
+    new = bytearray(data)
+    each = max(1, int(len(data) * fraction / regions))
+    for k in range(regions):
+        offset = rng.randrange(max(1, len(new) - each))
+        if k % 3 == 0:
+            new[offset:offset] = os.urandom(each)
+        else:
+            new[offset:offset + each] = os.urandom(each)
+    return bytes(new)
+
+
+def cmd_delta(args):
+    """Bytes on the wire for a delta upload of an edited file vs sending it whole."""
+    from backend.file_transfer.delta import block_size_for, signature, parse_signature, compute_delta, apply_delta
+
+    base = os.urandom(args.mb * 1024 * 1024)
+    new = edit_bytes(base, args.edit, args.regions, random.Random(1))
+    block = block_size_for(len(base))
+    print(f"Delta: {args.mb} MB file, {args.edit:.1%} edited in {args.regions} regions, {block}-byte blocks")
+
+    start = time.perf_counter()
+    sig = signature(base, block)
+    t_sig = time.perf_counter() - start
+    start = time.perf_counter()
+    delta = compute_delta(parse_signature(sig), block, len(base), new)
+    t_delta = time.perf_counter() - start
+    out = tempfile.TemporaryFile()
+    start = time.perf_counter()
+    apply_delta(base, delta, block, out)
+    t_apply = time.perf_counter() - start
+    out.seek(0)
+    ok = out.read() == new
+    out.close()
+
+    wire = len(sig) + len(delta)
+    print(f"  whole file     {len(new):>12,d} B")
+    print(f"  signature      {len(sig):>12,d} B  (server, {t_sig:.2f} s)")
+    print(f"  delta          {len(delta):>12,d} B  (client, {t_delta:.2f} s)")
+    print(f"  delta + sig    {wire:>12,d} B  x{len(new) / wire:.0f} fewer bytes")
+    print(f"  rebuild        {t_apply:.2f} s  {'identical' if ok else 'MISMATCH'}")
+
+
+def compress_corpora(size: int) -> dict:
+    """Source code (this repo's), a metrics CSV, a server log and random bytes, `size` bytes each."""
+    rng = random.Random(7)
+    source = b"".join(p.read_bytes() for p in sorted(Path(PROJECT_ROOT).rglob("*.py"))
+                      if ".venv" not in p.parts and "venv" not in p.parts)
+    rows, lines = [], []
+    ts, cwnd = 1.7e9, 1.0
+    for seq in range(size // 40):
+        ts += rng.random() / 50
+        cwnd = 1.0 if rng.random() < 0.01 else cwnd + 1.0 / cwnd
+        rows.append(f"{ts:.6f},{rng.randrange(1000, 9999)},report_{seq % 40}.pdf,upload,{seq},4096,"
+                    f"{rng.uniform(5, 60):.3f},{rng.uniform(10, 40):.3f},200.0,{cwnd:.2f},16.0,ACK,reno\n")
+        lines.append(f"[UDP FILE] DATA seq={seq} from ('10.0.{rng.randrange(256)}.{rng.randrange(256)}', "
+                     f"{rng.randrange(40000, 60000)}) session={rng.getrandbits(32):08x} rwnd={rng.randrange(33)}\n")
+        if len(rows) * 90 > size and len(lines) * 80 > size:
+            break
+
+    def fill(data: bytes) -> bytes:
+        return (data * (size // max(1, len(data)) + 1))[:size]
+
+    return {
+        "source": fill(source),
+        "csv": fill("".join(rows).encode()),
+        "log": fill("".join(lines).encode()),
+        "random": os.urandom(size),
+    }
+
+
+def cmd_compress(args):
+    """Upload time and wire bytes per codec for typical room files across an emulated link."""
+    from backend.file_transfer import server
+    from backend.file_transfer import client as file_client
+
+    server.room_client = _AnyRoom()
+    server.SYNCROX_LOSS_PROB = 0.0
+    file_client.SYNCROX_LOSS_PROB = 0.0
+    room = "0000"
+
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    proc = multiprocessing.get_context("fork").Process(target=_serve_forever, args=(port,), daemon=True)
+    proc.start()
+    time.sleep(0.5)
+
+    link = LinkEmulator(rate_bps=args.mbit * 1e6, rtt_ms=args.rtt, buffer_pkts=200)
+    relay_port = link.route(("127.0.0.1", port + 1))[1]
+    print(f"Compression: {args.mb} MB uploads over {args.mbit:.0f} Mbit/s, {args.rtt:.0f} ms RTT "
+          f"({os.cpu_count()} CPUs)")
+    summary = server.METRICS_DIR / f"room_{room}_transfer_summary.csv"
+    run = 0
+    try:
+        for name, data in compress_corpora(args.mb * 1024 * 1024).items():
+            baseline = None
+            for spec in (None, "zlib:1", "zlib:6", "lzma:1"):
+                run += 1
+                # A differently sized prefix shifts every dedup block, so no
+                # run is answered from what an earlier one stored
+                payload = os.urandom(run) + data
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    c = file_client.SyncroXFileClient("127.0.0.1", port, compress=spec)
+                    c.udp_port = relay_port
+                    start = time.perf_counter()
+                    result = c.upload_bytes(room, f"{name}.bin", payload)
+                    seconds = time.perf_counter() - start
+                    c.close()
+                if result != "OK SAVED":
+                    print(f"  {name:<7} {spec or 'none':<7} FAILED ({result})")
+                    continue
+                # The sender's row: logical vs wire bytes
+                last = summary.read_text().splitlines()[-1].split(",")
+                logical, wire = int(last[6]), int(last[7])
+                baseline = baseline or seconds
+                print(f"  {name:<7} {spec or 'none':<7} {seconds:6.2f} s  {args.mb / seconds:6.2f} MB/s  "
+                      f"wire {wire / 1048576:6.2f} MB  ratio x{logical / wire:.2f}  "
+                      f"speedup x{baseline / seconds:.2f}")
+    finally:
+        link.close()
+        proc.terminate()
+        proc.join()
+        shutil.rmtree(server.get_room_dir(room), ignore_errors=True)
+        _remove_room_metrics(server.METRICS_DIR, room)
+
+
+def cmd_fec(args):
+    """Upload completion time with and without parity packets across an emulated lossy link."""
+    from backend.file_transfer import server
+    from backend.file_transfer import client as file_client
+
+    server.room_client = _AnyRoom()
+    server.SYNCROX_LOSS_PROB = 0.0
+    file_client.SYNCROX_LOSS_PROB = 0.0
+    room = "0000"
+
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    proc = multiprocessing.get_context("fork").Process(target=_serve_forever, args=(port,), daemon=True)
+    proc.start()
+    time.sleep(0.5)
+
+    print(f"FEC: {args.mb} MB uploads, {args.mbit:.0f} Mbit/s, {args.rtt:.0f} ms RTT, "
+          f"median of {args.runs} runs")
+    run = 0
+    try:
+        for loss in args.loss:
+            link = LinkEmulator(rate_bps=args.mbit * 1e6, rtt_ms=args.rtt, buffer_pkts=200, loss=loss)
+            relay_port = link.route(("127.0.0.1", port + 1))[1]
+            medians = {}
+            for fec in (False, True):
+                times = []
+                for _ in range(args.runs):
+                    run += 1
+                    # Random bytes: nothing to deduplicate or compress
+                    data = os.urandom(args.mb * 1024 * 1024)
+                    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                        c = file_client.SyncroXFileClient("127.0.0.1", port, compress=None, fec=fec)
+                        c.udp_port = relay_port
+                        start = time.perf_counter()
+                        result = c.upload_bytes(room, f"fec_{run}.bin", data)
+                        times.append(time.perf_counter() - start)
+                        c.close()
+                    if result != "OK SAVED":
+                        times[-1] = float("inf")
+                times.sort()
+                medians[fec] = times[len(times) // 2]
+            link.close()
+            print(f"  loss {loss:5.1%}  ARQ only {medians[False]:6.2f} s  with FEC {medians[True]:6.2f} s  "
+                  f"x{medians[False] / medians[True]:.2f}")
+    finally:
+        proc.terminate()
+        proc.join()
+        shutil.rmtree(server.get_room_dir(room), ignore_errors=True)
+        _remove_room_metrics(server.METRICS_DIR, room)
+
+
+def cmd_acks(args):
+    """ACK traffic and completion time with one ACK per packet vs delayed, coalesced ACKs."""
+    data = os.urandom(args.mb * 1024 * 1024)
+    print(f"Delayed ACKs: {args.mb} MB over {args.mbit:.0f} Mbit/s, {args.rtt:.0f} ms RTT, "
+          f"best of {args.runs} (ACK every N packets)")
+    for algo in ("reno", "cubic", "bbr"):
+        for every in args.every:
+            runs = []
+            for _ in range(args.runs):
+                link = LinkEmulator(rate_bps=args.mbit * 1e6, rtt_ms=args.rtt, buffer_pkts=100)
+                runs.append(run_transfer(data, algo=algo, sack=True, link=link, ack_every=every))
+                link.close()
+            best = min(runs, key=lambda r: r["seconds"])
+            print(
+                f"  {algo:<6} N={every}  {best['seconds']:6.2f} s  {best['acks']:6d} ACKs  "
+                f"{best['acks'] / best['packets']:.2f} ACK/pkt  "
+                f"{best['retransmits']:4d} rexmit  {'OK' if best['ok'] else 'CORRUPT'}"
+            )
+    print(" loopback, receiver CPU:")
+    for every in args.every:
+        result = {}
+        stop = threading.Event()
+        rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        rx.bind(("127.0.0.1", 0))
+        # Time only the responder: the DATA path plus the ACKs it sends
+        thread_cpu = {}
+
+        def respond():
+            c0 = time.thread_time()
+            _ack_responder(rx, stop, result, every)
+            thread_cpu["s"] = time.thread_time() - c0
+        t = threading.Thread(target=respond, daemon=True)
+        t.start()
+        tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender = FileSender("0000", "bench.bin", data, rx.getsockname(), tx, None,
+                            session_id="0badcafe", wire=WIRE_BINARY)
+        for seq in range(1, sender.total_packets + 1):
+            tx.sendto(sender.build_packet(seq), sender.addr)
+            # Keep the socket buffer from overflowing on slow machines
+            if seq % 16 == 0:
+                time.sleep(0.001)
+        time.sleep(0.3)
+        stop.set()
+        t.join()
+        tx.close()
+        rx.close()
+        print(f"  N={every}  {result['acks']:6d} ACKs  {thread_cpu['s'] * 1000.0 / args.mb:7.2f} ms CPU/MB"
+              f"{'' if result.get('data') == data else '  (datagrams dropped by the kernel)'}")
+
+
+def cmd_rwnd(args):
+    """Upload completion time with a fixed receive window vs an autotuned one on a high-BDP path."""
+    data = os.urandom(args.mb * 1024 * 1024)
+    bdp = args.mbit * 1e6 / 8 * args.rtt / 1000.0
+    print(f"Receive window: {args.mb} MB over {args.mbit:.0f} Mbit/s, {args.rtt:.0f} ms RTT "
+          f"(BDP {bdp / 1024:.0f} KB), best of {args.runs}")
+    for label, max_buf in ((f"fixed {args.fixed} pkt", args.fixed), ("autotuned", None)):
+        runs = []
+        for _ in range(args.runs):
+            link = LinkEmulator(rate_bps=args.mbit * 1e6, rtt_ms=args.rtt, buffer_pkts=args.buffer)
+            runs.append(run_transfer(data, algo=args.algo, sack=True, link=link, max_buf=max_buf))
+            link.close()
+        best = min(runs, key=lambda r: r["seconds"])
+        print(
+            f"  {label:<13} {best['seconds']:6.2f} s  {len(data) * 8 / best['seconds'] / 1e6:6.1f} Mbit/s  "
+            f"window {best['window'] / 1024:6.0f} KB  {best['retransmits']:4d} rexmit  "
+            f"{'OK' if best['ok'] else 'CORRUPT'}"
+        )
+
+
+class _SlowRoom:
+    """A room service that takes `delay` seconds to answer, like a loaded room_mgmt."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def room_exists(self, room: str) -> bool:
+        time.sleep(self.delay)
+        return True
+
+
+def _handshake_storm(port: int, room: str, name: str, interval: float, stop: threading.Event, latencies: list):
+    """Open a fresh download session every `interval` seconds, time its SYN-ACK, then close it."""
+    while not stop.is_set():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(2.0)
+        start = time.perf_counter()
+        sock.sendto(json.dumps({"type": "DOWNLOAD", "room": room, "filename": name}).encode("utf-8"),
+                    ("127.0.0.1", port + 1))
+        try:
+            msg = parse_datagram(sock.recvfrom(65536)[0])
+            latencies.append(time.perf_counter() - start)
+            fin = {"type": "FIN", "session_id": msg.get("session_id")}
+            sock.sendto(json.dumps(fin).encode("utf-8"), ("127.0.0.1", port + 1))
+        except (socket.timeout, ValueError):
+            pass
+        sock.close()
+        stop.wait(interval)
+
+
+def cmd_admission(args):
+    """Download time while new sessions are admitted against a slow room service, inline vs pooled."""
+    from backend.file_transfer import server
+    from backend.file_transfer import client as file_client
+
+    server.room_client = _SlowRoom(args.delay / 1000.0)
+    server.SYNCROX_LOSS_PROB = 0.0
+    file_client.SYNCROX_LOSS_PROB = 0.0
+    room, name = "0000", "admission_bench.bin"
+    data = os.urandom(args.mb * 1024 * 1024)
+    room_dir = server.get_room_dir(room)
+    (room_dir / name).write_bytes(data)
+    (room_dir / "small.bin").write_bytes(b"x" * 1024)
+    print(f"Admission: {args.mb} MB download over loopback, room lookups take {args.delay:.0f} ms, "
+          f"a new session every {args.interval:.0f} ms, best of {args.runs}")
+    pool_size = server.ADMISSION_WORKERS
+    try:
+        for workers in (0, pool_size):
+            server.ADMISSION_WORKERS = workers
+            probe = socket.socket()
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+            probe.close()
+            proc = multiprocessing.get_context("fork").Process(target=_serve_forever, args=(port,), daemon=True)
+            proc.start()
+            time.sleep(0.5)
+            times = {}
+            latencies = []
+            for storm in (False, True):
+                stop = threading.Event()
+                if storm:
+                    threading.Thread(target=_handshake_storm, daemon=True,
+                                     args=(port, room, "small.bin", args.interval / 1000.0, stop, latencies)).start()
+                    time.sleep(0.2)
+                best = None
+                for _ in range(args.runs):
+                    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                        c = file_client.SyncroXFileClient("127.0.0.1", port)
+                        start = time.perf_counter()
+                        got = c.download_bytes(room, name)
+                        elapsed = time.perf_counter() - start
+                        c.close()
+                    if got != data:
+                        elapsed = float("inf")
+                    best = elapsed if best is None else min(best, elapsed)
+                times[storm] = best
+                stop.set()
+                time.sleep(args.interval / 1000.0 + 0.1)
+            proc.terminate()
+            proc.join()
+            latencies.sort()
+            label = "inline" if workers == 0 else f"{workers} threads"
+            p50 = latencies[len(latencies) // 2] * 1000.0 if latencies else float("nan")
+            print(
+                f"  {label:<10} alone {times[False]:6.2f} s  with handshakes {times[True]:6.2f} s  "
+                f"x{times[True] / times[False]:.2f}  SYN-ACK p50 {p50:5.0f} ms ({len(latencies)} sessions)"
+            )
+    finally:
+        server.ADMISSION_WORKERS = pool_size
+        shutil.rmtree(room_dir, ignore_errors=True)
+        _remove_room_metrics(server.METRICS_DIR, room)
+
+
+def cmd_file_cache(args):
+    """Concurrent downloads of one file: a mapping per session vs the shared FileCache."""
+    import resource
+    from backend.file_transfer.filecache import FileCache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "lecture.bin"
+        with path.open("wb") as f:
+            for _ in range(args.mb):
+                f.write(os.urandom(1024 * 1024))
+
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(("127.0.0.1", 0))
+        tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        print(f"File cache: {args.clients} concurrent downloads of a {args.mb} MB file, best of {args.runs}")
+        for mode in ("per-session", "shared"):
+            best = None
+            for _ in range(args.runs):
+                cache = FileCache()
+                faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+                start = time.perf_counter()
+                senders = []
+                for i in range(args.clients):
+                    if mode == "shared":
+                        data, release = cache.acquire(path)
+                    else:
+                        data, release = map_file(path), None
+                    senders.append(FileSender("0000", "lecture.bin", data, sink.getsockname(), tx, None,
+                                              session_id=f"{i:08x}", wire=WIRE_BINARY, release=release))
+                # Touch every chunk as a full transfer would
+                for sender in senders:
+                    for seq in range(1, sender.total_packets + 1):
+                        sender.retransmit(seq)
+                for sender in senders:
+                    sender.close()
+                elapsed = time.perf_counter() - start
+                faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+                stats = cache.stats()
+                if best is None or elapsed < best[0]:
+                    best = (elapsed, faults, stats)
+            elapsed, faults, stats = best
+            mappings = stats["misses"] if mode == "shared" else args.clients
+            print(f"  {mode:<12} {elapsed:6.2f} s  {faults:8d} page faults  {mappings:3d} mappings")
+        tx.close()
+        sink.close()
+
+
+def _serve_with_egress(port: int, rate: float, room_weights: dict, small_file: int):
+    from backend.file_transfer import server
+    server.egress.rate = rate
+    server.egress.room_weights.update(room_weights)
+    server.egress.small_file = small_file
+    _serve_forever(port)
+
+
+def cmd_egress(args):
+    """Two bulk downloads and a late small one sharing an egress cap: plain DRR, small first, weighted."""
+    from backend.file_transfer import server
+    from backend.file_transfer import client as file_client
+    from backend.file_transfer.egress import SMALL_FILE_BYTES
+
+    server.room_client = _SlowRoom(0.0)
+    server.SYNCROX_LOSS_PROB = 0.0
+    file_client.SYNCROX_LOSS_PROB = 0.0
+    rate = args.mbit * 1e6 / 8
+    files = {("0000", "bulk.bin"): os.urandom(args.mb * 1024 * 1024),
+             ("1111", "bulk.bin"): os.urandom(args.mb * 1024 * 1024),
+             ("1111", "small.bin"): os.urandom(args.small_kb * 1024)}
+    for (room, name), data in files.items():
+        (server.get_room_dir(room) / name).write_bytes(data)
+    print(f"Egress: two {args.mb} MB downloads (rooms 0000, 1111) and a {args.small_kb} KB one "
+          f"0.5 s later, {args.mbit:.0f} Mbit/s cap")
+    scenarios = (("round robin", {}, 0), ("small first", {}, SMALL_FILE_BYTES),
+                 ("0000 x3", {"0000": 3.0}, SMALL_FILE_BYTES))
+    try:
+        for label, weights, small_file in scenarios:
+            probe = socket.socket()
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+            probe.close()
+            proc = multiprocessing.get_context("fork").Process(
+                target=_serve_with_egress, args=(port, rate, weights, small_file), daemon=True)
+            proc.start()
+            time.sleep(0.5)
+            results = {}
+
+            def fetch(room: str, name: str, delay: float):
+                time.sleep(delay)
+                c = file_client.SyncroXFileClient("127.0.0.1", port)
+                start = time.perf_counter()
+                got = c.download_bytes(room, name)
+                results[(room, name)] = (time.perf_counter() - start, got == files[(room, name)])
+                c.close()
+
+            # One redirect for all threads: nested ones would restore each other's stdout
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                threads = [threading.Thread(target=fetch, args=(room, name, 0.5 if name == "small.bin" else 0.0))
+                           for room, name in files]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                total = time.perf_counter() - start
+            proc.terminate()
+            proc.join()
+            nbytes = sum(len(data) for data in files.values())
+            (a, ok_a), (b, ok_b), (small, ok_s) = (results[key] for key in files)
+            print(
+                f"  {label:<12} 0000 {a:6.2f} s  1111 {b:6.2f} s  small {small * 1000:6.0f} ms  "
+                f"all {nbytes * 8 / total / 1e6:5.1f} Mbit/s  {'OK' if ok_a and ok_b and ok_s else 'CORRUPT'}"
+            )
+    finally:
+        for room, name in files:
+            (server.get_room_dir(room) / name).unlink()
+        for room in ("0000", "1111"):
+            _remove_room_metrics(server.METRICS_DIR, room)
+
+
+def _slow_sync(delay: float):
+    """sync_file on a disk that takes `delay` seconds per flush, like a busy spinning disk."""
+    from backend.file_transfer import writer
+
+    sync_file = writer.sync_file
+
+    def slow(path: Path):
+        sync_file(path)
+        time.sleep(delay)
+    return slow
+
+
+def _upload_storm(port: int, room: str, size: int, stop: threading.Event, done: list):
+    """Upload fresh `size`-byte files back to back until stopped."""
+    from backend.file_transfer import client as file_client
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        c = file_client.SyncroXFileClient("127.0.0.1", port)
+        while not stop.is_set():
+            if c.upload_bytes(room, f"storm_{len(done) % 4}.bin", os.urandom(size)) == "OK SAVED":
+                done.append(1)
+        c.close()
+
+
+def cmd_writes(args):
+    """Download time while other uploads complete on a slow disk, stored inline vs by the writer pool."""
+    from backend.file_transfer import server
+    from backend.file_transfer import client as file_client
+    from backend.file_transfer import writer
+
+    server.room_client = _SlowRoom(0.0)
+    server.SYNCROX_LOSS_PROB = 0.0
+    file_client.SYNCROX_LOSS_PROB = 0.0
+    room, name = "0000", "writes_bench.bin"
+    data = os.urandom(args.mb * 1024 * 1024)
+    room_dir = server.get_room_dir(room)
+    (room_dir / name).write_bytes(data)
+    print(f"Writes: {args.mb} MB download over loopback while {args.upload_mb} MB uploads complete, "
+          f"{args.disk_ms:.0f} ms per fdatasync, best of {args.runs}")
+    pool, sync_file = server.upload_writer, writer.sync_file
+    writer.sync_file = _slow_sync(args.disk_ms / 1000.0)
+    try:
+        for workers in (0, writer.WRITE_WORKERS):
+            server.upload_writer = writer.UploadWriter(workers)
+            probe = socket.socket()
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+            probe.close()
+            proc = multiprocessing.get_context("fork").Process(target=_serve_forever, args=(port,), daemon=True)
+            proc.start()
+            time.sleep(0.5)
+            times = {}
+            uploads = []
+            for storm in (False, True):
+                stop = threading.Event()
+                if storm:
+                    thread = threading.Thread(target=_upload_storm, daemon=True,
+                                              args=(port, room, args.upload_mb * 1024 * 1024, stop, uploads))
+                    thread.start()
+                    time.sleep(0.5)
+                best = None
+                for _ in range(args.runs):
+                    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                        c = file_client.SyncroXFileClient("127.0.0.1", port)
+                        start = time.perf_counter()
+                        got = c.download_bytes(room, name)
+                        elapsed = time.perf_counter() - start
+                        c.close()
+                    if got != data:
+                        elapsed = float("inf")
+                    best = elapsed if best is None else min(best, elapsed)
+                times[storm] = best
+                stop.set()
+                if storm:
+                    thread.join()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                c = file_client.SyncroXFileClient("127.0.0.1", port)
+                stats = (c.get_stats() or {}).get("writer", {})
+                c.close()
+            proc.terminate()
+            proc.join()
+            label = "inline" if workers == 0 else f"{workers} writers"
+            print(
+                f"  {label:<10} alone {times[False]:6.2f} s  with uploads {times[True]:6.2f} s  "
+                f"x{times[True] / times[False]:.2f}  {len(uploads)} uploads, "
+                f"write avg {stats.get('avg_ms', 0.0):5.1f} ms max {stats.get('max_ms', 0.0):5.1f} ms"
+            )
+    finally:
+        server.upload_writer, writer.sync_file = pool, sync_file
+        shutil.rmtree(room_dir, ignore_errors=True)
+        _remove_room_metrics(server.METRICS_DIR, room)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SyncroX file transfer benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("framing", help="JSON+base64 vs binary DATA framing")
+    p.add_argument("--mb", type=int, default=32, help="payload size in MB")
+    p.set_defaults(func=cmd_framing)
+
+    p = sub.add_parser("sender-memory", help="resident memory of concurrent download senders")
+    p.add_argument("--mb", type=int, default=64, help="file size in MB")
+    p.add_argument("--clients", type=int, default=16, help="concurrent senders")
+    p.set_defaults(func=cmd_sender_memory)
+
+    p = sub.add_parser("sack", help="completion time with and without selective ACKs")
+    p.add_argument("--mb", type=int, default=4, help="payload size in MB")
+    p.add_argument("--loss", type=float, default=0.1, help="simulated DATA loss probability")
+    p.add_argument("--runs", type=int, default=3, help="runs per configuration")
+    p.set_defaults(func=cmd_sack)
+
+    p = sub.add_parser("pacing", help="window vs paced senders on an emulated shallow-buffer link")
+    p.add_argument("--mb", type=int, default=2, help="payload size in MB")
+    p.add_argument("--mbit", type=float, default=20.0, help="bottleneck rate in Mbit/s")
+    p.add_argument("--rtt", type=float, default=20.0, help="round-trip propagation delay in ms")
+    p.add_argument("--buffer", type=int, default=8, help="bottleneck queue in packets")
+    p.add_argument("--loss", type=float, default=0.05, help="random loss for the second pass")
+    p.set_defaults(func=cmd_pacing)
+
+    p = sub.add_parser("yield", help="foreground Reno upload against a Reno or LEDBAT bulk sync")
+    p.add_argument("--fg-mb", type=int, default=2, help="foreground payload in MB")
+    p.add_argument("--bg-mb", type=int, default=6, help="background payload in MB")
+    p.add_argument("--delay", type=float, default=0.5, help="seconds before the foreground flow starts")
+    p.add_argument("--mbit", type=float, default=20.0, help="bottleneck rate in Mbit/s")
+    p.add_argument("--rtt", type=float, default=20.0, help="round-trip propagation delay in ms")
+    p.add_argument("--buffer", type=int, default=48, help="bottleneck queue in packets")
+    p.set_defaults(func=cmd_yield)
+
+    p = sub.add_parser("timers", help="per-wakeup cost of the session sweep vs the timer heap")
+    p.add_argument("--sessions", type=int, default=10000, help="live sessions with a pending deadline")
+    p.add_argument("--due", type=int, default=10, help="deadlines due per wakeup")
+    p.add_argument("--rounds", type=int, default=200, help="wakeups to average over")
+    p.set_defaults(func=cmd_timers)
+
+    p = sub.add_parser("workers", help="aggregate upload throughput vs SO_REUSEPORT worker count")
+    p.add_argument("--max-workers", type=int, default=min(os.cpu_count() or 1, 8) or 1,
+                   help="largest worker count to try")
+    p.add_argument("--clients", type=int, default=8, help="concurrent upload clients")
+    p.add_argument("--mb", type=int, default=4, help="upload size per client in MB")
+    p.set_defaults(func=cmd_workers)
+
+    p = sub.add_parser("gso", help="send/recv syscalls per MB with and without UDP GSO/GRO")
+    p.add_argument("--mb", type=int, default=64, help="payload size in MB")
+    p.add_argument("--window", type=int, default=64, help="packets per send_window call")
+    p.set_defaults(func=cmd_gso)
+
+    p = sub.add_parser("parallel", help="single vs multi-stream download over an emulated high-RTT path")
+    p.add_argument("--mb", type=int, default=48, help="file size in MB")
+    p.add_argument("--rtt", type=float, default=40.0, help="round-trip delay in ms")
+    p.add_argument("--loss", type=float, default=0.0, help="random loss on the client-to-server path")
+    p.add_argument("--max-streams", type=int, default=8, help="largest stream count to try")
+    p.set_defaults(func=cmd_parallel)
+
+    p = sub.add_parser("delta", help="rsync delta vs whole-file upload of an edited file")
+    p.add_argument("--mb", type=int, default=100, help="file size in MB")
+    p.add_argument("--edit", type=float, default=0.01, help="fraction of the file edited")
+    p.add_argument("--regions", type=int, default=10, help="number of edited regions")
+    p.set_defaults(func=cmd_delta)
+
+    p = sub.add_parser("compress", help="per-chunk compression codecs on an emulated link")
+    p.add_argument("--mb", type=int, default=4, help="size of each test file in MB")
+    p.add_argument("--mbit", type=float, default=10.0, help="bottleneck rate in Mbit/s")
+    p.add_argument("--rtt", type=float, default=20.0, help="round-trip delay in ms")
+    p.set_defaults(func=cmd_compress)
+
+    p = sub.add_parser("fec", help="completion time with and without FEC parity at several loss rates")
+    p.add_argument("--mb", type=int, default=4, help="upload size in MB")
+    p.add_argument("--mbit", type=float, default=20.0, help="bottleneck rate in Mbit/s")
+    p.add_argument("--rtt", type=float, default=40.0, help="round-trip delay in ms")
+    p.add_argument("--loss", type=float, nargs="+", default=[0.01, 0.05, 0.1], help="random loss rates")
+    p.add_argument("--runs", type=int, default=3, help="runs per configuration")
+    p.set_defaults(func=cmd_fec)
+
+    p = sub.add_parser("acks", help="ACK count and completion time with and without delayed ACKs")
+    p.add_argument("--mb", type=int, default=8, help="payload size in MB")
+    p.add_argument("--mbit", type=float, default=50.0, help="bottleneck rate in Mbit/s")
+    p.add_argument("--rtt", type=float, default=20.0, help="round-trip propagation delay in ms")
+    p.add_argument("--every", type=int, nargs="+", default=[1, 2, 4], help="ACK every N packets")
+    p.add_argument("--runs", type=int, default=3, help="runs per configuration")
+    p.set_defaults(func=cmd_acks)
+
+    p = sub.add_parser("rwnd", help="fixed vs autotuned receive window on an emulated high-BDP path")
+    p.add_argument("--mb", type=int, default=16, help="payload size in MB")
+    p.add_argument("--mbit", type=float, default=100.0, help="bottleneck rate in Mbit/s")
+    p.add_argument("--rtt", type=float, default=80.0, help="round-trip time in ms")
+    p.add_argument("--buffer", type=int, default=400, help="bottleneck queue in packets")
+    p.add_argument("--fixed", type=int, default=32, help="fixed receive window in packets")
+    p.add_argument("--algo", default="cubic", help="congestion control algorithm")
+    p.add_argument("--runs", type=int, default=2, help="runs per configuration")
+    p.set_defaults(func=cmd_rwnd)
+
+    p = sub.add_parser("admission", help="download time while sessions are admitted against a slow room service")
+    p.add_argument("--mb", type=int, default=32, help="download size in MB")
+    p.add_argument("--delay", type=float, default=50.0, help="room lookup time in ms")
+    p.add_argument("--interval", type=float, default=50.0, help="ms between new sessions")
+    p.add_argument("--runs", type=int, default=3, help="downloads per configuration")
+    p.set_defaults(func=cmd_admission)
+
+    p = sub.add_parser("file-cache", help="page faults and send time of concurrent downloads of one file")
+    p.add_argument("--mb", type=int, default=64, help="file size in MB")
+    p.add_argument("--clients", type=int, default=40, help="concurrent download sessions")
+    p.add_argument("--runs", type=int, default=3, help="runs per mode")
+    p.set_defaults(func=cmd_file_cache)
+
+    p = sub.add_parser("egress", help="downloads sharing a server egress cap: round robin, small first, weights")
+    p.add_argument("--mbit", type=float, default=40.0, help="egress cap in Mbit/s")
+    p.add_argument("--mb", type=int, default=8, help="size of each bulk download in MB")
+    p.add_argument("--small-kb", type=int, default=256, help="size of the late small download in KB")
+    p.set_defaults(func=cmd_egress)
+
+    p = sub.add_parser("writes", help="download time while uploads complete on a slow disk, inline vs write-behind")
+    p.add_argument("--mb", type=int, default=32, help="download size in MB")
+    p.add_argument("--upload-mb", type=int, default=1, help="size of each concurrent upload in MB")
+    p.add_argument("--disk-ms", type=float, default=30.0, help="added time per fdatasync in ms")
+    p.add_argument("--runs", type=int, default=3, help="downloads per configuration")
+    p.set_defaults(func=cmd_writes)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
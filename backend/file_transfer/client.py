@@ -1,14 +1,28 @@
+import os
 import socket
+import threading
+from collections import deque
 from typing import List, Tuple, Optional
 import time
 import json
-import base64
 from pathlib import Path
 
 try:
-    from .protocol import CHUNK_SIZE, FileReceiver, FileSender, FileTransferMetrics
+    from .protocol import (
+        CHUNK_SIZE, FileReceiver, FileSender, FileTransferMetrics,
+        WIRE_JSON, WIRE_BINARY, parse_datagram, encode_ack, data_payload, ack_requested,
+        probe_path_mtu, chunk_size_for_payload, content_id, manifest, MANIFEST_MAX_BLOCKS,
+        parse_compression, compression_spec, RWND_BYTES
+    )
+    from .delta import compute_delta, parse_signature
 except (ImportError, ValueError):
-    from protocol import CHUNK_SIZE, FileReceiver, FileSender, FileTransferMetrics
+    from protocol import (
+        CHUNK_SIZE, FileReceiver, FileSender, FileTransferMetrics,
+        WIRE_JSON, WIRE_BINARY, parse_datagram, encode_ack, data_payload, ack_requested,
+        probe_path_mtu, chunk_size_for_payload, content_id, manifest, MANIFEST_MAX_BLOCKS,
+        parse_compression, compression_spec, RWND_BYTES
+    )
+    from delta import compute_delta, parse_signature
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 METRICS_DIR = BASE_DIR / "data" / "metrics"
@@ -18,7 +32,7 @@ try:
     from config import (
         SERVER_HOST, FILE_PORT, SYNCROX_LOSS_PROB,
         HANDSHAKE_TIMEOUT, TERMINATION_TIMEOUT, MAX_RETRIES,
-        UDP_RECV_TIMEOUT, TOTAL_DOWNLOAD_TIMEOUT, DEFAULT_RWND
+        UDP_RECV_TIMEOUT, TOTAL_DOWNLOAD_TIMEOUT
     )
 except ImportError:
     SERVER_HOST = "127.0.0.1"
@@ -29,17 +43,42 @@ except ImportError:
     MAX_RETRIES = 5
     UDP_RECV_TIMEOUT = 1.0
     TOTAL_DOWNLOAD_TIMEOUT = 30.0
-    DEFAULT_RWND = 32
 
 UDP_PORT = FILE_PORT + 1
 
+# Parallel downloads: the file is cut into segments of 1..8 MB (about four
+# per stream) that PARALLEL_MAX_STREAMS sessions at most fetch concurrently.
+# The stream count is re-evaluated on goodput once per interval.
+PARALLEL_INITIAL_STREAMS = 2
+PARALLEL_MAX_STREAMS = 8
+PARALLEL_SEGMENT_MIN = 1024 * 1024
+PARALLEL_SEGMENT_MAX = 8 * 1024 * 1024
+PARALLEL_SEGMENT_RETRIES = 3
+PARALLEL_PROBE_INTERVAL = 1.0
+
+# Delta uploads give up (and send the whole file) once more than this share
+# of the new version would go out as literals: rolling through unmatched
+# data is the slow part of computing a delta
+DELTA_MAX_LITERAL_FRACTION = 0.1
+
 
 class SyncroXFileClient:
-    def __init__(self, host=None, port=None, algo="reno"):
+    def __init__(self, host=None, port=None, algo="reno", sack=True, probe_mtu=True,
+                 compress: Optional[str] = "zlib", fec: bool = False):
         self.host = host if host is not None else SERVER_HOST
         self.tcp_port = port if port is not None else FILE_PORT
         self.udp_port = self.tcp_port + 1
         self.algo = algo.lower()
+        self.sack = sack
+        self.probe_mtu = probe_mtu
+        # Chunk compression asked for in every handshake, e.g. "zlib:9" or
+        # "lzma:1"; None sends and asks for raw chunks
+        self.compress = compress
+        # Forward error correction: parity packets let the receiver rebuild
+        # lost chunks without a retransmission (worth it on lossy links)
+        self.fec = fec
+        # Chunk size proposed in every handshake; probed on first transfer
+        self.chunk_size = None
 
         self.tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.tcp_sock.connect((self.host, self.tcp_port))
@@ -51,20 +90,93 @@ class SyncroXFileClient:
     def _send_tcp_line(self, line: str):
         self.tcp_sock.sendall((line + "\n").encode("utf-8"))
 
-    def upload_bytes(self, room: str, filename: str, data: bytes) -> str:
+    def _propose_chunk_size(self) -> int:
+        """Largest chunk whose DATA datagram crosses the path unfragmented (probed once)."""
+        if self.chunk_size is None:
+            payload = probe_path_mtu((self.host, self.udp_port)) if self.probe_mtu else None
+            self.chunk_size = chunk_size_for_payload(payload) if payload else CHUNK_SIZE
+        return self.chunk_size
+
+    def upload_bytes(self, room: str, filename: str, data: bytes, algo: Optional[str] = None) -> str:
+        """
+        Upload `data` over reliable UDP. `algo` overrides the client's
+        congestion control for this transfer, e.g. "ledbat" for bulk syncs
+        that should yield to interactive traffic.
+        """
+        # Lets the server resume this upload if it was interrupted before,
+        # and skip the blocks (or whole file) it already stores
+        cid, blocks = manifest(data)
+        if len(blocks) > MANIFEST_MAX_BLOCKS:
+            blocks = []
+        return self._upload(room, filename, data, (algo or self.algo).lower(),
+                            {"content_id": cid, "size": len(data), "manifest": blocks})
+
+    def upload_delta(self, room: str, filename: str, data: bytes, algo: Optional[str] = None) -> str:
+        """
+        Upload a new version of `filename`, sending only an rsync delta
+        against the copy the room holds. Falls back to upload_bytes when
+        the room has no such file, the server cannot take deltas, or the
+        versions share too little for a delta to pay off.
+        """
+        algo = (algo or self.algo).lower()
+        sig = self.get_signature(room, filename)
+        if sig is not None:
+            block, base_size, tag, records = sig
+            ops = compute_delta(records, block, base_size, data,
+                                max_literal=int(len(data) * DELTA_MAX_LITERAL_FRACTION))
+            if ops is not None and len(ops) < len(data):
+                target_id, _ = manifest(data)
+                spec = {"base": filename, "base_tag": tag, "block": block,
+                        "target_id": target_id, "target_size": len(data)}
+                print(f"[UDP CLIENT] DELTA {filename}: {len(ops)} of {len(data)} bytes to send")
+                result = self._upload(room, filename, ops, algo,
+                                      {"content_id": content_id(ops), "size": len(ops), "delta": spec})
+                if not result.startswith("ERROR Delta"):
+                    return result
+                print(f"[UDP CLIENT] Delta upload of {filename} refused ({result}), sending it whole")
+        return self.upload_bytes(room, filename, data, algo)
+
+    def _upload(self, room: str, filename: str, data: bytes, algo: str, fields: dict) -> str:
+        """One UDP upload session; `fields` go into the SYN."""
         handshake_done = False
         session_id = None
+        wire = WIRE_JSON
+        sack = False
+        chunk_size = CHUNK_SIZE
+        compression = None
+        fec = False
+        byte_window = False
+        resume = None
+        proposed = self._propose_chunk_size()
 
         start_h = time.time()
         while time.time() - start_h < HANDSHAKE_TIMEOUT:
-            syn = {"type": "SYN", "room": room, "filename": filename}
+            syn = {"type": "SYN", "room": room, "filename": filename, "wire": WIRE_BINARY,
+                   "chunk_size": proposed, "rwnd": RWND_BYTES, **fields}
+            if self.compress:
+                syn["compress"] = self.compress
+            if self.fec:
+                syn["fec"] = True
             self.udp_sock.sendto(json.dumps(syn).encode("utf-8"), (self.host, self.udp_port))
             try:
                 self.udp_sock.settimeout(1.0)
                 resp, _ = self.udp_sock.recvfrom(65536)
-                msg = json.loads(resp.decode("utf-8"))
+                msg = parse_datagram(resp)
                 if msg.get("type") == "SYN-ACK" and msg.get("filename") == filename:
+                    if msg.get("have"):
+                        return "OK SAVED"
+                    if msg.get("error"):
+                        return f"ERROR {msg['error']}"
                     session_id = msg.get("session_id")
+                    # Servers that predate binary framing or SACK don't echo them
+                    wire = msg.get("wire", WIRE_JSON)
+                    sack = self.sack and msg.get("sack") is True
+                    chunk_size = int(msg.get("chunk_size", CHUNK_SIZE))
+                    # Servers that can't decompress don't echo the codec
+                    compression = parse_compression(msg.get("compress"))
+                    fec = self.fec and msg.get("fec") is True
+                    byte_window = msg.get("rwnd") == RWND_BYTES
+                    resume = msg.get("resume")
                     ack = {"type": "ACK", "room": room, "filename": filename, "session_id": session_id}
                     self.udp_sock.sendto(json.dumps(ack).encode("utf-8"), (self.host, self.udp_port))
                     handshake_done = True
@@ -75,46 +187,34 @@ class SyncroXFileClient:
         if not handshake_done or not session_id:
             return "ERROR Handshake failed"
 
-        metrics = FileTransferMetrics(room, filename, METRICS_DIR, algo=self.algo, direction="upload")
+        metrics = FileTransferMetrics(room, filename, METRICS_DIR, algo=algo, direction="upload")
         metrics.on_start()
-        sender = FileSender(room, filename, data, (self.host, self.udp_port), self.udp_sock, metrics, loss_prob=SYNCROX_LOSS_PROB, session_id=session_id)
+        sender = FileSender(room, filename, data, (self.host, self.udp_port), self.udp_sock, metrics,
+                            loss_prob=SYNCROX_LOSS_PROB, session_id=session_id, wire=wire, sack=sack,
+                            chunk_size=chunk_size, compression=compression, fec=fec,
+                            byte_window=byte_window)
+        if resume:
+            # The server kept these chunks from an interrupted upload
+            sender.resume_from(int(resume.get("ack", 0)), resume.get("sack"))
 
-        next_seq = 1
-        rwnd = DEFAULT_RWND
+        next_seq = metrics.last_ack + 1
 
         while metrics.last_ack < sender.total_packets:
-            next_seq = sender.send_window(next_seq, metrics.last_ack + 1, rwnd)
+            next_seq = sender.send_window(next_seq, metrics.last_ack + 1)
 
             try:
-                self.udp_sock.settimeout(0.2)
+                # Wake up in time for the pacer's next release or the RTO
+                self.udp_sock.settimeout(sender.poll_timeout(metrics.last_ack + 1))
                 resp, _ = self.udp_sock.recvfrom(65536)
-                ack = json.loads(resp.decode("utf-8"))
-                if ack.get("type") == "ACK" and ack.get("filename") == filename and ack.get("session_id") == session_id and "ack" in ack:
-                    ack_val = int(ack["ack"])
-                    rwnd = int(ack.get("rwnd", rwnd))
-                    sent_t = sender.sent_times.get(ack_val)
-                    if sent_t is None:
-                        sent_t = sender.sent_times.get(metrics.last_ack + 1, time.time())
-                    rtt_ms = (time.time() - sent_t) * 1000.0
-
-                    if metrics.on_ack(ack_val, CHUNK_SIZE, rtt_ms):
-                        missing = metrics.last_ack + 1
-                        if missing <= sender.total_packets:
-                            offset = (missing - 1) * CHUNK_SIZE
-                            pkt = {
-                                "type": "DATA",
-                                "room": room,
-                                "filename": filename,
-                                "seq": missing,
-                                "total": sender.total_packets,
-                                "payload_b64": base64.b64encode(data[offset:offset + CHUNK_SIZE]).decode("ascii"),
-                                "session_id": session_id
-                            }
-                            self.udp_sock.sendto(json.dumps(pkt).encode("utf-8"), (self.host, self.udp_port))
+                ack = parse_datagram(resp)
+                if ack.get("type") == "ACK" and ack.get("session_id") == session_id and "ack" in ack:
+                    if "rwnd" in ack:
+                        sender.update_rwnd(int(ack["rwnd"]))
+                    sender.handle_ack(int(ack["ack"]), ack.get("sack"), ack.get("repaired"))
 
                     next_seq = max(next_seq, metrics.last_ack + 1)
 
-            except socket.timeout:
+            except (socket.timeout, ValueError):
                 pass
 
             base = metrics.last_ack + 1
@@ -125,27 +225,33 @@ class SyncroXFileClient:
 
             if not ok:
                 metrics.close()
+                sender.close()
                 return "ERROR Max retries exceeded"
 
             if new_next != -1:
                 next_seq = new_next
 
+        error = None
         start_term = time.time()
         while time.time() - start_term < TERMINATION_TIMEOUT:
             try:
                 self.udp_sock.settimeout(1.0)
                 resp, _ = self.udp_sock.recvfrom(65536)
-                msg = json.loads(resp.decode("utf-8"))
+                msg = parse_datagram(resp)
                 if msg.get("type") == "FIN" and msg.get("filename") == filename and msg.get("session_id") == session_id:
+                    # The server could not store what it received (e.g. a stale delta)
+                    error = msg.get("error")
                     ack = {"type": "FIN-ACK", "room": room, "filename": filename, "session_id": session_id}
                     self.udp_sock.sendto(json.dumps(ack).encode("utf-8"), (self.host, self.udp_port))
                     break
-            except socket.timeout:
+            except (socket.timeout, ValueError):
                 pass
 
-        metrics.on_complete()
+        metrics.on_complete(sender.logical_bytes, sender.wire_bytes,
+                            sender.compression and compression_spec(sender.compression))
         metrics.close()
-        return "OK SAVED"
+        sender.close()
+        return f"ERROR {error}" if error else "OK SAVED"
 
     def list_files(self, room: str) -> List[Tuple[str, int, str]]:
         self._send_tcp_line(f"LIST {room}")
@@ -168,22 +274,97 @@ class SyncroXFileClient:
             result.append((parts[2], int(parts[0]), parts[1]))
         return result
 
-    def download_bytes(self, room: str, filename: str) -> Optional[bytes]:
+    def get_stats(self) -> Optional[dict]:
+        """Fetch the server's live session and memory instrumentation."""
+        self._send_tcp_line("STATS")
+        line = self.file.readline().decode("utf-8").strip()
+        if not line.startswith("STATS "):
+            return None
+        try:
+            return json.loads(line[len("STATS "):])
+        except ValueError:
+            return None
+
+    def download_tcp(self, room: str, filename: str, offset: int = 0, length: Optional[int] = None) -> Optional[bytes]:
+        """
+        Fetch a file, or `length` bytes of it from `offset` (to the end when
+        None), over the TCP control connection.
+        """
+        if offset or length is not None:
+            self._send_tcp_line(f"RANGE {room} {offset} {'*' if length is None else length} {filename}")
+        else:
+            self._send_tcp_line(f"DOWNLOAD {room} {filename}")
+        header = self.file.readline().decode("utf-8").strip()
+        if not header.startswith("OK "):
+            return None
+        n = int(header.split()[1])
+        body = self.file.read(n)
+        return body if len(body) == n else None
+
+    def get_signature(self, room: str, filename: str) -> Optional[Tuple[int, int, str, list]]:
+        """rsync signature of a file in the room: (block size, file size, tag, records), or None."""
+        self._send_tcp_line(f"SIGNATURE {room} {filename}")
+        header = self.file.readline().decode("utf-8").strip().split()
+        if len(header) != 5 or header[0] != "OK":
+            return None
+        block, length, size, tag = int(header[1]), int(header[2]), int(header[3]), header[4]
+        raw = self.file.read(length)
+        if len(raw) != length:
+            return None
+        return block, size, tag, parse_signature(raw)
+
+    def download_bytes(self, room: str, filename: str, algo: Optional[str] = None,
+                       offset: int = 0, length: Optional[int] = None) -> Optional[bytes]:
+        """
+        Download over reliable UDP; `algo` picks the server's congestion
+        control for this transfer. `offset`/`length` request a byte range
+        (to the end of the file when `length` is None).
+        """
+        return self._download(self.udp_sock, room, filename, (algo or self.algo).lower(), offset, length)
+
+    def _download(self, sock: socket.socket, room: str, filename: str, algo: str,
+                  offset: int, length: Optional[int]) -> Optional[bytes]:
+        """One UDP download session on `sock`; the server keys sessions by its address."""
+        ranged = bool(offset) or length is not None
         handshake_done = False
         session_id = None
+        wire = WIRE_JSON
+        chunk_size = CHUNK_SIZE
+        compression = None
+        byte_window = False
+        rtt = None
+        proposed = self._propose_chunk_size()
 
         start_h = time.time()
         while time.time() - start_h < HANDSHAKE_TIMEOUT:
-            pkt = {"type": "DOWNLOAD", "room": room, "filename": filename, "algo": self.algo}
-            self.udp_sock.sendto(json.dumps(pkt).encode("utf-8"), (self.host, self.udp_port))
+            pkt = {"type": "DOWNLOAD", "room": room, "filename": filename, "algo": algo,
+                   "wire": WIRE_BINARY, "sack": self.sack, "rwnd": RWND_BYTES, "chunk_size": proposed}
+            if self.compress:
+                pkt["compress"] = self.compress
+            if self.fec:
+                pkt["fec"] = True
+            if ranged:
+                pkt.update({"offset": offset, "length": length})
+            sock.sendto(json.dumps(pkt).encode("utf-8"), (self.host, self.udp_port))
+            sent_at = time.time()
             try:
-                self.udp_sock.settimeout(1.0)
-                resp, _ = self.udp_sock.recvfrom(65536)
-                msg = json.loads(resp.decode("utf-8"))
+                sock.settimeout(1.0)
+                resp, _ = sock.recvfrom(65536)
+                msg = parse_datagram(resp)
                 if msg.get("type") == "SYN-ACK" and msg.get("filename") == filename:
+                    # The handshake's round trip seeds receive-window autotuning
+                    rtt = time.time() - sent_at
                     session_id = msg.get("session_id")
+                    wire = msg.get("wire", WIRE_JSON)
+                    chunk_size = int(msg.get("chunk_size", CHUNK_SIZE))
+                    compression = parse_compression(msg.get("compress"))
+                    byte_window = msg.get("rwnd") == RWND_BYTES
+                    # Servers without range support send the whole file
+                    trim = ranged and "offset" not in msg
+                    # An empty range (or file) has no DATA to wait for
+                    empty = msg.get("length") == 0
                     ack = {"type": "ACK", "room": room, "filename": filename, "session_id": session_id}
-                    self.udp_sock.sendto(json.dumps(ack).encode("utf-8"), (self.host, self.udp_port))
+                    sock.sendto(json.dumps(ack).encode("utf-8"), (self.host, self.udp_port))
                     handshake_done = True
                     break
             except socket.timeout:
@@ -192,58 +373,90 @@ class SyncroXFileClient:
         if not handshake_done or not session_id:
             return None
 
+        def close_session():
+            fin = {"type": "FIN", "room": room, "filename": filename, "session_id": session_id}
+            sock.sendto(json.dumps(fin).encode("utf-8"), (self.host, self.udp_port))
+
+            start_fa = time.time()
+            while time.time() - start_fa < 2:
+                try:
+                    sock.settimeout(0.5)
+                    resp, _ = sock.recvfrom(65536)
+                    msg2 = parse_datagram(resp)
+                    if msg2.get("type") == "FIN-ACK" and msg2.get("session_id") == session_id:
+                        break
+                except:
+                    pass
+
+        if empty:
+            close_session()
+            return b""
+
+        def result(receiver: FileReceiver) -> bytes:
+            data = receiver.finalize_to_bytes()
+            if trim:
+                data = data[offset:None if length is None else offset + length]
+            return data
+
+        def send_ack(receiver: FileReceiver):
+            receiver.ack_sent()
+            ack = encode_ack(session_id, receiver.get_ack_seq(), receiver.advertised_window(byte_window),
+                             wire=wire, room=room, filename=filename,
+                             sack=receiver.get_sack_blocks(), repaired=receiver.repaired)
+            sock.sendto(ack, (self.host, self.udp_port))
+
         receiver = None
         start_t = time.time()
         max_wait = 5.0
 
         while True:
             try:
-                self.udp_sock.settimeout(1.0)
-                resp, _ = self.udp_sock.recvfrom(65536)
-                msg = json.loads(resp.decode("utf-8"))
-
-                if msg.get("type") == "DATA" and msg.get("filename") == filename and msg.get("session_id") == session_id:
-                    if receiver is None:
-                        receiver = FileReceiver(int(msg["total"]), max_buf=DEFAULT_RWND)
-
-                    payload = base64.b64decode(msg["payload_b64"].encode("ascii"))
-                    receiver.add_chunk(int(msg["seq"]), payload)
-
-                    ack = {
-                        "type": "ACK",
-                        "room": room,
-                        "filename": filename,
-                        "ack": receiver.get_ack_seq(),
-                        "rwnd": receiver.rwnd,
-                        "session_id": session_id
-                    }
-                    self.udp_sock.sendto(json.dumps(ack).encode("utf-8"), (self.host, self.udp_port))
+                # Wake up in time to send a delayed ACK
+                delay = receiver.ack_delay() if receiver is not None else None
+                sock.settimeout(1.0 if delay is None else max(delay, 0.001))
+                resp, _ = sock.recvfrom(65536)
+                try:
+                    msg = parse_datagram(resp)
+                except ValueError:
+                    continue
+
+                is_parity = msg.get("type") == "PARITY"
+                if msg.get("type") == "DATA" or is_parity and receiver is not None:
+                    if msg.get("session_id") != session_id:
+                        continue
+                    if is_parity:
+                        # Rebuilds a lost chunk of its group, if exactly one is missing
+                        if not receiver.add_parity(int(msg["first"]), int(msg["k"]), int(msg["len_xor"]),
+                                                   data_payload(msg)):
+                            continue
+                    else:
+                        if receiver is None:
+                            receiver = FileReceiver(int(msg["total"]), chunk_size=chunk_size, rtt=rtt, sock=sock)
+                        try:
+                            payload = data_payload(msg, compression, chunk_size)
+                        except ValueError:
+                            continue
+                        receiver.add_chunk(int(msg["seq"]), payload)
+                        if not receiver.ack_due(ack_requested(msg)):
+                            continue
+
+                    send_ack(receiver)
 
                     if receiver.is_complete():
-                        fin = {"type": "FIN", "room": room, "filename": filename, "session_id": session_id}
-                        self.udp_sock.sendto(json.dumps(fin).encode("utf-8"), (self.host, self.udp_port))
-
-                        start_fa = time.time()
-                        while time.time() - start_fa < 2:
-                            try:
-                                self.udp_sock.settimeout(0.5)
-                                resp, _ = self.udp_sock.recvfrom(65536)
-                                msg2 = json.loads(resp.decode("utf-8"))
-                                if msg2.get("type") == "FIN-ACK" and msg2.get("session_id") == session_id:
-                                    break
-                            except:
-                                pass
-
-                        return receiver.finalize_to_bytes()
+                        close_session()
+                        return result(receiver)
 
                 elif msg.get("type") == "ERROR":
                     return None
 
             except socket.timeout:
+                if receiver is not None and receiver.unacked:
+                    send_ack(receiver)
+                    continue
                 if receiver is None and time.time() - start_t > max_wait:
                     return None
                 if receiver and receiver.is_complete():
-                    return receiver.finalize_to_bytes()
+                    return result(receiver)
                 
                 # Check for total transfer timeout
                 if time.time() - start_t > TOTAL_DOWNLOAD_TIMEOUT:
@@ -251,7 +464,122 @@ class SyncroXFileClient:
                     return None
                     
                 if receiver is None:
-                    self.udp_sock.sendto(json.dumps(pkt).encode("utf-8"), (self.host, self.udp_port))
+                    sock.sendto(json.dumps(pkt).encode("utf-8"), (self.host, self.udp_port))
+
+    def download_parallel(self, room: str, filename: str, dest: Path, algo: Optional[str] = None,
+                          max_streams: int = PARALLEL_MAX_STREAMS, streams: Optional[int] = None) -> Optional[dict]:
+        """
+        Download `filename` into `dest` over several concurrent UDP sessions,
+        each with its own socket and congestion state, fetching byte ranges
+        of the file and writing them at their offsets.
+
+        Unless `streams` fixes the count, it starts at PARALLEL_INITIAL_STREAMS
+        and follows measured goodput: another stream is added while the last
+        change raised goodput by more than 10%, one is removed when goodput
+        falls by as much. Returns transfer stats, or None on failure.
+        """
+        algo = (algo or self.algo).lower()
+        size = next((s for name, s, _ in self.list_files(room) if name == filename), None)
+        if size is None:
+            return None
+        max_streams = max(1, streams or max_streams)
+        segment = min(max(size // (max_streams * 4), PARALLEL_SEGMENT_MIN), PARALLEL_SEGMENT_MAX)
+        pending = deque((off, min(segment, size - off)) for off in range(0, size, segment))
+        # Probe the path once, before the streams race to do it
+        self._propose_chunk_size()
+
+        dest = Path(dest)
+        part = dest.with_name(dest.name + ".part")
+        fd = os.open(part, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0))
+        os.ftruncate(fd, size)
+        # The streams share one fd: without pwrite, each seek + write must be atomic
+        write_lock = threading.Lock()
+
+        def write_at(offset: int, data: bytes):
+            if hasattr(os, "pwrite"):
+                os.pwrite(fd, data, offset)
+            else:
+                with write_lock:
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    os.write(fd, data)
+
+        cond = threading.Condition()
+        state = {"target": streams or min(PARALLEL_INITIAL_STREAMS, max_streams),
+                 "active": 0, "done": 0, "failed": False, "peak": 0}
+        retries = {}
+
+        def stream():
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                while True:
+                    with cond:
+                        while pending and not state["failed"] and state["active"] >= state["target"]:
+                            cond.wait()
+                        if not pending or state["failed"]:
+                            return
+                        offset, length = pending.popleft()
+                        state["active"] += 1
+                        state["peak"] = max(state["peak"], state["active"])
+
+                    data = self._download(sock, room, filename, algo, offset, length)
+                    ok = data is not None and len(data) == length
+                    if ok:
+                        write_at(offset, data)
+
+                    with cond:
+                        state["active"] -= 1
+                        if ok:
+                            state["done"] += length
+                        else:
+                            retries[offset] = retries.get(offset, 0) + 1
+                            if retries[offset] > PARALLEL_SEGMENT_RETRIES:
+                                state["failed"] = True
+                            else:
+                                pending.appendleft((offset, length))
+                        cond.notify_all()
+            finally:
+                sock.close()
+
+        start = time.time()
+        workers = [threading.Thread(target=stream, daemon=True) for _ in range(max_streams)]
+        for t in workers:
+            t.start()
+
+        last_done, last_rate, last_t = 0, None, start
+        while any(t.is_alive() for t in workers):
+            with cond:
+                cond.wait(PARALLEL_PROBE_INTERVAL / 4)
+            now = time.time()
+            if streams or now - last_t < PARALLEL_PROBE_INTERVAL:
+                continue
+            with cond:
+                done = state["done"]
+                if done == last_done:
+                    # No segment finished yet: nothing to judge by
+                    continue
+                rate = (done - last_done) / (now - last_t)
+                target = state["target"]
+                if last_rate is None or rate > last_rate * 1.1:
+                    target = min(target + 1, max_streams)
+                elif rate < last_rate * 0.9:
+                    target = max(target - 1, 1)
+                if target != state["target"]:
+                    print(f"[UDP CLIENT] PARALLEL streams {state['target']}→{target} "
+                          f"(goodput {rate / 1e6:.2f} MB/s)")
+                    state["target"] = target
+                    cond.notify_all()
+            last_done, last_rate, last_t = done, rate, now
+
+        os.close(fd)
+        if state["failed"] or state["done"] != size:
+            try:
+                part.unlink()
+            except OSError:
+                pass
+            return None
+        os.replace(part, dest)
+        elapsed = time.time() - start
+        return {"bytes": size, "seconds": elapsed, "streams": state["target"], "peak_streams": state["peak"]}
 
     def close(self):
         try:
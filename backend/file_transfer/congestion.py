@@ -0,0 +1,375 @@
+"""
+Congestion-control strategies for the reliable-UDP file transfer.
+
+FileTransferMetrics owns RTT estimation, dup-ACK counting and CSV logging;
+a strategy only decides how cwnd/ssthresh react to those events. Strategies
+are looked up by the `algo` string the client sends in SYN/DOWNLOAD.
+"""
+import time
+from collections import deque
+from typing import Dict, Optional, Type
+
+
+class CongestionControl:
+    """
+    Base strategy: Reno (RFC 5681) AIMD growth, fast retransmit and fast
+    recovery; subclasses override the reactions they change.
+
+    Every hook receives the FileTransferMetrics instance and mutates its
+    cwnd / ssthresh / in_fast_recovery fields. Hooks that feed the per-ACK
+    trace return the label printed next to the event.
+
+    Receivers delay and coalesce ACKs, so one ACK may cover several
+    packets: growth is counted per packet acknowledged (RFC 3465), with
+    slow start capped at ABC_LIMIT packets per ACK.
+    """
+    name = "base"
+    label = "Base"
+    loss_response = ""
+
+    # Packets/sec the sender should pace DATA at; None sends a window back-to-back
+    pacing_rate: Optional[float] = None
+
+    # Slow start credits at most this many packets per ACK (RFC 3465's L), so
+    # the jump after a repaired hole doesn't release a burst
+    ABC_LIMIT = 2
+
+    def on_ack_received(self, m, rtt_ms: float, delivered: int = 1):
+        """
+        Any ACK arrived. `delivered` is how many DATA packets it reports
+        received for the first time, cumulatively or in SACK blocks; with
+        delayed ACKs that is usually more than one, and zero for a duplicate.
+        """
+
+    def on_new_ack(self, m, acked: int, rtt_ms: float) -> str:
+        """Cumulative ACK advanced by `acked` packets."""
+        if m.in_fast_recovery:
+            m.cwnd = m.ssthresh
+            m.in_fast_recovery = False
+
+        if m.cwnd < m.ssthresh:
+            m.cwnd += min(acked, self.ABC_LIMIT)
+            return "SLOW_START (+1/pkt)"
+        m.cwnd += acked / m.cwnd
+        return "CONG_AVOID (+1/cwnd per pkt)"
+
+    def on_fast_retransmit(self, m) -> str:
+        """Third duplicate ACK (or a SACK-detected loss): halve and enter fast recovery."""
+        m.ssthresh = max(m.cwnd / 2.0, 2.0)
+        m.cwnd = m.ssthresh + 3.0
+        m.in_fast_recovery = True
+        return "FAST_RECOVERY (Reno)"
+
+    def on_recovery_dup_ack(self, m) -> bool:
+        """Further duplicate ACK while in fast recovery: inflate cwnd; True if it changed."""
+        if not m.in_fast_recovery:
+            return False
+        m.cwnd += 1.0
+        return True
+
+    def on_timeout(self, m):
+        """Retransmission timer expired."""
+        m.ssthresh = max(m.cwnd / 2.0, 2.0)
+        m.cwnd = 1.0
+        m.in_fast_recovery = False
+
+
+CONGESTION_CONTROLS: Dict[str, Type[CongestionControl]] = {}
+DEFAULT_ALGO = "reno"
+
+
+def register_congestion_control(cls: Type[CongestionControl]) -> Type[CongestionControl]:
+    CONGESTION_CONTROLS[cls.name] = cls
+    return cls
+
+
+def create_congestion_control(algo: str) -> CongestionControl:
+    """Instantiate the strategy for `algo`; unknown names fall back to Reno."""
+    cls = CONGESTION_CONTROLS.get((algo or "").lower(), CONGESTION_CONTROLS[DEFAULT_ALGO])
+    return cls()
+
+
+@register_congestion_control
+class TahoeCC(CongestionControl):
+    name = "tahoe"
+    label = "Tahoe"
+    loss_response = "cwnd→1 on loss"
+
+    def on_fast_retransmit(self, m) -> str:
+        m.ssthresh = max(m.cwnd / 2.0, 2.0)
+        m.cwnd = 1.0
+        m.in_fast_recovery = False
+        return "RESET_TO_1 (Tahoe)"
+
+
+@register_congestion_control
+class RenoCC(CongestionControl):
+    name = "reno"
+    label = "Reno"
+    loss_response = "cwnd→ssthresh on loss"
+
+
+@register_congestion_control
+class CubicCC(RenoCC):
+    """
+    CUBIC (RFC 9438): after a loss the window follows
+    W(t) = C·(t − K)³ + W_max, growing fast far from the last loss point
+    and flattening near it, independent of RTT. Windows are in packets.
+    """
+    name = "cubic"
+    label = "CUBIC"
+    loss_response = "cwnd→0.7·cwnd, cubic regrowth"
+
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self):
+        self.w_max = 0.0
+        self.k = 0.0
+        self.epoch_start = None
+        self.w_est = 0.0
+
+    def _reduce(self, m):
+        # Fast convergence: release bandwidth faster if the ceiling is dropping
+        if m.cwnd < self.w_max:
+            self.w_max = m.cwnd * (1.0 + self.BETA) / 2.0
+        else:
+            self.w_max = m.cwnd
+        m.ssthresh = max(m.cwnd * self.BETA, 2.0)
+        self.epoch_start = None
+
+    def on_new_ack(self, m, acked: int, rtt_ms: float) -> str:
+        if m.in_fast_recovery:
+            m.cwnd = m.ssthresh
+            m.in_fast_recovery = False
+
+        if m.cwnd < m.ssthresh:
+            m.cwnd += min(acked, self.ABC_LIMIT)
+            return "SLOW_START (+1/pkt)"
+
+        now = time.time()
+        if self.epoch_start is None:
+            self.epoch_start = now
+            if m.cwnd < self.w_max:
+                self.k = ((self.w_max - m.cwnd) / self.C) ** (1.0 / 3.0)
+            else:
+                self.k = 0.0
+                self.w_max = m.cwnd
+            self.w_est = m.cwnd
+
+        rtt_s = (m.srtt or rtt_ms) / 1000.0
+        t = now - self.epoch_start + rtt_s
+        target = self.C * (t - self.k) ** 3 + self.w_max
+
+        # Reno-friendly estimate so CUBIC never does worse than AIMD
+        self.w_est += 3.0 * (1.0 - self.BETA) / (1.0 + self.BETA) * acked / m.cwnd
+        if self.w_est > target:
+            m.cwnd = max(m.cwnd, self.w_est)
+            return "CUBIC_RENO_FRIENDLY"
+
+        if target > m.cwnd:
+            m.cwnd += min(target - m.cwnd, 0.5 * m.cwnd) * acked / m.cwnd
+        else:
+            m.cwnd += 0.01 * acked / m.cwnd
+        return f"CUBIC (W_max={self.w_max:.2f}, K={self.k:.2f}s)"
+
+    def on_fast_retransmit(self, m) -> str:
+        self._reduce(m)
+        m.cwnd = m.ssthresh
+        m.in_fast_recovery = True
+        return f"FAST_RECOVERY (CUBIC β={self.BETA})"
+
+    def on_timeout(self, m):
+        self._reduce(m)
+        m.cwnd = 1.0
+        m.in_fast_recovery = False
+
+
+@register_congestion_control
+class BBRCC(CongestionControl):
+    """
+    Model-based control in the style of BBR: estimate bottleneck bandwidth
+    (max delivery rate over recent rounds) and min RTT from ACK timing, pace
+    at gain × BtlBw and cap cwnd at gain × BDP. Loss does not shrink the
+    window, so random loss costs only the retransmissions themselves.
+    """
+    name = "bbr"
+    label = "BBR"
+    loss_response = "model-based, paced at BtlBw"
+
+    STARTUP_GAIN = 2.885
+    PROBE_BW_GAINS = (1.25, 0.75, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0)
+    BW_WINDOW_ROUNDS = 10
+    MIN_RTT_WINDOW = 10.0
+    PROBE_RTT_DURATION = 0.2
+    MIN_ROUND = 0.002
+    MIN_CWND = 4.0
+
+    def __init__(self):
+        self.state = "STARTUP"
+        self.pacing_gain = self.STARTUP_GAIN
+        self.cwnd_gain = self.STARTUP_GAIN
+        self.pacing_rate = None
+
+        self.bw_samples = deque(maxlen=self.BW_WINDOW_ROUNDS)  # packets/sec per round
+        self.btl_bw = 0.0
+        self.min_rtt = None
+        self.min_rtt_stamp = 0.0
+
+        self.round_start = None
+        self.round_delivered = 0
+        self.full_bw = 0.0
+        self.full_bw_rounds = 0
+        self.cycle_index = 0
+        self.state_stamp = 0.0
+
+    def _enter(self, state: str, now: float):
+        self.state = state
+        self.state_stamp = now
+        if state == "DRAIN":
+            self.pacing_gain, self.cwnd_gain = 1.0 / self.STARTUP_GAIN, self.STARTUP_GAIN
+        elif state == "PROBE_BW":
+            self.cycle_index = 0
+            self.pacing_gain, self.cwnd_gain = self.PROBE_BW_GAINS[0], 2.0
+        elif state == "PROBE_RTT":
+            self.pacing_gain, self.cwnd_gain = 1.0, 1.0
+
+    def _on_round_end(self, now: float):
+        if self.state == "STARTUP":
+            # Pipe is full once three rounds fail to grow BtlBw by 25%
+            if self.btl_bw >= self.full_bw * 1.25:
+                self.full_bw = self.btl_bw
+                self.full_bw_rounds = 0
+            else:
+                self.full_bw_rounds += 1
+                if self.full_bw_rounds >= 3:
+                    self._enter("DRAIN", now)
+        elif self.state == "DRAIN":
+            self._enter("PROBE_BW", now)
+
+    def _advance_state(self, now: float):
+        round_len = max(self.min_rtt or 0.0, self.MIN_ROUND)
+        if self.state == "PROBE_BW" and now - self.state_stamp >= round_len:
+            self.cycle_index = (self.cycle_index + 1) % len(self.PROBE_BW_GAINS)
+            self.pacing_gain = self.PROBE_BW_GAINS[self.cycle_index]
+            self.state_stamp = now
+        elif self.state == "PROBE_RTT" and now - self.state_stamp >= self.PROBE_RTT_DURATION:
+            self.min_rtt_stamp = now
+            self._enter("PROBE_BW", now)
+
+    def on_ack_received(self, m, rtt_ms: float, delivered: int = 1):
+        now = time.time()
+        rtt_s = max(rtt_ms / 1000.0, 1e-6)
+
+        expired = now - self.min_rtt_stamp > self.MIN_RTT_WINDOW
+        if self.min_rtt is None or rtt_s <= self.min_rtt or expired:
+            self.min_rtt = rtt_s
+            self.min_rtt_stamp = now
+            if expired and self.state in ("PROBE_BW", "DRAIN"):
+                self._enter("PROBE_RTT", now)
+
+        # Delivery-rate sample once per round (about one min RTT). Only packets
+        # an ACK reports for the first time count, so neither coalesced ACKs
+        # nor the cumulative jump after a repaired hole skew the estimate.
+        if self.round_start is None:
+            self.round_start = now
+        self.round_delivered += delivered
+        elapsed = now - self.round_start
+        if elapsed >= max(self.min_rtt, self.MIN_ROUND):
+            self.bw_samples.append(self.round_delivered / elapsed)
+            self.btl_bw = max(self.bw_samples)
+            self.round_start = now
+            self.round_delivered = 0
+            self._on_round_end(now)
+        self._advance_state(now)
+
+    def on_new_ack(self, m, acked: int, rtt_ms: float) -> str:
+        if self.btl_bw <= 0.0:
+            # No full round yet: the packets delivered so far this round over
+            # at least one RTT give a provisional BtlBw, whose BDP is just
+            # those packets. Grow like slow start up to gain × that BDP.
+            rtt_s = max(rtt_ms / 1000.0, 1e-6)
+            bdp = max(float(self.round_delivered), self.MIN_CWND)
+            m.cwnd = min(m.cwnd + acked, max(m.cwnd, self.cwnd_gain * bdp))
+            self.pacing_rate = self.pacing_gain * m.cwnd / rtt_s
+            return "BBR_STARTUP (no model yet)"
+
+        bdp = self.btl_bw * self.min_rtt
+        target = self.MIN_CWND if self.state == "PROBE_RTT" else max(self.cwnd_gain * bdp, self.MIN_CWND)
+        m.cwnd = min(m.cwnd + acked, target) if m.cwnd < target else target
+        m.ssthresh = max(bdp, 2.0)
+        self.pacing_rate = self.pacing_gain * self.btl_bw
+        return (
+            f"BBR_{self.state} (btl_bw={self.btl_bw:.0f}pkt/s, "
+            f"min_rtt={self.min_rtt * 1000.0:.2f}ms, gain={self.pacing_gain:.2f})"
+        )
+
+    def on_fast_retransmit(self, m) -> str:
+        # The model, not loss, sets the window; just repair the hole
+        m.in_fast_recovery = False
+        return "BBR_KEEP_CWND (loss not a congestion signal)"
+
+    def on_timeout(self, m):
+        # Packet conservation after an RTO; ACKs rebuild cwnd toward the model
+        m.cwnd = 1.0
+        m.in_fast_recovery = False
+
+
+@register_congestion_control
+class LedbatCC(CongestionControl):
+    """
+    Scavenger class in the style of LEDBAT (RFC 6817) for bulk background
+    syncs. Queuing delay is the smoothed RTT above the lowest RTT seen; the
+    window grows while it is under TARGET and shrinks in proportion once it
+    rises above, so competing loss-based flows get the link first. RTT
+    stands in for the RFC's one-way delay since DATA carries no timestamps.
+    """
+    name = "ledbat"
+    label = "LEDBAT (background)"
+    loss_response = "cwnd→cwnd/2, yields to queuing delay"
+
+    TARGET = 0.015          # seconds of queuing delay tolerated (LAN-sized; RFC 6817 caps it at 100 ms)
+    GAIN = 1.0
+    BASE_HISTORY = 10       # one min-RTT bucket per minute
+    MIN_CWND = 2.0
+
+    def __init__(self):
+        self.base_buckets = deque(maxlen=self.BASE_HISTORY)
+        self.bucket_stamp = 0.0
+
+    @property
+    def base_delay(self) -> Optional[float]:
+        return min(self.base_buckets) if self.base_buckets else None
+
+    def queuing_delay(self, m) -> float:
+        if m.srtt is None or not self.base_buckets:
+            return 0.0
+        return max(0.0, m.srtt / 1000.0 - self.base_delay)
+
+    def on_ack_received(self, m, rtt_ms: float, delivered: int = 1):
+        now = time.time()
+        rtt_s = rtt_ms / 1000.0
+        if not self.base_buckets or now - self.bucket_stamp >= 60.0:
+            self.base_buckets.append(rtt_s)
+            self.bucket_stamp = now
+        elif rtt_s < self.base_buckets[-1]:
+            self.base_buckets[-1] = rtt_s
+
+    def on_new_ack(self, m, acked: int, rtt_ms: float) -> str:
+        m.in_fast_recovery = False
+        queuing = self.queuing_delay(m)
+        off_target = (self.TARGET - queuing) / self.TARGET
+        if off_target >= 0.0:
+            # Additive increase, never faster than slow start would grow
+            m.cwnd += min(self.GAIN * off_target * acked / m.cwnd, float(acked))
+        else:
+            # Decrease in proportion to the window (LEDBAT++), at most halving per ACK
+            m.cwnd += max(off_target * acked, -m.cwnd / 2.0)
+        m.cwnd = max(m.cwnd, self.MIN_CWND)
+        return f"LEDBAT (queuing={queuing * 1000.0:.2f}ms, off_target={off_target:+.2f})"
+
+    def on_fast_retransmit(self, m) -> str:
+        m.cwnd = max(m.cwnd / 2.0, self.MIN_CWND)
+        m.ssthresh = m.cwnd
+        m.in_fast_recovery = False
+        return "LEDBAT_HALVE"
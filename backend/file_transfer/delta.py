@@ -0,0 +1,212 @@
+"""
+rsync-style delta encoding for re-uploads of edited files.
+
+The server cuts the file a room already holds (the base) into fixed-size
+blocks and sends a signature: per block, a weak rolling checksum (Adler-32)
+and a strong hash (BLAKE2b-64). The client slides a block-sized window over
+the new version a byte at a time, rolling the weak checksum in O(1), and
+wherever both checksums match a base block it emits a copy instruction
+instead of the bytes. The delta is a stream of
+
+    COPY    b"C" + index (u32) + count (u32)   base blocks index..index+count-1
+    LITERAL b"L" + length (u32) + bytes         new bytes
+
+which the server applies to the base to rebuild the new file. Windows
+are probed at block-aligned positions first, so unchanged stretches cost
+one C-level checksum per block and only the edited regions are rolled
+through byte by byte.
+"""
+import hashlib
+import math
+import struct
+import zlib
+from typing import List, Optional, Tuple
+
+# Per-block signature record: weak checksum, strong hash. The strong hash is
+# truncated to 8 bytes (as rsync truncates its own): the server checks the
+# rebuilt file against the client's content id, so a collision can only
+# fail a delta upload, never corrupt a file.
+SIG_RECORD = struct.Struct("!I8s")
+STRONG_DIGEST = 8
+
+OP_COPY = ord("C")
+OP_LITERAL = ord("L")
+COPY_OP = struct.Struct("!BII")
+LITERAL_OP = struct.Struct("!BI")
+
+# Block size grows with the square root of the base (as rsync does), so a
+# 500 MB file gets ~22 KB blocks and a signature of ~23k records
+MIN_BLOCK = 2048
+MAX_BLOCK = 128 * 1024
+
+ADLER_MOD = 65521
+
+
+def block_size_for(size: int) -> int:
+    block = int(math.sqrt(size)) & ~1023
+    return max(MIN_BLOCK, min(MAX_BLOCK, block))
+
+
+def weak_checksum(data) -> int:
+    return zlib.adler32(data)
+
+
+def strong_checksum(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=STRONG_DIGEST).digest()
+
+
+def signature(data, block: int) -> bytes:
+    """Packed signature records for every block of `data` (the last may be short)."""
+    view = memoryview(data)
+    out = bytearray()
+    for offset in range(0, len(view), block):
+        piece = view[offset:offset + block]
+        out += SIG_RECORD.pack(weak_checksum(piece), strong_checksum(piece))
+    view.release()
+    return bytes(out)
+
+
+def parse_signature(raw: bytes) -> List[Tuple[int, bytes]]:
+    return [SIG_RECORD.unpack_from(raw, i) for i in range(0, len(raw) - SIG_RECORD.size + 1, SIG_RECORD.size)]
+
+
+def compute_delta(records: List[Tuple[int, bytes]], block: int, base_size: int, data,
+                  max_literal: Optional[int] = None) -> Optional[bytes]:
+    """
+    Delta turning the base described by `records` into `data`. Returns None
+    once more than `max_literal` bytes would have to be sent as literals,
+    i.e. when the files have too little in common for a delta to pay off.
+    """
+    view = memoryview(data)
+    n = len(view)
+    table = {}
+    for index, (weak, strong) in enumerate(records):
+        if (index + 1) * block <= base_size:
+            table.setdefault(weak, []).append((index, strong))
+    # The base's short last block can only match the new file's tail
+    tail = None
+    if base_size % block and records:
+        tail = (len(records) - 1, base_size % block, records[-1][1])
+
+    ops = bytearray()
+    run = None
+    literal = 0  # literal bytes emitted so far
+
+    def flush_run():
+        if run is not None:
+            ops.extend(COPY_OP.pack(OP_COPY, run[0], run[1]))
+
+    def emit_literal(start: int, end: int):
+        nonlocal literal
+        literal += end - start
+        ops.extend(LITERAL_OP.pack(OP_LITERAL, end - start))
+        ops.extend(view[start:end])
+
+    raw = data if isinstance(data, bytes) else view
+    mod = ADLER_MOD
+    pos = 0
+    literal_start = 0
+    fresh = True
+    a = b = 0
+    while pos + block <= n:
+        if fresh:
+            weak = zlib.adler32(view[pos:pos + block])
+            a, b = weak & 0xFFFF, weak >> 16
+            fresh = False
+        candidates = table.get((b << 16) | a)
+        if candidates is not None:
+            strong = strong_checksum(view[pos:pos + block])
+            expected = run[0] + run[1] if run is not None else -1
+            match = None
+            for index, candidate in candidates:
+                if candidate == strong:
+                    match = index
+                    if index == expected:
+                        break
+            if match is not None:
+                if literal_start < pos:
+                    flush_run()
+                    run = None
+                    emit_literal(literal_start, pos)
+                if run is not None and match == run[0] + run[1]:
+                    run[1] += 1
+                else:
+                    flush_run()
+                    run = [match, 1]
+                pos += block
+                literal_start = pos
+                fresh = True
+                continue
+        # Roll forward to the next window whose weak checksum some base block shares
+        last = n - block
+        stop = last if max_literal is None else min(last, literal_start + max_literal - literal)
+        hit = False
+        while pos < stop:
+            out_byte = raw[pos]
+            a = (a - out_byte + raw[pos + block]) % mod
+            b = (b - block * out_byte + a - 1) % mod
+            pos += 1
+            if ((b << 16) | a) in table:
+                hit = True
+                break
+        if not hit:
+            if pos < last:
+                # Too little in common with the base
+                view.release()
+                return None
+            # No window up to the end of the file matches
+            pos = last + 1
+
+    matched_tail = False
+    if tail is not None and n - pos == tail[1] and literal_start == pos:
+        if strong_checksum(view[pos:n]) == tail[2]:
+            matched_tail = True
+    if matched_tail:
+        if run is not None and tail[0] == run[0] + run[1]:
+            run[1] += 1
+        else:
+            flush_run()
+            run = [tail[0], 1]
+        flush_run()
+    else:
+        flush_run()
+        if literal_start < n:
+            emit_literal(literal_start, n)
+    view.release()
+    return bytes(ops)
+
+
+def apply_delta(base, delta, block: int, out) -> int:
+    """Write the file `delta` describes to the binary file `out`; returns its size."""
+    base_view = memoryview(base)
+    delta_view = memoryview(delta)
+    written = 0
+    pos = 0
+    try:
+        while pos < len(delta_view):
+            op = delta_view[pos]
+            if op == OP_COPY:
+                _, index, count = COPY_OP.unpack_from(delta_view, pos)
+                pos += COPY_OP.size
+                start = index * block
+                end = min(start + count * block, len(base_view))
+                if start >= end:
+                    raise ValueError(f"copy of blocks {index}+{count} beyond the base")
+                out.write(base_view[start:end])
+                written += end - start
+            elif op == OP_LITERAL:
+                _, length = LITERAL_OP.unpack_from(delta_view, pos)
+                pos += LITERAL_OP.size
+                if pos + length > len(delta_view):
+                    raise ValueError("truncated literal")
+                out.write(delta_view[pos:pos + length])
+                pos += length
+                written += length
+            else:
+                raise ValueError(f"unknown delta op {op:#x}")
+    except struct.error as e:
+        raise ValueError(f"truncated delta: {e}")
+    finally:
+        base_view.release()
+        delta_view.release()
+    return written
@@ -0,0 +1,185 @@
+"""
+Fair sharing of a server-wide download rate cap.
+
+Every download session's FileSender is a flow. Without a cap flows send
+whatever their congestion and receive windows allow, as before. With one
+(`rate`, bytes/s per process), a sender releases new data only while its
+flow has credit, and every datagram it sends is charged at its length on
+the wire: data, retransmissions and FEC parity alike. A retransmission
+is never held back for credit; it may leave the flow in debt, which its
+next grants pay off before new data goes out. Credit is handed out by
+deficit round robin (DRR) from a token bucket filled at `rate`:
+
+- every backlogged flow gets `quantum * weight` bytes per round, where
+  the weight is its room's (1.0 unless set). Downloads are not
+  authenticated, so there is no per-user weight: a client could claim
+  any user;
+- flows with less than `small_file` bytes left to send are served
+  first, shortest first, so a small file gets through a busy link
+  without waiting for the bulk downloads' rounds.
+
+A flow that runs out of credit is parked until the next service, which
+runs on the session timers (the TimerScheduler in the threaded server,
+the event loop in the asyncio one); its `wake` callback then resumes the
+sender. As in DRR, a flow keeps its deficit (credit or debt) while it
+is backlogged, including when its window rather than the cap holds it
+back, so the weights hold over many rounds. Unused credit goes back to
+the bucket when the flow closes; its debt is dropped then. All methods
+run on the data path, which serializes them.
+"""
+from collections import deque
+from typing import Callable, Dict, Optional
+
+# DRR quantum: bytes a weight-1.0 flow may send per round
+EGRESS_QUANTUM = 64 * 1024
+# Flows with less than this left to send jump ahead of the round robin
+SMALL_FILE_BYTES = 1024 * 1024
+# Tokens saved up while the link is idle, in seconds of the cap
+EGRESS_BURST = 0.01
+
+
+class Flow:
+    """One download's share of the cap. `remaining` is what it has yet to send."""
+    __slots__ = ("scheduler", "room", "weight", "remaining", "deficit", "wake", "parked", "sent")
+
+    def __init__(self, scheduler: "EgressScheduler", room: str, weight: float, remaining: int,
+                 wake: Callable[[], None]):
+        self.scheduler = scheduler
+        self.room = room
+        self.weight = weight
+        self.remaining = remaining
+        self.deficit = 0.0
+        self.wake = wake
+        self.parked = False
+        self.sent = 0
+
+    def ready(self, remaining: int, queued: int = 0) -> bool:
+        return self.scheduler.ready(self, remaining, queued)
+
+    def charge(self, nbytes: int):
+        self.scheduler.charge(self, nbytes)
+
+
+class EgressScheduler:
+    def __init__(self, rate: float = 0.0, quantum: int = EGRESS_QUANTUM, small_file: int = SMALL_FILE_BYTES,
+                 room_weights: Optional[Dict[str, float]] = None):
+        self.rate = rate
+        self.quantum = quantum
+        self.small_file = small_file
+        self.room_weights = room_weights if room_weights is not None else {}
+        self.timers = None
+        self.tokens = 0.0
+        self.stamp = None
+        self._parked = deque()
+        self._service = None
+        self._serving = False
+        self.flows = 0
+        self.sent_bytes = 0
+        self.throttled = 0
+        self.small_grants = 0
+
+    def weight(self, room: str) -> float:
+        return max(0.01, self.room_weights.get(room, 1.0))
+
+    def open(self, room: str, remaining: int, wake: Callable[[], None], timers) -> Flow:
+        """Register a download; `wake()` is called on the data path when a parked flow may send again."""
+        self.timers = timers
+        self.flows += 1
+        return Flow(self, room, self.weight(room), remaining, wake)
+
+    def close(self, flow: Optional[Flow]):
+        if flow is None or flow.wake is None:
+            return
+        self.flows -= 1
+        if flow.parked:
+            flow.parked = False
+            self._parked.remove(flow)
+        # Other flows must not pay for this one's retransmissions
+        self.tokens += max(0.0, flow.deficit)
+        flow.deficit = 0.0
+        flow.wake = None
+
+    def ready(self, flow: Flow, remaining: int, queued: int = 0) -> bool:
+        """
+        Whether the flow may send its next new packet, with `queued` bytes
+        released but not yet charged (a batch still being built); False
+        parks it until it has credit.
+        """
+        flow.remaining = remaining
+        if self.rate > 0 and flow.deficit - queued <= 0:
+            self.throttled += 1
+            self._park(flow)
+            return False
+        return True
+
+    def charge(self, flow: Flow, nbytes: int):
+        """Charge a datagram of `nbytes` the flow has sent."""
+        if self.rate > 0:
+            flow.deficit -= nbytes
+        flow.sent += nbytes
+        self.sent_bytes += nbytes
+
+    def _park(self, flow: Flow):
+        if not flow.parked and flow.wake is not None:
+            flow.parked = True
+            self._parked.append(flow)
+        if self._service is None and not self._serving and self.timers is not None:
+            self._service = self.timers.call_later(self._service_delay(), self._serve)
+
+    def _refill(self):
+        now = self.timers.time()
+        if self.stamp is not None:
+            burst = max(self.quantum, self.rate * EGRESS_BURST)
+            self.tokens = min(burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def _service_delay(self) -> float:
+        self._refill()
+        # An empty bucket (not just one in debt) must wait too, or the service spins
+        return 0.0 if self.tokens > 0 else (1.0 - self.tokens) / self.rate
+
+    def _serve(self):
+        self._service = None
+        self._serving = True
+        try:
+            self._run_rounds()
+        finally:
+            self._serving = False
+        if self._parked:
+            self._service = self.timers.call_later(self._service_delay(), self._serve)
+
+    def _run_rounds(self):
+        if self.rate <= 0:
+            # The cap was lifted: let everyone go
+            while self._parked:
+                self._grant(self._parked.popleft(), 0.0)
+            return
+        self._refill()
+        while self._parked and self.tokens > 0:
+            small = [flow for flow in self._parked if flow.remaining < self.small_file]
+            if small:
+                flow = min(small, key=lambda f: f.remaining)
+                self._parked.remove(flow)
+                self.small_grants += 1
+            else:
+                flow = self._parked.popleft()
+            self._grant(flow, self.quantum * flow.weight)
+
+    def _grant(self, flow: Flow, credit: float):
+        flow.parked = False
+        flow.deficit += credit
+        self.tokens -= credit
+        if flow.wake is not None:
+            # Window- or pacer-limited flows keep their credit for when they can send
+            flow.wake()
+
+    def stats(self) -> dict:
+        """Cap, flows, parked flows, bytes charged and throttle counts for STATS."""
+        return {
+            "rate": self.rate,
+            "flows": self.flows,
+            "parked": len(self._parked),
+            "sent_bytes": self.sent_bytes,
+            "throttled": self.throttled,
+            "small_grants": self.small_grants
+        }
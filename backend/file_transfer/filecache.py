@@ -0,0 +1,153 @@
+"""
+Shared read-only mappings of the files being downloaded.
+
+When a file is posted to a busy room, dozens of DOWNLOAD sessions for it
+open within seconds. Instead of mapping it once per session, the server
+asks FileCache for it: every session of the same file version shares one
+mmap, and so one set of page table entries. Versions are keyed by
+device, inode, size and mtime, so a replaced or rewritten file is a miss,
+and rooms holding the same stored object (hard links, see store.py)
+share its mapping too.
+
+Each mapping is reference counted. Mappings no session uses stay cached
+for the next download until the bytes mapped exceed the budget, then the
+least recently used go first. A mapping whose file has been replaced is
+dropped once its last session ends, or when the new version is mapped.
+"""
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+# Bytes of file mappings kept per process. Mappings are backed by the page
+# cache, so this bounds address space and open mappings, not private memory.
+FILE_CACHE_BUDGET = 1024 * 1024 * 1024
+
+
+def version_key(st: os.stat_result) -> tuple:
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class _Mapping:
+    __slots__ = ("key", "path", "data", "refs")
+
+    def __init__(self, key: tuple, path: Path, data: mmap.mmap):
+        self.key = key
+        self.path = path
+        self.data = data
+        self.refs = 1
+
+
+class FileCache:
+    """
+    LRU cache of file mappings under a byte budget. Safe to use from
+    several threads; each forked UDP worker starts its own empty cache.
+    """
+
+    def __init__(self, budget: int = FILE_CACHE_BUDGET):
+        self.budget = budget
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self.lock = threading.Lock()
+        # Key -> mapping, least recently acquired first
+        self._mappings: "OrderedDict[tuple, _Mapping]" = OrderedDict()
+        self.mapped_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def acquire(self, path: Path) -> Tuple[object, Optional[Callable[[], None]]]:
+        """
+        The contents of `path` as a read-only buffer, and the callable that
+        hands it back (None for an empty file, which is b"" and not cached).
+        Raises OSError if the file cannot be opened.
+        """
+        if self._pid != os.getpid():
+            self._reset()
+        with path.open("rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                return b"", None
+            key = version_key(st)
+            with self.lock:
+                mapping = self._use(key)
+            if mapping is None:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                with self.lock:
+                    # Another thread may have mapped the same version meanwhile
+                    mapping = self._use(key)
+                    if mapping is None:
+                        # Idle mappings of the version this one replaces
+                        for old in list(self._mappings.values()):
+                            if old.path == path and not old.refs:
+                                self._drop(old)
+                        mapping = _Mapping(key, path, data)
+                        self._mappings[key] = mapping
+                        self.mapped_bytes += st.st_size
+                        self.misses += 1
+                        self._evict()
+                        data = None
+                if data is not None:
+                    data.close()
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._release(mapping)
+        return mapping.data, release
+
+    def _use(self, key: tuple) -> Optional[_Mapping]:
+        mapping = self._mappings.get(key)
+        if mapping is not None:
+            mapping.refs += 1
+            self._mappings.move_to_end(key)
+            self.hits += 1
+        return mapping
+
+    def _release(self, mapping: _Mapping):
+        with self.lock:
+            mapping.refs -= 1
+            if mapping.refs or self._mappings.get(mapping.key) is not mapping:
+                return
+            try:
+                current = version_key(os.stat(mapping.path)) == mapping.key
+            except OSError:
+                current = False
+            if not current:
+                # A later download of this path would miss it anyway
+                self._drop(mapping)
+            else:
+                self._evict()
+
+    def _evict(self):
+        for mapping in list(self._mappings.values()):
+            if self.mapped_bytes <= self.budget:
+                break
+            if not mapping.refs:
+                self._drop(mapping)
+                self.evictions += 1
+
+    def _drop(self, mapping: _Mapping):
+        del self._mappings[mapping.key]
+        self.mapped_bytes -= len(mapping.data)
+        mapping.data.close()
+
+    def stats(self) -> dict:
+        """Mappings held and in use, bytes mapped, and hit/miss/eviction counts for STATS."""
+        with self.lock:
+            return {
+                "mappings": len(self._mappings),
+                "in_use": sum(1 for mapping in self._mappings.values() if mapping.refs),
+                "mapped_bytes": self.mapped_bytes,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -1,12 +1,20 @@
+import os
+import mmap
 import time
 import json
 import csv
 import random
 import socket
+import struct
+import sys
 import threading
 import base64
+import hashlib
+import lzma
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 
 try:
     from config import CHUNK_SIZE, ALPHA, BETA, MIN_RTO, INITIAL_CWND, INITIAL_SSTHRESH, DEFAULT_RWND
@@ -19,6 +27,551 @@ except ImportError:
     INITIAL_SSTHRESH = 16.0
     DEFAULT_RWND = 32
 
+try:
+    from config import ACK_EVERY, ACK_DELAY_MS, RCV_WINDOW_INITIAL, RCV_WINDOW_MAX, RCV_MEMORY_BUDGET
+except ImportError:
+    ACK_EVERY = 2
+    ACK_DELAY_MS = 10.0
+    RCV_WINDOW_INITIAL = 128 * 1024
+    RCV_WINDOW_MAX = 16 * 1024 * 1024
+    RCV_MEMORY_BUDGET = 64 * 1024 * 1024
+
+try:
+    from .congestion import create_congestion_control
+except (ImportError, ValueError):
+    from congestion import create_congestion_control
+
+
+# --- Binary datagram framing ---
+# DATA and ACK datagrams use a fixed 16-byte header followed by the raw
+# payload. Control messages (SYN, SYN-ACK, DOWNLOAD, FIN, FIN-ACK) stay JSON.
+# The magic byte can never start a JSON object, so both formats can share
+# one socket and old JSON-only peers keep working.
+WIRE_MAGIC = 0xA7
+PKT_DATA = 1
+PKT_ACK = 2
+PKT_PARITY = 3
+
+# magic, packet type, flags, session id (4 raw bytes), seq|ack, total|rwnd
+FRAME_HEADER = struct.Struct("!BBH4sII")
+# Binary ACKs may be followed by SACK blocks: inclusive (start, end) seq ranges
+SACK_BLOCK = struct.Struct("!II")
+MAX_SACK_BLOCKS = 4
+# Duplicate ACKs (or SACKed packets above a hole) that signal a loss
+DUP_THRESH = 3
+
+# Pacer: at most ~1 ms worth of packets (2..16) may leave back-to-back
+PACING_QUANTUM = 0.001
+PACING_MIN_BURST = 2.0
+PACING_MAX_BURST = 16.0
+
+WIRE_JSON = "json"
+WIRE_BINARY = "binary"
+
+# Sessions that negotiate "rwnd": "bytes" advertise receive windows in bytes
+# (ACK "rwnd" / binary ACK b), so they stay right whatever the chunk size;
+# other peers count packets. Autotuning receivers measure throughput over
+# one RTT (from the handshake, else RCV_TUNE_DEFAULT_RTT), at least
+# RCV_TUNE_MIN_INTERVAL at a time.
+RWND_BYTES = "bytes"
+RCV_TUNE_DEFAULT_RTT = 0.1
+RCV_TUNE_MIN_INTERVAL = 0.01
+
+# Forward error correction, for sessions that negotiate "fec": after every
+# K data packets the sender adds one parity packet, the XOR of the K chunks
+# (each zero-padded to the chunk size), from which the receiver rebuilds a
+# single lost chunk of the group without a retransmission. Binary parity
+# frames carry K in the flags, the group's first seq, and the XOR of its
+# chunk lengths. K follows the loss rate the sender observes, at about
+# FEC_COVERAGE / loss: 5 at 10% loss, 10 at 5%, never above FEC_MAX_GROUP.
+FEC_INITIAL_GROUP = 8
+FEC_MIN_GROUP = 4
+FEC_MAX_GROUP = 32
+FEC_COVERAGE = 0.5
+# Packets per loss-rate sample; samples are averaged with weight LOSS_EWMA
+LOSS_SAMPLE_PACKETS = 128
+LOSS_EWMA = 0.25
+
+# Per-chunk compression, negotiated in the handshake as "<codec>:<level>".
+# Every chunk is compressed on its own (raw deflate, or raw LZMA2 with no
+# container header), so it decodes whatever was lost before it; DATA frames
+# with a compressed payload set FLAG_COMPRESSED (JSON DATA: "compressed").
+# Chunks that don't shrink go out raw.
+FLAG_COMPRESSED = 0x1
+# Set on the packet that fills the sender's window (JSON DATA: "ack_now"):
+# nothing follows it until an ACK returns, so the receiver mustn't delay one
+FLAG_ACK_NOW = 0x2
+# codec -> (lowest, highest, default) level
+COMPRESSION_LEVELS = {"zlib": (1, 9, 6), "lzma": (0, 9, 1)}
+LZMA_DICT_SIZE = 64 * 1024
+# Senders compress COMPRESS_BATCH chunks per pool job, up to
+# COMPRESS_LOOKAHEAD batches past the window. A batch saving less than
+# COMPRESS_MIN_SAVING of its bytes counts as incompressible: the batches
+# after it go raw without trying, 1, 2, 4 .. COMPRESS_MAX_BACKOFF of them.
+COMPRESS_BATCH = 32
+COMPRESS_LOOKAHEAD = 4
+COMPRESS_MIN_SAVING = 0.05
+COMPRESS_MAX_BACKOFF = 64
+# Chunks, spread over the file, trial-compressed before a transfer starts
+COMPRESS_TRIAL_CHUNKS = 16
+
+# Upload manifests: one truncated SHA-256 per MANIFEST_BLOCK bytes, so the
+# server can tell which parts of a file it already stores. A SYN carries at
+# most MANIFEST_MAX_BLOCKS of them (~10 KB of JSON); larger files are only
+# matched whole.
+MANIFEST_BLOCK = 1024 * 1024
+MANIFEST_MAX_BLOCKS = 512
+BLOCK_HASH_HEX = 16
+
+# Linux UDP segmentation offload (linux/udp.h). With UDP_SEGMENT one sendmsg
+# carries a run of equal-sized datagrams that the kernel (or NIC) splits;
+# with UDP_GRO the kernel hands a receiver several datagrams of one flow
+# coalesced into one buffer, with the segment size in a control message.
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = 103
+UDP_GRO = 104
+# Kernel limits: 64 segments per send, and the whole run must fit one IPv4 datagram
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65507
+
+# Chunk size negotiation: clients propose a size in SYN/DOWNLOAD and the
+# server's SYN-ACK settles it. CHUNK_SIZE is the ceiling and the size used
+# with peers that predate negotiation.
+MIN_CHUNK_SIZE = 512
+
+# Path MTU probing (RFC 8899 DPLPMTUD). Probes are padded JSON PROBE
+# datagrams sent with DF set; the server echoes each one's size. Sizes are
+# UDP payload bytes: PLPMTU_BASE first (does the server answer at all?),
+# then the route MTU and common smaller MTUs (Ethernet, PPPoE, tunnels,
+# the IPv6 minimum), largest first. The first size acknowledged wins.
+UDP_IP_OVERHEAD = 28
+PLPMTU_BASE = 1200
+PROBE_MTUS = (1500, 1492, 1420, 1400, 1280)
+PROBE_TIMEOUT = 0.3
+MAX_PROBES = 2
+# linux/in.h; not exported by the socket module
+IP_MTU_DISCOVER = 10
+IP_PMTUDISC_PROBE = 3
+IP_MTU = 14
+
+
+def session_to_bytes(session_id: str) -> bytes:
+    """Session ids are 8 hex chars; pack them into 4 raw bytes."""
+    return bytes.fromhex(session_id)
+
+
+def is_binary_frame(packet: bytes) -> bool:
+    return len(packet) >= FRAME_HEADER.size and packet[0] == WIRE_MAGIC
+
+
+def pack_data(session_id: str, seq: int, total: int, payload: bytes, flags: int = 0) -> bytes:
+    header = FRAME_HEADER.pack(WIRE_MAGIC, PKT_DATA, flags, session_to_bytes(session_id), seq, total)
+    return header + payload
+
+
+def pack_parity(session_id: str, first: int, k: int, len_xor: int, payload: bytes) -> bytes:
+    header = FRAME_HEADER.pack(WIRE_MAGIC, PKT_PARITY, k, session_to_bytes(session_id), first, len_xor)
+    return header + payload
+
+
+def xor_chunks(chunks) -> int:
+    """XOR of byte strings as one little-endian integer: shorter ones count as zero-padded."""
+    acc = 0
+    for chunk in chunks:
+        acc ^= int.from_bytes(chunk, "little")
+    return acc
+
+
+def pack_ack(session_id: str, ack: int, rwnd: int, flags: int = 0,
+             sack: Optional[List[Tuple[int, int]]] = None) -> bytes:
+    header = FRAME_HEADER.pack(WIRE_MAGIC, PKT_ACK, flags, session_to_bytes(session_id), ack, rwnd)
+    if not sack:
+        return header
+    return header + b"".join(SACK_BLOCK.pack(start, end) for start, end in sack)
+
+
+def parse_datagram(packet: bytes) -> dict:
+    """
+    Decode a datagram into the same dict shape for both wire formats.
+
+    Binary DATA and PARITY frames carry their payload as a memoryview under
+    "payload"; JSON ones keep "payload_b64". The flags of a binary ACK are
+    the receiver's count of chunks rebuilt from parity, as "repaired".
+    Raises ValueError on garbage.
+    """
+    if is_binary_frame(packet):
+        _, ptype, flags, sid, a, b = FRAME_HEADER.unpack_from(packet)
+        if ptype == PKT_DATA:
+            return {
+                "type": "DATA",
+                "session_id": sid.hex(),
+                "seq": a,
+                "total": b,
+                "flags": flags,
+                "payload": memoryview(packet)[FRAME_HEADER.size:],
+                "wire": WIRE_BINARY
+            }
+        if ptype == PKT_ACK:
+            return {
+                "type": "ACK",
+                "session_id": sid.hex(),
+                "ack": a,
+                "rwnd": b,
+                "repaired": flags,
+                "sack": [list(block) for block in SACK_BLOCK.iter_unpack(
+                    packet[FRAME_HEADER.size:FRAME_HEADER.size + MAX_SACK_BLOCKS * SACK_BLOCK.size])],
+                "wire": WIRE_BINARY
+            }
+        if ptype == PKT_PARITY:
+            return {
+                "type": "PARITY",
+                "session_id": sid.hex(),
+                "first": a,
+                "k": flags,
+                "len_xor": b,
+                "payload": memoryview(packet)[FRAME_HEADER.size:],
+                "wire": WIRE_BINARY
+            }
+        raise ValueError(f"unknown frame type {ptype}")
+
+    msg = json.loads(bytes(packet).decode("utf-8"))
+    if not isinstance(msg, dict):
+        raise ValueError("datagram is not a JSON object")
+    return msg
+
+
+def encode_ack(session_id: str, ack: int, rwnd: int, wire: str = WIRE_JSON,
+               room: Optional[str] = None, filename: Optional[str] = None,
+               sack: Optional[List[Tuple[int, int]]] = None, repaired: int = 0) -> bytes:
+    """
+    Build a cumulative ACK, plus any SACK blocks, in the session's wire
+    format. `repaired` (chunks rebuilt from parity so far) lets an FEC
+    sender count the losses it never had to retransmit.
+    """
+    if wire == WIRE_BINARY:
+        return pack_ack(session_id, ack, rwnd, flags=repaired & 0xFFFF, sack=sack)
+    ack_msg = {
+        "type": "ACK",
+        "room": room,
+        "filename": filename,
+        "session_id": session_id,
+        "ack": ack,
+        "rwnd": rwnd
+    }
+    if sack:
+        ack_msg["sack"] = [list(block) for block in sack]
+    if repaired:
+        ack_msg["repaired"] = repaired
+    return json.dumps(ack_msg).encode("utf-8")
+
+
+def data_payload(msg: dict, compression: Optional[Tuple[str, int]] = None,
+                 limit: int = CHUNK_SIZE) -> bytes:
+    """
+    Return the chunk bytes of a parsed DATA message in either wire format,
+    decompressed with the session's `compression` when the frame says so.
+    Raises ValueError for a chunk that doesn't decode to at most `limit` bytes.
+    """
+    payload = msg.get("payload")
+    if payload is None:
+        payload = base64.b64decode(msg["payload_b64"])
+    if msg.get("flags", 0) & FLAG_COMPRESSED or msg.get("compressed"):
+        if compression is None:
+            raise ValueError("compressed chunk in a session without compression")
+        return decompress_chunk(payload, compression[0], limit)
+    return payload
+
+
+def ack_requested(msg: dict) -> bool:
+    """True if the sender asked for this DATA packet to be acknowledged at once."""
+    return bool(msg.get("flags", 0) & FLAG_ACK_NOW or msg.get("ack_now"))
+
+
+def parse_compression(spec) -> Optional[Tuple[str, int]]:
+    """("zlib", 6) for "zlib" or "zlib:6"; None for no or an unknown codec."""
+    if not isinstance(spec, str):
+        return None
+    name, _, level = spec.partition(":")
+    name = name.strip().lower()
+    if name not in COMPRESSION_LEVELS:
+        return None
+    low, high, default = COMPRESSION_LEVELS[name]
+    try:
+        level = int(level) if level else default
+    except ValueError:
+        level = default
+    return name, max(low, min(high, level))
+
+
+def compression_spec(compression: Tuple[str, int]) -> str:
+    return f"{compression[0]}:{compression[1]}"
+
+
+def _lzma_filters(level: int) -> list:
+    return [{"id": lzma.FILTER_LZMA2, "preset": level, "dict_size": LZMA_DICT_SIZE}]
+
+
+def compress_chunk(chunk, compression: Tuple[str, int]) -> bytes:
+    name, level = compression
+    if name == "lzma":
+        return lzma.compress(chunk, format=lzma.FORMAT_RAW, filters=_lzma_filters(level))
+    packer = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return packer.compress(chunk) + packer.flush()
+
+
+def decompress_chunk(payload, name: str, limit: int) -> bytes:
+    try:
+        if name == "lzma":
+            unpacker = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=_lzma_filters(0))
+            chunk = unpacker.decompress(payload, max_length=limit)
+        else:
+            unpacker = zlib.decompressobj(-15)
+            chunk = unpacker.decompress(payload, limit)
+    except (lzma.LZMAError, zlib.error) as e:
+        raise ValueError(f"bad compressed chunk: {e}")
+    if not unpacker.eof:
+        raise ValueError("compressed chunk is truncated or larger than a chunk")
+    return chunk
+
+
+def compress_batch(view: memoryview, chunk_size: int, compression: Tuple[str, int]):
+    """
+    Compress each chunk of `view`. Returns the compressed chunks (None where
+    compression doesn't shrink a chunk) and the share of bytes saved.
+    """
+    out = []
+    raw = packed = 0
+    try:
+        for offset in range(0, len(view), chunk_size):
+            chunk = view[offset:offset + chunk_size]
+            small = compress_chunk(chunk, compression)
+            raw += len(chunk)
+            if len(small) < len(chunk):
+                out.append(small)
+                packed += len(small)
+            else:
+                out.append(None)
+                packed += len(chunk)
+    finally:
+        view.release()
+    return out, (1.0 - packed / raw) if raw else 0.0
+
+
+def looks_compressible(data, chunk_size: int, compression: Tuple[str, int]) -> bool:
+    """Trial-compress a few chunks spread over `data`: does it shrink enough to bother?"""
+    chunks = -(-len(data) // chunk_size)
+    if not chunks:
+        return False
+    step = max(1, chunks // COMPRESS_TRIAL_CHUNKS)
+    raw = packed = 0
+    for index in range(0, chunks, step):
+        chunk = data[index * chunk_size:(index + 1) * chunk_size]
+        raw += len(chunk)
+        packed += min(len(chunk), len(compress_chunk(chunk, compression)))
+    return packed <= raw * (1.0 - COMPRESS_MIN_SAVING)
+
+
+_compress_pool = None
+_compress_pool_lock = threading.Lock()
+
+
+def compress_pool() -> ThreadPoolExecutor:
+    """Worker threads shared by every sender; zlib and lzma release the GIL."""
+    global _compress_pool
+    with _compress_pool_lock:
+        if _compress_pool is None:
+            _compress_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1,
+                                                thread_name_prefix="syncrox-compress")
+        return _compress_pool
+
+
+def manifest(data) -> Tuple[str, List[str]]:
+    """
+    Content id and block hashes of `data` in one pass: the id is the
+    SHA-256 of the blocks' full digests, the block hashes their prefixes.
+    """
+    view = memoryview(data)
+    whole = hashlib.sha256()
+    blocks = []
+    for offset in range(0, len(view), MANIFEST_BLOCK):
+        digest = hashlib.sha256(view[offset:offset + MANIFEST_BLOCK]).digest()
+        whole.update(digest)
+        blocks.append(digest.hex()[:BLOCK_HASH_HEX])
+    view.release()
+    return whole.hexdigest(), blocks
+
+
+def content_id(data) -> str:
+    """Identity of an upload's bytes; resumed and deduplicated uploads are matched on it."""
+    return manifest(data)[0]
+
+
+def chunk_size_for_payload(payload: int) -> int:
+    """Largest binary DATA chunk that fits in a `payload`-byte UDP datagram."""
+    return max(MIN_CHUNK_SIZE, min(CHUNK_SIZE, payload - FRAME_HEADER.size))
+
+
+def negotiate_chunk_size(requested) -> int:
+    """Server side: clamp a proposed chunk size; peers that propose none get CHUNK_SIZE."""
+    try:
+        size = int(requested)
+    except (TypeError, ValueError):
+        return CHUNK_SIZE
+    return max(MIN_CHUNK_SIZE, min(CHUNK_SIZE, size))
+
+
+def build_probe(probe_id: int, size: int) -> bytes:
+    """A PROBE datagram padded to exactly `size` bytes (or its minimum length)."""
+    msg = {"type": "PROBE", "id": probe_id, "pad": ""}
+    msg["pad"] = "x" * max(0, size - len(json.dumps(msg)))
+    return json.dumps(msg).encode("utf-8")
+
+
+def _probe(sock: socket.socket, probe_id: int, size: int) -> bool:
+    packet = build_probe(probe_id, size)
+    for _ in range(MAX_PROBES):
+        try:
+            sock.send(packet)
+        except OSError:
+            # EMSGSIZE: bigger than the local route MTU
+            return False
+        deadline = time.time() + sock.gettimeout()
+        while time.time() < deadline:
+            try:
+                msg = parse_datagram(sock.recv(2048))
+            except socket.timeout:
+                break
+            except ValueError:
+                continue
+            except OSError:
+                return False
+            if msg.get("type") == "PROBE-ACK" and msg.get("id") == probe_id:
+                return msg.get("size") == len(packet)
+    return False
+
+
+def probe_path_mtu(addr: Tuple[str, int], max_payload: int = CHUNK_SIZE + FRAME_HEADER.size,
+                   timeout: float = PROBE_TIMEOUT) -> Optional[int]:
+    """
+    Largest UDP payload (up to `max_payload`) that reaches the server at
+    `addr` unfragmented, or None if it can't be told: not Linux, or the
+    server never answers a probe (it predates probing).
+
+    Blocks for a few round trips, plus PROBE_TIMEOUT per lost probe.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # DF on every probe, regardless of the kernel's cached path MTU
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+        sock.connect(addr)
+        ceiling = max_payload
+        try:
+            ceiling = min(ceiling, sock.getsockopt(socket.IPPROTO_IP, IP_MTU) - UDP_IP_OVERHEAD)
+        except OSError:
+            pass
+        sock.settimeout(timeout)
+
+        base = min(PLPMTU_BASE, ceiling)
+        probe_id = random.getrandbits(31)
+        if not _probe(sock, probe_id, base):
+            return None
+        sizes = {ceiling} | {mtu - UDP_IP_OVERHEAD for mtu in PROBE_MTUS}
+        for size in sorted(sizes, reverse=True):
+            if base < size <= ceiling:
+                probe_id += 1
+                if _probe(sock, probe_id, size):
+                    return size
+        return base
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+def gso_supported(sock) -> bool:
+    """True if `sock` is a Linux UDP socket whose kernel accepts UDP_SEGMENT."""
+    if not sys.platform.startswith("linux") or not hasattr(sock, "sendmsg"):
+        return False
+    try:
+        sock.getsockopt(SOL_UDP, UDP_SEGMENT)
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def size_socket_buffers(sock, rcvbuf: Optional[int] = None, sndbuf: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Grow SO_RCVBUF / SO_SNDBUF of `sock` to at least the given sizes (they
+    never shrink) and return the sizes in effect, which the kernel caps at
+    net.core.rmem_max / wmem_max. Asyncio transports are unwrapped.
+    """
+    if not hasattr(sock, "setsockopt") and hasattr(sock, "get_extra_info"):
+        sock = sock.get_extra_info("socket")
+    sizes = []
+    for option, size in ((socket.SO_RCVBUF, rcvbuf), (socket.SO_SNDBUF, sndbuf)):
+        try:
+            current = sock.getsockopt(socket.SOL_SOCKET, option)
+            if size and current < size:
+                sock.setsockopt(socket.SOL_SOCKET, option, size)
+                current = sock.getsockopt(socket.SOL_SOCKET, option)
+        except (OSError, AttributeError):
+            current = 0
+        sizes.append(current)
+    return sizes[0], sizes[1]
+
+
+def enable_gro(sock) -> bool:
+    """Ask the kernel to coalesce incoming datagrams; False where UDP_GRO is unsupported."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+class DatagramReader:
+    """
+    Receive side of a UDP socket into one preallocated buffer.
+
+    With `gro` (and kernel support) a single recvmsg_into can return up to
+    64 datagrams coalesced by UDP_GRO; recv() splits them back apart by the
+    segment size the kernel reports. Without it each call is one
+    recvfrom_into. Returned datagrams are memoryviews into the shared
+    buffer, so callers must finish with them before the next recv().
+    """
+
+    def __init__(self, sock: socket.socket, gro: bool = True, bufsize: int = 65535):
+        self.sock = sock
+        self.gro = gro and hasattr(sock, "recvmsg_into") and enable_gro(sock)
+        self.buf = bytearray(bufsize)
+        self.view = memoryview(self.buf)
+        self.ancbufsize = socket.CMSG_SPACE(4) if self.gro else 0
+        self.calls = 0
+        self.datagrams = 0
+
+    def recv(self) -> List[Tuple[memoryview, tuple]]:
+        self.calls += 1
+        if not self.gro:
+            n, addr = self.sock.recvfrom_into(self.buf)
+            self.datagrams += 1
+            return [(self.view[:n], addr)]
+
+        n, ancdata, _, addr = self.sock.recvmsg_into([self.buf], self.ancbufsize)
+        segment = n
+        for level, kind, data in ancdata:
+            if level == SOL_UDP and kind == UDP_GRO and len(data) >= 4:
+                segment = struct.unpack("i", data[:4])[0] or n
+        datagrams = [(self.view[offset:min(offset + segment, n)], addr) for offset in range(0, n, segment)]
+        if not datagrams:
+            # Zero-length datagram
+            datagrams = [(self.view[:0], addr)]
+        self.datagrams += len(datagrams)
+        return datagrams
+
 
 class FileTransferMetrics:
     def __init__(self, room: str, filename: str, metrics_dir: Path,
@@ -28,6 +581,7 @@ class FileTransferMetrics:
         self.metrics_dir = metrics_dir
         self.algo = algo.lower()
         self.direction = direction
+        self.cc = create_congestion_control(self.algo)
 
         self.cwnd = INITIAL_CWND
         self.ssthresh = INITIAL_SSTHRESH
@@ -41,6 +595,12 @@ class FileTransferMetrics:
         self.in_fast_recovery = False
         self.phase = "SLOW_START"
 
+        # Share of DATA packets lost (retransmitted, or rebuilt from parity),
+        # averaged over samples of LOSS_SAMPLE_PACKETS sent; None until the first
+        self.loss_rate = None
+        self._sample_sent = 0
+        self._sample_lost = 0
+
         self.metrics_dir.mkdir(parents=True, exist_ok=True)
         self.csv_path = self.metrics_dir / f"room_{room}_file_metrics.csv"
         self.csv_file = self.csv_path.open("a", newline="", encoding="utf-8")
@@ -67,11 +627,48 @@ class FileTransferMetrics:
 
     def on_start(self):
         """Log the start of a transfer."""
+        self.started = time.time()
         self._log(0, None, "START")
 
-    def on_complete(self):
-        """Log the completion of a transfer."""
+    def on_complete(self, logical_bytes: Optional[int] = None, wire_bytes: Optional[int] = None,
+                    compression: Optional[str] = None):
+        """
+        Log the completion of a transfer. Given the sender's payload byte
+        counts, also append a row to the room's transfer summary: bytes
+        before and after compression, and their ratio.
+        """
         self._log(0, None, "COMPLETE")
+        if logical_bytes is None:
+            return
+        path = self.metrics_dir / f"room_{self.room}_transfer_summary.csv"
+        with path.open("a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if f.tell() == 0:
+                writer.writerow([
+                    "ts", "room", "file", "direction", "algo", "compression",
+                    "logical_bytes", "wire_bytes", "ratio", "duration_s"
+                ])
+            now = time.time()
+            writer.writerow([
+                now, self.room, self.filename, self.direction, self.algo, compression or "none",
+                logical_bytes, wire_bytes, round(logical_bytes / wire_bytes, 3) if wire_bytes else "",
+                round(now - getattr(self, "started", now), 3)
+            ])
+        if compression:
+            print(f"[{self.algo.upper()} {self.direction.upper()}] COMPRESSION {compression}: "
+                  f"{logical_bytes} → {wire_bytes} bytes on the wire")
+
+    def on_packets_sent(self, count: int = 1):
+        self._sample_sent += count
+        if self._sample_sent < LOSS_SAMPLE_PACKETS:
+            return
+        sample = min(1.0, self._sample_lost / self._sample_sent)
+        self.loss_rate = sample if self.loss_rate is None else (1 - LOSS_EWMA) * self.loss_rate + LOSS_EWMA * sample
+        self._sample_sent = 0
+        self._sample_lost = 0
+
+    def on_packets_lost(self, count: int = 1):
+        self._sample_lost += count
 
     def _update_phase(self):
         new_phase = (
@@ -83,7 +680,11 @@ class FileTransferMetrics:
             print(f"[{self.algo.upper()} {self.direction.upper()}] PHASE CHANGE: {self.phase} → {new_phase}")
             self.phase = new_phase
 
-    def on_ack(self, ack_seq: int, bytes_transferred: int, rtt_ms: float) -> bool:
+    def on_ack(self, ack_seq: int, bytes_transferred: int, rtt_ms: float, delivered: int = 1) -> bool:
+        """
+        Process one ACK; `delivered` is how many packets it newly reports
+        received. Returns True when it was the third duplicate (fast retransmit).
+        """
         self.seq += 1
 
         if self.srtt is None:
@@ -94,20 +695,11 @@ class FileTransferMetrics:
             self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt_ms
         self.rto = self.srtt + 4 * self.rttvar
         self.rto = max(self.rto, MIN_RTO)
+        self.cc.on_ack_received(self, rtt_ms, delivered)
 
         if ack_seq > self.last_ack:
             old_cwnd = self.cwnd
-
-            if self.in_fast_recovery:
-                self.cwnd = self.ssthresh
-                self.in_fast_recovery = False
-
-            if self.cwnd < self.ssthresh:
-                self.cwnd += 1.0
-                rule = "SLOW_START (+1/ACK)"
-            else:
-                self.cwnd += 1.0 / self.cwnd
-                rule = "CONG_AVOID (+1/cwnd)"
+            rule = self.cc.on_new_ack(self, ack_seq - self.last_ack, rtt_ms)
 
             self.last_ack = ack_seq
             self.dup_acks = 0
@@ -125,39 +717,38 @@ class FileTransferMetrics:
             self.dup_acks += 1
             print(f"[{self.algo.upper()} {self.direction.upper()}] DUP_ACK #{self.dup_acks} for ACK={ack_seq}")
 
-            if self.dup_acks == 3:
-                self.ssthresh = max(self.cwnd / 2.0, 2.0)
-
-                if self.algo == "tahoe":
-                    self.cwnd = 1.0
-                    self.in_fast_recovery = False
-                    action = "RESET_TO_1 (Tahoe)"
-                else:
-                    self.cwnd = self.ssthresh + 3.0
-                    self.in_fast_recovery = True
-                    action = "FAST_RECOVERY (Reno)"
-
-                print(
-                    f"[{self.algo.upper()} {self.direction.upper()}] FAST_RETRANSMIT | "
-                    f"lost_seq={self.last_ack + 1} | cwnd={self.cwnd:.2f} | ssthresh={self.ssthresh:.2f} | {action}"
-                )
-
-                self._update_phase()
-                self._log(0, None, f"FAST_RETRANSMIT_{self.algo.upper()}")
+            if self.dup_acks == DUP_THRESH:
+                self._fast_retransmit()
                 return True
 
-            if self.in_fast_recovery:
-                self.cwnd += 1.0
+            if self.cc.on_recovery_dup_ack(self):
                 self._log(0, None, "DUP_ACK_RECOVERY")
 
             return False
         return False
 
+    def _fast_retransmit(self):
+        action = self.cc.on_fast_retransmit(self)
+
+        print(
+            f"[{self.algo.upper()} {self.direction.upper()}] FAST_RETRANSMIT | "
+            f"lost_seq={self.last_ack + 1} | cwnd={self.cwnd:.2f} | ssthresh={self.ssthresh:.2f} | {action}"
+        )
+
+        self._update_phase()
+        self._log(0, None, f"FAST_RETRANSMIT_{self.algo.upper()}")
+
+    def on_sack_loss(self):
+        """
+        SACK showed a loss before three dup ACKs arrived (small windows).
+        Respond exactly as fast retransmit would, once per recovery episode.
+        """
+        self.dup_acks = max(self.dup_acks, DUP_THRESH)
+        self._fast_retransmit()
+
     def on_loss(self):
         self.seq += 1
-        self.ssthresh = max(self.cwnd / 2.0, 2.0)
-        self.cwnd = 1.0
-        self.in_fast_recovery = False
+        self.cc.on_timeout(self)
         self.dup_acks = 0
         self.rto = min(self.rto * 2.0, 30000.0)
 
@@ -176,22 +767,230 @@ class FileTransferMetrics:
             pass
 
 
+class ReceiveBudget:
+    """
+    Receive-window bytes the FileReceivers of one process may hold between
+    them. Each receiver always gets its initial window; growth beyond that
+    comes out of what is left.
+    """
+
+    def __init__(self, limit: int = RCV_MEMORY_BUDGET):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, want: int, floor: int = 0) -> int:
+        """Take up to `want` bytes, and at least `floor` even past the limit; returns the grant."""
+        with self.lock:
+            grant = max(floor, min(want, self.limit - self.used))
+            self.used += grant
+            return grant
+
+    def release(self, nbytes: int):
+        with self.lock:
+            self.used = max(0, self.used - nbytes)
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "used": self.used}
+
+
 class FileReceiver:
-    def __init__(self, total_packets: int, max_buf: int = DEFAULT_RWND):
+    """
+    Reassembles an inbound transfer.
+
+    With `path` set, chunks are written straight to their offset in a
+    preallocated file as they arrive, so memory per session is only the
+    out-of-order window bitmap no matter how large the file is. Without a
+    path, chunks land in a preallocated in-memory buffer (client downloads).
+    `chunk_size` is the size the session negotiated in its handshake.
+
+    `resume` is a state dict from checkpoint(): the partial file at `path`
+    is reopened as-is and the chunks it records count as received.
+
+    Parity packets (add_parity) are kept until their group is complete;
+    once only one of its chunks is missing, that chunk is rebuilt from the
+    parity and the others, read back from where they were written.
+
+    ACKs are delayed: after add_chunk, ack_due() says whether one should
+    go out now, which it does every `ack_every` packets and for anything
+    out of order, a gap left or filled, or the transfer's last chunk.
+    Otherwise the caller sends it once ack_delay() runs out and reports
+    each ACK it sends with ack_sent().
+
+    The receive window is `max_buf` packets when given. Otherwise it starts
+    at RCV_WINDOW_INITIAL bytes and autotunes: it grows to twice the bytes
+    that arrive per `rtt` (seconds, measured in the handshake), up to
+    RCV_WINDOW_MAX and whatever `budget` has left. With `sock`, its
+    SO_RCVBUF grows along with the window.
+    """
+
+    def __init__(self, total_packets: int, max_buf: Optional[int] = None,
+                 path: Optional[Path] = None, chunk_size: int = CHUNK_SIZE,
+                 resume: Optional[dict] = None, ack_every: int = ACK_EVERY,
+                 budget: Optional[ReceiveBudget] = None, rtt: Optional[float] = None,
+                 sock: Optional[socket.socket] = None):
         self.total_packets = total_packets
-        self.chunks = {}
-        self.received = set()
-        self.out_of_order = set()
+        self.chunk_size = chunk_size
         self.next_expected = 1
-        self.max_buf = max_buf
-        self.rwnd = max_buf
+        self.path = path
+        self.size = 0
+
+        # Receive window, and the share of `budget` it holds; the tuner
+        # counts bytes arriving since _tune_start
+        self.autotune = max_buf is None
+        self.budget = budget
+        self.rtt = rtt
+        self.sock = sock
+        self._reserved = 0
+        if max_buf is None:
+            self.window_bytes = RCV_WINDOW_INITIAL
+            if budget is not None:
+                self._reserved = budget.reserve(RCV_WINDOW_INITIAL, floor=RCV_WINDOW_INITIAL)
+            if sock is not None:
+                size_socket_buffers(sock, rcvbuf=self.window_bytes)
+        else:
+            self.window_bytes = max_buf * chunk_size
+        self.max_buf = max(1, self.window_bytes // chunk_size)
+        self.rwnd = self.max_buf
+        self._tune_start = None
+        self._tune_bytes = 0
+
+        # Bit k set => seq (next_expected + k) has been received
+        self.window_bits = 0
+
+        # Group first seq -> (last seq, length XOR, parity payload)
+        self.parity = {}
+        self.repaired = 0
+
+        # Delayed ACKs: packets taken since the last ACK, whether one of
+        # them must be acknowledged at once, and when a held-back ACK is due
+        self.ack_every = max(1, ack_every)
+        self.unacked = 0
+        self.ack_urgent = False
+        self.ack_deadline = 0.0
+
+        self._fd = None
+        self._buf = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+            if resume is None:
+                flags |= os.O_TRUNC
+            self._fd = os.open(path, flags)
+            os.ftruncate(self._fd, total_packets * chunk_size)
+        else:
+            self._buf = bytearray(total_packets * chunk_size)
+
+        if resume is not None:
+            self.next_expected = int(resume["next_expected"])
+            self.window_bits = int(resume["window_bits"])
+            self.size = int(resume.get("size", 0))
+            self._recalc_rwnd()
+
+    @property
+    def resident_bytes(self) -> int:
+        """Private memory held for payload (zero when streaming to disk)."""
+        return len(self._buf) if self._buf is not None else 0
 
     def _recalc_rwnd(self):
-        free = self.max_buf - len(self.out_of_order)
+        # Prefilled chunks beyond the window take no buffer space
+        free = self.max_buf - (self.window_bits & ((1 << self.max_buf) - 1)).bit_count()
         self.rwnd = free if free > 0 else 0
 
+    def advertised_window(self, in_bytes: bool = False) -> int:
+        """The window to put in an ACK: free packets, or free bytes for "rwnd": "bytes" sessions."""
+        return self.rwnd * self.chunk_size if in_bytes else self.rwnd
+
+    def _autotune(self, nbytes: int):
+        """
+        Dynamic right-sizing, as Linux tunes its receive buffers: keep the
+        window at twice the bytes that arrive per RTT. A sender the window
+        holds back fills it every RTT, so the window doubles each round
+        trip until congestion control, not flow control, sets the pace.
+        """
+        now = time.monotonic()
+        if self._tune_start is None:
+            self._tune_start = now
+        self._tune_bytes += nbytes
+        rtt = self.rtt or RCV_TUNE_DEFAULT_RTT
+        elapsed = now - self._tune_start
+        if elapsed < max(rtt, RCV_TUNE_MIN_INTERVAL):
+            return
+        target = min(int(2 * self._tune_bytes * rtt / elapsed), RCV_WINDOW_MAX)
+        self._tune_start = now
+        self._tune_bytes = 0
+        grow = target - self.window_bytes
+        if grow < self.chunk_size:
+            return
+        if self.budget is not None:
+            grow = self.budget.reserve(grow)
+            self._reserved += grow
+        self.window_bytes += grow
+        self.max_buf = max(1, self.window_bytes // self.chunk_size)
+        if self.sock is not None:
+            size_socket_buffers(self.sock, rcvbuf=self.window_bytes)
+
+    def _write_at(self, offset: int, data: bytes):
+        if self._fd is None:
+            self._buf[offset:offset + len(data)] = data
+        elif hasattr(os, "pwrite"):
+            os.pwrite(self._fd, data, offset)
+        else:
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            os.write(self._fd, data)
+
+    def _read_at(self, offset: int, length: int) -> bytes:
+        if self._fd is None:
+            return bytes(self._buf[offset:offset + length])
+        if hasattr(os, "pread"):
+            return os.pread(self._fd, length, offset)
+        os.lseek(self._fd, offset, os.SEEK_SET)
+        return os.read(self._fd, length)
+
+    def has_chunk(self, seq: int) -> bool:
+        return seq < self.next_expected or bool(self.window_bits >> (seq - self.next_expected) & 1)
+
+    def add_parity(self, first: int, k: int, len_xor: int, payload) -> int:
+        """Take the parity of chunks first..first+k-1; returns how many chunks it rebuilt."""
+        last = min(first + k - 1, self.total_packets)
+        if k < 1 or last < self.next_expected or len(payload) > self.chunk_size:
+            return 0
+        self.parity[first] = (last, len_xor, bytes(payload))
+        return self._repair(first)
+
+    def _repair(self, first: int) -> int:
+        last, len_xor, payload = self.parity[first]
+        missing = [seq for seq in range(max(first, self.next_expected), last + 1) if not self.has_chunk(seq)]
+        if len(missing) > 1:
+            return 0
+        del self.parity[first]
+        if not missing:
+            return 0
+
+        lost = missing[0]
+        acc = int.from_bytes(payload, "little")
+        for seq in range(first, last + 1):
+            if seq == lost:
+                continue
+            # Every chunk but the file's last is full-sized
+            length = self.chunk_size if seq < self.total_packets else self.size - (seq - 1) * self.chunk_size
+            acc ^= int.from_bytes(self._read_at((seq - 1) * self.chunk_size, length), "little")
+            len_xor ^= length
+        if not 0 < len_xor <= self.chunk_size or lost >= self.next_expected + self.max_buf:
+            return 0
+        self.add_chunk(lost, acc.to_bytes(self.chunk_size, "little")[:len_xor])
+        self.repaired += 1
+        return 1
+
     def add_chunk(self, seq: int, data: bytes):
-        if seq < self.next_expected:
+        if not self.unacked:
+            self.ack_deadline = time.monotonic() + ACK_DELAY_MS / 1000.0
+        self.unacked += 1
+        if seq != self.next_expected:
+            # Duplicate, reordered or beyond the window: the sender needs to hear now
+            self.ack_urgent = True
+
+        if seq < self.next_expected or seq > self.total_packets:
             self._recalc_rwnd()
             return
 
@@ -199,91 +998,725 @@ class FileReceiver:
             self._recalc_rwnd()
             return
 
-        if seq in self.received:
+        bit = 1 << (seq - self.next_expected)
+        if self.window_bits & bit:
             self._recalc_rwnd()
             return
 
-        self.chunks[seq] = data
-        self.received.add(seq)
+        self._write_at((seq - 1) * self.chunk_size, data)
+        self.window_bits |= bit
+        if self.autotune:
+            self._autotune(len(data))
+        if seq == self.total_packets:
+            self.size = (seq - 1) * self.chunk_size + len(data)
 
-        if seq != self.next_expected:
-            self.out_of_order.add(seq)
-
-        while self.next_expected in self.received:
-            if self.next_expected in self.out_of_order:
-                self.out_of_order.remove(self.next_expected)
+        while self.window_bits & 1:
+            self.window_bits >>= 1
             self.next_expected += 1
 
+        if self.window_bits or self.next_expected != seq + 1 or self.is_complete():
+            # Holes remain above, one was just filled, or nothing more is coming
+            self.ack_urgent = True
+
+        self._recalc_rwnd()
+
+        if self.parity:
+            # A late chunk may leave a group with only one gap
+            for first, (last, _, _) in list(self.parity.items()):
+                if last < self.next_expected:
+                    del self.parity[first]
+                elif first <= seq <= last and first in self.parity:
+                    self._repair(first)
+
+    def prefill(self, offset: int, data):
+        """Write bytes the server already holds (a deduplicated block) at `offset`; see mark_prefilled()."""
+        self._write_at(offset, data)
+
+    def mark_prefilled(self, offset: int, length: int, file_size: int):
+        """Count every chunk lying wholly inside the prefilled byte range as received."""
+        end = offset + length
+        first = -(-offset // self.chunk_size) + 1
+        last = self.total_packets if end >= file_size else end // self.chunk_size
+        first = max(first, self.next_expected)
+        if last < first:
+            return
+        self.window_bits |= ((1 << (last - first + 1)) - 1) << (first - self.next_expected)
+        if last == self.total_packets:
+            self.size = file_size
+        # Slide past the run of received chunks at the front
+        run = (~self.window_bits & (self.window_bits + 1)).bit_length() - 1
+        self.window_bits >>= run
+        self.next_expected += run
         self._recalc_rwnd()
 
+    def ack_due(self, requested: bool = False) -> bool:
+        """Whether the packets taken since the last ACK need one now; `requested` per ack_requested()."""
+        return bool(self.unacked) and (requested or self.ack_urgent or self.unacked >= self.ack_every)
+
+    def ack_delay(self) -> Optional[float]:
+        """Seconds until a held-back ACK is due; None when every packet has been acknowledged."""
+        if not self.unacked:
+            return None
+        return max(0.0, self.ack_deadline - time.monotonic())
+
+    def ack_sent(self):
+        self.unacked = 0
+        self.ack_urgent = False
+
     def get_ack_seq(self) -> int:
         return self.next_expected - 1
 
+    def get_sack_blocks(self, max_blocks: int = MAX_SACK_BLOCKS) -> List[Tuple[int, int]]:
+        """Inclusive seq ranges received above the cumulative ACK point."""
+        blocks = []
+        bits = self.window_bits >> 1
+        seq = self.next_expected + 1
+        while bits and len(blocks) < max_blocks:
+            # Skip the hole, then measure the run of received seqs
+            gap = (bits & -bits).bit_length() - 1
+            bits >>= gap
+            seq += gap
+            run = (~bits & (bits + 1)).bit_length() - 1
+            blocks.append((seq, seq + run - 1))
+            bits >>= run
+            seq += run
+        return blocks
+
     def is_complete(self) -> bool:
-        return len(self.received) == self.total_packets
+        return self.next_expected > self.total_packets
+
+    def checkpoint(self) -> dict:
+        """
+        Flush the partial file and return the state FileReceiver(resume=...)
+        needs to pick up where this one stopped. The state is captured
+        before the flush, so every chunk it lists is on disk.
+        """
+        state = self.resume_state()
+        self.flush()
+        return state
+
+    def resume_state(self) -> dict:
+        """The state checkpoint() returns, without the flush; it holds once flush() has run."""
+        return {"next_expected": self.next_expected, "window_bits": self.window_bits, "size": self.size}
+
+    def flush(self):
+        """Force the chunks written so far to disk. Safe to call from another thread while chunks arrive."""
+        if self._fd is not None:
+            getattr(os, "fdatasync", os.fsync)(self._fd)
+
+    def close(self):
+        if self._reserved:
+            self.budget.release(self._reserved)
+            self._reserved = 0
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+    def discard(self):
+        """Drop an unfinished transfer and its partial file."""
+        self.close()
+        if self.path is not None:
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
 
     def finalize_to_bytes(self) -> bytes:
-        return b"".join(self.chunks.get(i, b"") for i in range(1, self.total_packets + 1))
+        if self._buf is not None:
+            return bytes(self._buf[:self.size])
+        os.ftruncate(self._fd, self.size)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        with os.fdopen(os.dup(self._fd), "rb") as f:
+            return f.read()
+
+    def seal(self):
+        """Trim the partial file to the bytes received and close it, ready to be moved into place."""
+        try:
+            os.ftruncate(self._fd, self.size)
+        finally:
+            self.close()
 
     def finalize_to_file(self, path: Path):
-        with open(path, "wb") as f:
-            for i in range(1, self.total_packets + 1):
-                f.write(self.chunks.get(i, b""))
+        if self._fd is None:
+            with open(path, "wb") as f:
+                f.write(memoryview(self._buf)[:self.size])
+            return
+
+        self.seal()
+        os.replace(self.path, path)
+
+
+def map_file(path: Path):
+    """
+    Map a file read-only for zero-copy sending.
+
+    Returns an mmap (the OS page cache backs it, so it costs no private
+    memory) or b"" for empty files, which cannot be mapped.
+    """
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def process_memory() -> dict:
+    """Resident set size of this process, split into file-backed and anonymous pages when known."""
+    stats = {}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile"):
+                    stats[key] = int(value.split()[0]) * 1024
+    except OSError:
+        try:
+            import resource
+            stats["VmHWM"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            pass
+    return stats
 
 
 class FileSender:
-    def __init__(self, room: str, filename: str, data: bytes,
+    def __init__(self, room: str, filename: str, data,
                  addr: Tuple[str, int], sock: socket.socket,
                  metrics: FileTransferMetrics, loss_prob: float = 0.0,
-                 session_id: Optional[str] = None):
+                 session_id: Optional[str] = None, wire: str = WIRE_JSON,
+                 sack: bool = False, gso: bool = True, chunk_size: int = CHUNK_SIZE,
+                 offset: int = 0, length: Optional[int] = None,
+                 compression: Optional[Tuple[str, int]] = None, fec: bool = False,
+                 byte_window: bool = False, release: Optional[Callable[[], None]] = None):
+        """
+        `data` may be bytes or any buffer, including an mmap from map_file().
+        Chunks are sliced out of a memoryview, so no packet copies the file.
+        A mapping shared with other senders (FileCache) comes with `release`,
+        which close() calls instead of unmapping it.
+
+        With `sack`, the sender keeps a scoreboard of selectively acknowledged
+        packets and repairs every hole the scoreboard marks lost, instead of
+        only window_base.
+
+        With `gso` on a Linux socket that supports UDP_SEGMENT, binary DATA
+        packets of one window go out in batches of up to 64 KB per
+        sendmsg. If the kernel rejects a batch the sender falls back to one
+        sendmsg per packet for the rest of the transfer.
+
+        `chunk_size` is the payload per DATA packet the session negotiated.
+
+        `offset`/`length` send only that byte range of `data`: seq 1 is the
+        chunk starting at `offset`, and `total_packets` counts the range.
+
+        `compression` is the session's negotiated (codec, level). It is
+        dropped when a trial of a few chunks shows the data doesn't shrink;
+        otherwise chunks are compressed on the shared pool ahead of the
+        window, and a chunk whose batch isn't ready when it is due goes out
+        raw rather than stalling the send loop.
+
+        With `fec`, a parity packet follows every group of K new data
+        packets; K adapts to the loss rate in the metrics.
+
+        With `byte_window` the receiver advertises its window in bytes
+        (update_rwnd converts it to packets of this session's chunk size).
+        """
         self.room = room
         self.filename = filename
-        self.data = data
+        self.source = data
+        self._release = release
+        self._view = memoryview(data)
+        end = len(data) if length is None else min(len(data), offset + length)
+        self.offset = offset
+        self.data = self._view[offset:end]
         self.addr = addr
         self.sock = sock
         self.metrics = metrics
         self.loss_prob = loss_prob
         self.session_id = session_id
+        self.wire = wire
+        self.sack = sack
 
-        self.total_packets = (len(data) + CHUNK_SIZE - 1) // CHUNK_SIZE
+        self.chunk_size = chunk_size
+        self.total_packets = (len(self.data) + chunk_size - 1) // chunk_size
         self.sent_times = {}
         self.retries = {}
         self.lock = threading.Lock()
 
-    def send_window(self, next_seq: int, window_base: int, rwnd: int) -> int:
+        # SACK scoreboard: seqs above the cumulative ACK the receiver holds,
+        # when each hole was last retransmitted, and the highest seq sent when
+        # the current recovery episode began (one cwnd cut per episode)
+        self.sacked = set()
+        # Chunks the receiver kept from an interrupted earlier session: never
+        # sent, and kept out of loss detection since no send produced them
+        self.held = set()
+        self.rexmit_times = {}
+        self.highest_sent = 0
+        self.recovery_point = 0
+        # Last seq of the window being sent: it carries FLAG_ACK_NOW
+        self.window_end = 0
+
+        # Receive window in packets, as of the last ACK, and the SO_SNDBUF
+        # size last asked for to hold a whole window
+        self.byte_window = byte_window
+        self.rwnd = DEFAULT_RWND
+        self._sndbuf = 0
+
+        # Token bucket (in packets) refilled at the strategy's pacing rate
+        self.pacing_tokens = PACING_MIN_BURST
+        self.pacing_stamp = time.time()
+
+        # egress.Flow sharing a server-wide rate cap, set once the session
+        # is admitted; None sends as fast as the windows allow
+        self.egress = None
+
+        if compression is not None and not looks_compressible(self.data, chunk_size, compression):
+            compression = None
+        self.compression = compression
+        # Batch index -> pending Future, or the batch's compressed chunks
+        # (None for a chunk that goes raw); batches below _batch_floor are
+        # acknowledged and dropped, those below _compress_skip go raw
+        self._batches = {}
+        self._jobs = []
+        self._batch_floor = 0
+        self._compress_skip = 0
+        self._compress_backoff = 1
+        # Chunk bytes sent, before and after compression
+        self.logical_bytes = 0
+        self.wire_bytes = 0
+
+        # FEC: the group the next parity covers, the receiver's last
+        # reported count of rebuilt chunks, and parity packets sent
+        self.fec = fec
+        self.fec_first = 1
+        self.fec_last = min(FEC_INITIAL_GROUP, self.total_packets)
+        self.fec_repaired = 0
+        self.parity_sent = 0
+
+        # Scatter-gather send avoids joining header and payload (not on Windows)
+        self._sendmsg = self.wire == WIRE_BINARY and hasattr(sock, "sendmsg")
+        # GSO needs equal-sized segments, which compressed chunks are not
+        self._gso = gso and self._sendmsg and compression is None and gso_supported(sock)
+        self.gso_batch = min(GSO_MAX_SEGMENTS, GSO_MAX_BYTES // (FRAME_HEADER.size + chunk_size))
+        # Send syscalls issued, for the syscalls-per-MB benchmark
+        self.send_calls = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        """Private memory this sender pins for its payload (mapped files cost none)."""
+        if isinstance(self.source, mmap.mmap):
+            return 0
+        return len(self.data)
+
+    def close(self):
+        """Release the payload buffer: hand a shared mapping back, unmap one from map_file()."""
+        # Compression jobs hold views of the payload until they finish
+        for job in self._jobs:
+            job.cancel()
+        wait(self._jobs)
+        self._jobs = []
+        self._batches = {}
+        self.data.release()
+        self._view.release()
+        if self._release is not None:
+            self._release()
+        elif isinstance(self.source, mmap.mmap):
+            self.source.close()
+
+    def _prefetch(self, window_base: int, window: int):
+        """Queue compression of the batches from the window's start to COMPRESS_LOOKAHEAD past its end."""
+        first = (window_base - 1) // COMPRESS_BATCH
+        for index in range(self._batch_floor, first):
+            self._batches.pop(index, None)
+        self._batch_floor = max(self._batch_floor, first)
+        if self._jobs:
+            self._jobs = [job for job in self._jobs if not job.done()]
+
+        last = min((window_base + window - 2) // COMPRESS_BATCH + COMPRESS_LOOKAHEAD,
+                   (self.total_packets - 1) // COMPRESS_BATCH)
+        for index in range(first, last + 1):
+            if index in self._batches:
+                continue
+            if index < self._compress_skip:
+                self._batches[index] = None
+                continue
+            job = compress_pool().submit(self._compress_job, index)
+            self._batches[index] = job
+            self._jobs.append(job)
+
+    def _compress_job(self, index: int):
+        # Slices the payload only once running, so a cancelled job pins nothing
+        span = COMPRESS_BATCH * self.chunk_size
+        return compress_batch(self.data[index * span:(index + 1) * span], self.chunk_size, self.compression)
+
+    def _compressed(self, seq: int) -> Optional[bytes]:
+        """Chunk `seq` compressed, or None to send it raw."""
+        index, pos = divmod(seq - 1, COMPRESS_BATCH)
+        batch = self._batches.get(index)
+        if isinstance(batch, Future):
+            if not batch.done():
+                return None
+            try:
+                batch, saved = batch.result()
+            except Exception:
+                batch, saved = None, 0.0
+            if saved < COMPRESS_MIN_SAVING:
+                # Incompressible stretch: don't try the next few batches
+                self._compress_skip = max(self._compress_skip, index + 1 + self._compress_backoff)
+                self._compress_backoff = min(self._compress_backoff * 2, COMPRESS_MAX_BACKOFF)
+                batch = None
+            else:
+                self._compress_backoff = 1
+            self._batches[index] = batch
+        return batch[pos] if batch is not None else None
+
+    def _payload(self, seq: int) -> Tuple[int, bytes]:
+        """Flags and payload of DATA packet `seq`, counting its bytes."""
+        offset = (seq - 1) * self.chunk_size
+        chunk = self.data[offset:offset + self.chunk_size]
+        self.logical_bytes += len(chunk)
+        flags = FLAG_ACK_NOW if seq == self.window_end else 0
+        packed = self._compressed(seq) if self.compression is not None else None
+        if packed is not None:
+            self.wire_bytes += len(packed)
+            return flags | FLAG_COMPRESSED, packed
+        self.wire_bytes += len(chunk)
+        return flags, chunk
+
+    def build_packet(self, seq: int) -> bytes:
+        """Encode DATA packet `seq` in this session's wire format."""
+        flags, payload = self._payload(seq)
+
+        if self.wire == WIRE_BINARY:
+            return pack_data(self.session_id, seq, self.total_packets, payload, flags)
+
+        pkt = {
+            "type": "DATA",
+            "room": self.room,
+            "filename": self.filename,
+            "seq": seq,
+            "total": self.total_packets,
+            "payload_b64": base64.b64encode(payload).decode("ascii"),
+            "session_id": self.session_id
+        }
+        if flags & FLAG_COMPRESSED:
+            pkt["compressed"] = True
+        if flags & FLAG_ACK_NOW:
+            pkt["ack_now"] = True
+        return json.dumps(pkt).encode("utf-8")
+
+    def _frame(self, seq: int) -> Tuple[bytes, memoryview]:
+        flags, payload = self._payload(seq)
+        header = FRAME_HEADER.pack(WIRE_MAGIC, PKT_DATA, flags, session_to_bytes(self.session_id),
+                                   seq, self.total_packets)
+        return header, payload
+
+    def _transmit(self, seq: int):
+        self.send_calls += 1
+        if self._sendmsg:
+            header, payload = self._frame(seq)
+            self.sock.sendmsg([header, payload], [], 0, self.addr)
+            self._charge(len(header) + len(payload))
+        else:
+            pkt = self.build_packet(seq)
+            self.sock.sendto(pkt, self.addr)
+            self._charge(len(pkt))
+
+    def _charge(self, nbytes: int):
+        """Count a datagram that went out against the session's egress share."""
+        if self.egress is not None:
+            self.egress.charge(nbytes)
+
+    def _transmit_batch(self, seqs: List[int]):
+        """
+        Send `seqs` (ascending) with one UDP_SEGMENT sendmsg. Every packet but
+        the file's last is exactly one segment long, and the last one has the
+        highest seq, so the kernel's "only the final segment may be short"
+        rule always holds.
+        """
+        if len(seqs) == 1 or not self._gso:
+            for seq in seqs:
+                self._transmit(seq)
+            return
+
+        iov = []
+        for seq in seqs:
+            iov.extend(self._frame(seq))
+        segment = struct.pack("=H", FRAME_HEADER.size + self.chunk_size)
+        try:
+            self.send_calls += 1
+            self.sock.sendmsg(iov, [(SOL_UDP, UDP_SEGMENT, segment)], 0, self.addr)
+            self._charge(sum(len(part) for part in iov))
+        except OSError as e:
+            # EIO/EINVAL: no segmentation offload on this path after all
+            print(f"[{self.metrics.algo.upper()} {self.metrics.direction.upper()}] GSO disabled: {e}")
+            self._gso = False
+            for seq in seqs:
+                self._transmit(seq)
+
+    def fec_group(self) -> int:
+        """Data packets per parity packet for the loss rate seen so far."""
+        loss = self.metrics.loss_rate
+        if loss is None:
+            return FEC_INITIAL_GROUP
+        if loss <= 0.0:
+            return FEC_MAX_GROUP
+        return max(FEC_MIN_GROUP, min(FEC_MAX_GROUP, round(FEC_COVERAGE / loss)))
+
+    def _send_parity(self, first: int, last: int):
+        chunks = [self.data[(seq - 1) * self.chunk_size:seq * self.chunk_size] for seq in range(first, last + 1)]
+        len_xor = 0
+        for chunk in chunks:
+            len_xor ^= len(chunk)
+        payload = xor_chunks(chunks).to_bytes(self.chunk_size, "little")
+        self.parity_sent += 1
+        if random.random() < self.loss_prob:
+            return
+        if self.wire == WIRE_BINARY:
+            pkt = pack_parity(self.session_id, first, last - first + 1, len_xor, payload)
+        else:
+            pkt = json.dumps({
+                "type": "PARITY",
+                "room": self.room,
+                "filename": self.filename,
+                "session_id": self.session_id,
+                "first": first,
+                "k": last - first + 1,
+                "len_xor": len_xor,
+                "payload_b64": base64.b64encode(payload).decode("ascii")
+            }).encode("utf-8")
+        self.send_calls += 1
+        try:
+            self.sock.sendto(pkt, self.addr)
+        except OSError:
+            return
+        self._charge(len(pkt))
+
+    def _fec_advance(self, seq: int) -> bool:
+        """Send the parity of every group that ends at or before `seq`; True if any went out."""
+        sent = False
+        while self.fec_first <= self.total_packets and self.fec_last <= seq:
+            self._send_parity(self.fec_first, self.fec_last)
+            self.fec_first = self.fec_last + 1
+            self.fec_last = min(self.fec_first + self.fec_group() - 1, self.total_packets)
+            sent = True
+        return sent
+
+    def retransmit(self, seq: int):
+        """Resend a single packet immediately (fast retransmit path)."""
+        if seq < 1 or seq > self.total_packets:
+            return
+        # Benchmarks drive bare senders without metrics
+        if self.metrics is not None:
+            self.metrics.on_packets_lost()
+        self.rexmit_times[seq] = time.time()
+        try:
+            self._transmit(seq)
+        except:
+            pass
+
+    def handle_ack(self, ack_seq: int, sack: Optional[List[Tuple[int, int]]] = None,
+                   repaired: Optional[int] = None):
+        """
+        Process one ACK: sample RTT, drive congestion control and repair losses.
+
+        Fast retransmit resends window_base after three dup ACKs; with SACK
+        enabled every other hole the scoreboard marks lost is resent as well.
+        `repaired` is the receiver's running count of chunks rebuilt from
+        parity, each one a loss for the FEC group size.
+
+        The scoreboard is kept either way: it tells how many packets a
+        delayed ACK covers, which congestion control counts by.
+        """
+        if repaired:
+            self.metrics.on_packets_lost((int(repaired) - self.fec_repaired) & 0xFFFF)
+            self.fec_repaired = int(repaired) & 0xFFFF
+        sent_t = self.sent_times.get(ack_seq)
+        if sent_t is None:
+            sent_t = self.sent_times.get(self.metrics.last_ack + 1, time.time())
+        rtt_ms = (time.time() - sent_t) * 1000.0
+
+        delivered = self.newly_delivered(ack_seq, sack)
+        if self.metrics.on_ack(ack_seq, delivered * self.chunk_size, rtt_ms, delivered):
+            self.recovery_point = self.highest_sent
+            self.retransmit(self.metrics.last_ack + 1)
+
+        self.update_scoreboard(ack_seq, sack)
+        if self.sack:
+            self.retransmit_lost(self.metrics.last_ack + 1)
+
+    def newly_delivered(self, ack_seq: int, blocks: Optional[List[Tuple[int, int]]]) -> int:
+        """
+        Packets an ACK reports received for the first time: its cumulative
+        advance plus newly SACKed seqs, less those already on the scoreboard
+        and chunks held from before the transfer.
+        """
+        last = self.metrics.last_ack
+        delivered = 0
+        with self.lock:
+            if ack_seq > last:
+                delivered = ack_seq - last
+                if self.sacked:
+                    delivered -= sum(1 for seq in self.sacked if seq <= ack_seq)
+                if self.held:
+                    delivered -= sum(1 for seq in range(last + 1, ack_seq + 1) if seq in self.held)
+            for start, end in blocks or ():
+                for seq in range(max(start, ack_seq + 1, last + 1), min(end, self.total_packets) + 1):
+                    if seq not in self.sacked and seq not in self.held:
+                        delivered += 1
+        return max(delivered, 0)
+
+    def update_rwnd(self, advertised: int):
+        """Take the receive window an ACK advertised; SO_SNDBUF grows to hold all of it."""
+        self.rwnd = max(0, advertised // self.chunk_size if self.byte_window else advertised)
+        wanted = self.rwnd * (FRAME_HEADER.size + self.chunk_size)
+        if wanted > self._sndbuf and self.sock is not None:
+            self._sndbuf = wanted
+            size_socket_buffers(self.sock, sndbuf=wanted)
+
+    def resume_from(self, ack_seq: int, blocks: Optional[List[Tuple[int, int]]] = None):
+        """Start after `ack_seq`, skipping the `blocks` the receiver already holds."""
+        self.metrics.last_ack = max(self.metrics.last_ack, min(ack_seq, self.total_packets))
+        for start, end in blocks or ():
+            self.held.update(range(max(start, ack_seq + 1), min(end, self.total_packets) + 1))
+
+    def update_scoreboard(self, ack_seq: int, blocks: Optional[List[Tuple[int, int]]]):
+        with self.lock:
+            if self.sacked and min(self.sacked) <= ack_seq:
+                self.sacked = {seq for seq in self.sacked if seq > ack_seq}
+            for start, end in blocks or ():
+                seqs = range(max(start, ack_seq + 1), min(end, self.total_packets) + 1)
+                # Chunks the receiver had before the transfer were never sent:
+                # they say nothing about what was lost below them
+                self.sacked.update(seqs if not self.held else (seq for seq in seqs if seq not in self.held))
+
+    def retransmit_lost(self, window_base: int) -> int:
+        """
+        Resend holes with at least DUP_THRESH SACKed packets above them
+        (the RFC 6675 IsLost rule), each at most once per RTO. When fewer
+        than DUP_THRESH + 1 packets are outstanding the threshold drops to
+        what the window can produce (RFC 5827 early retransmit).
+        """
+        with self.lock:
+            if not self.sacked:
+                return 0
+
+            outstanding = self.highest_sent - window_base + 1
+            threshold = DUP_THRESH if outstanding > DUP_THRESH else max(1, outstanding - 1)
+
+            lost = []
+            sacked_above = 0
+            for seq in range(max(self.sacked), window_base - 1, -1):
+                if seq in self.sacked:
+                    sacked_above += 1
+                elif sacked_above >= threshold:
+                    lost.append(seq)
+
+            if lost and window_base > self.recovery_point:
+                self.metrics.on_sack_loss()
+                self.recovery_point = self.highest_sent
+
+            now = time.time()
+            rto_s = self.metrics.rto / 1000.0
+            resent = 0
+            for seq in reversed(lost):
+                if now - self.rexmit_times.get(seq, 0.0) < rto_s:
+                    continue
+                self.retransmit(seq)
+                self.sent_times[seq] = now
+                resent += 1
+
+            if resent:
+                print(
+                    f"[{self.metrics.algo.upper()} {self.metrics.direction.upper()}] "
+                    f"SACK_RETRANSMIT {resent} hole(s) from base={window_base}"
+                )
+            return resent
+
+    def _refill_pacer(self, rate: float, now: float):
+        burst = min(max(PACING_MIN_BURST, rate * PACING_QUANTUM), PACING_MAX_BURST)
+        self.pacing_tokens = min(burst, self.pacing_tokens + (now - self.pacing_stamp) * rate)
+        self.pacing_stamp = now
+
+    def next_send_delay(self) -> Optional[float]:
+        """Seconds until the pacer releases another packet; None when unpaced."""
+        rate = self.metrics.cc.pacing_rate
+        if not rate:
+            return None
+        tokens = self.pacing_tokens + (time.time() - self.pacing_stamp) * rate
+        return max(0.0, (1.0 - tokens) / rate)
+
+    def send_window(self, next_seq: int, window_base: int, rwnd: Optional[int] = None) -> int:
+        """Send what cwnd and the receive window (`rwnd` packets, else update_rwnd's) allow."""
+        if rwnd is None:
+            rwnd = self.rwnd
         with self.lock:
             if rwnd <= 0:
                 return next_seq
 
+            rate = self.metrics.cc.pacing_rate
+            if rate:
+                self._refill_pacer(rate, time.time())
+
             current_window = min(int(self.metrics.cwnd), rwnd)
+            # The receiver delays ACKs; the packet that fills the window asks for one now
+            self.window_end = min(window_base + current_window - 1, self.total_packets)
+            if self.compression is not None:
+                self._prefetch(window_base, current_window)
             requested_next = next_seq
             start_seq = max(next_seq, window_base)
             next_seq = start_seq
+            batch = []
+            # Bytes in `batch`, at most; the egress cap charges them once sent
+            batched = 0
 
             while next_seq < window_base + current_window and next_seq <= self.total_packets:
-                offset = (next_seq - 1) * CHUNK_SIZE
-                chunk = self.data[offset:offset + CHUNK_SIZE]
-
-                pkt = {
-                    "type": "DATA",
-                    "room": self.room,
-                    "filename": self.filename,
-                    "seq": next_seq,
-                    "total": self.total_packets,
-                    "payload_b64": base64.b64encode(chunk).decode("ascii"),
-                    "session_id": self.session_id
-                }
+                if self.sack and next_seq in self.sacked or next_seq in self.held:
+                    # Receiver already holds it; don't resend after a timeout
+                    next_seq += 1
+                    continue
+
+                if rate and self.pacing_tokens < 1.0:
+                    break
+                if self.egress is not None:
+                    # Each datagram is charged at its wire length once sent
+                    remaining = max(0, len(self.data) - self.highest_sent * self.chunk_size)
+                    if not self.egress.ready(remaining, batched):
+                        break
+                if rate:
+                    self.pacing_tokens -= 1.0
 
                 if random.random() >= self.loss_prob:
-                    try:
-                        self.sock.sendto(json.dumps(pkt).encode("utf-8"), self.addr)
-                    except:
-                        pass
+                    if self._gso:
+                        batch.append(next_seq)
+                        batched += FRAME_HEADER.size + self.chunk_size
+                        if len(batch) == self.gso_batch:
+                            self._send_batch(batch)
+                            batch = []
+                            batched = 0
+                    else:
+                        try:
+                            self._transmit(next_seq)
+                        except:
+                            pass
 
                 self.sent_times[next_seq] = time.time()
                 self.retries[next_seq] = self.retries.get(next_seq, 0)
+                if next_seq > self.highest_sent:
+                    self.highest_sent = next_seq
+                    self.metrics.on_packets_sent()
+                    if self.fec and next_seq >= self.fec_last:
+                        # Parity goes out right behind its group's data
+                        if batch:
+                            self._send_batch(batch)
+                            batch = []
+                            batched = 0
+                        self._fec_advance(next_seq)
                 next_seq += 1
 
+            if batch:
+                self._send_batch(batch)
+
             end_seq = next_seq - 1
             if end_seq >= start_seq:
                 print(
@@ -294,27 +1727,33 @@ class FileSender:
 
             return next_seq
 
+    def _send_batch(self, seqs: List[int]):
+        try:
+            self._transmit_batch(seqs)
+        except OSError:
+            pass
+
+    def next_timeout_delay(self, window_base: int) -> Optional[float]:
+        """Seconds until window_base's retransmission timer expires; None if it isn't in flight."""
+        sent_t = self.sent_times.get(window_base)
+        if sent_t is None or window_base > self.total_packets:
+            return None
+        return sent_t + self.metrics.rto / 1000.0 - time.time()
+
+    def poll_timeout(self, window_base: int, cap: float = 0.2) -> float:
+        """How long a send loop may block in recv before the pacer or RTO timer needs it."""
+        wait = cap
+        for delay in (self.next_send_delay(), self.next_timeout_delay(window_base)):
+            if delay is not None:
+                wait = min(wait, delay)
+        return max(wait, 0.001)
+
     def handle_timeout(self, window_base: int, max_retries: int) -> Tuple[int, bool]:
         rto_s = self.metrics.rto / 1000.0
         if time.time() - self.sent_times.get(window_base, time.time()) > rto_s:
             if self.retries.get(window_base, 0) < max_retries:
                 self.metrics.on_loss()
-
-                offset = (window_base - 1) * CHUNK_SIZE
-                pkt = {
-                    "type": "DATA",
-                    "room": self.room,
-                    "filename": self.filename,
-                    "seq": window_base,
-                    "total": self.total_packets,
-                    "payload_b64": base64.b64encode(self.data[offset:offset + CHUNK_SIZE]).decode("ascii"),
-                    "session_id": self.session_id
-                }
-
-                try:
-                    self.sock.sendto(json.dumps(pkt).encode("utf-8"), self.addr)
-                except:
-                    pass
+                self.retransmit(window_base)
 
                 self.sent_times[window_base] = time.time()
                 self.retries[window_base] = self.retries.get(window_base, 0) + 1
@@ -1,8 +1,16 @@
 import socket
+import selectors
 import threading
+import multiprocessing
+import ctypes
+import struct
 import json
+import re
+import argparse
 import datetime
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 from pathlib import Path
 import os
 import sys
@@ -22,23 +30,107 @@ room_client = RoomMgmtClient(host=SERVER_HOST, port=ROOM_MGMT_PORT)
 HOST = "0.0.0.0"
 TCP_PORT = 9010
 UDP_PORT = 9011
-CHUNK_SIZE = 4096
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 ROOT_UPLOAD_DIR = BASE_DIR / "data" / "uploads"
 os.makedirs(ROOT_UPLOAD_DIR, exist_ok=True)
 
+# In-progress uploads live in a hidden directory next to the finished files
+PARTIAL_DIR_NAME = ".partial"
+
+# Uploads that name their content id are resumable: <id>.part holds the
+# chunks and <id>.state the receiver's bitmap, checkpointed at most once per
+# interval and whenever the session is dropped. Abandoned ones expire.
+UPLOAD_CHECKPOINT_INTERVAL = 1.0
+# A resuming SYN takes over an older session of the same upload once that
+# session has been silent this long (its client is presumably gone)
+UPLOAD_TAKEOVER_IDLE = 3.0
+PARTIAL_TTL = 7 * 24 * 3600
+CONTENT_ID_RE = re.compile(r"[0-9a-f]{16,64}")
+
+# Finished uploads are kept once per content in the store and hard-linked
+# into rooms. Linking changes a file's ctime in every room sharing it, so
+# the time each file appeared in its room is kept as a marker's mtime.
+STORE_DIR = ROOT_UPLOAD_DIR / ".store"
+CREATED_DIR_NAME = ".created"
+
+# Download egress cap in bytes/s (0 = none; --egress-mbit) and the weights
+# rooms get when downloads share it, e.g. {"1234": 2.0} (--egress-room-weight 1234=2)
+EGRESS_RATE = 0
+EGRESS_ROOM_WEIGHTS = {}
+
 from typing import List, Tuple, Optional, Union
 import uuid
-import base64
 
-from backend.file_transfer.protocol import FileReceiver, FileSender, FileTransferMetrics
+from backend.file_transfer.protocol import (
+    FileReceiver, FileSender, FileTransferMetrics,
+    WIRE_JSON, WIRE_BINARY, parse_datagram, encode_ack, data_payload, ack_requested,
+    map_file, process_memory, DatagramReader, CHUNK_SIZE, negotiate_chunk_size,
+    parse_compression, compression_spec, MANIFEST_BLOCK, MANIFEST_MAX_BLOCKS, manifest,
+    ReceiveBudget, RWND_BYTES, RCV_MEMORY_BUDGET, size_socket_buffers
+)
+from backend.file_transfer.delta import block_size_for, signature, apply_delta, MIN_BLOCK, MAX_BLOCK
+from backend.file_transfer.store import ContentStore
+from backend.file_transfer.filecache import FileCache
+from backend.file_transfer.egress import EgressScheduler
+from backend.file_transfer.timers import TimerScheduler
+from backend.file_transfer.writer import UploadWriter, WriteJob
+
+store = ContentStore(STORE_DIR)
+
+# Receive-window bytes this process's upload receivers share
+receive_budget = ReceiveBudget(RCV_MEMORY_BUDGET)
+
+# Mappings of downloaded files, shared by every session of the same version
+file_cache = FileCache()
+
+# Downloads share EGRESS_RATE by weighted deficit round robin
+egress = EgressScheduler(EGRESS_RATE, room_weights=EGRESS_ROOM_WEIGHTS)
+
+# Completed uploads are stored (synced and renamed into their room) off the
+# datagram loop; with its backlog full, a session retries after this delay
+upload_writer = UploadWriter()
+WRITE_RETRY_DELAY = 0.05
 
 METRICS_DIR = BASE_DIR / "data" / "metrics"
 METRICS_DIR.mkdir(parents=True, exist_ok=True)
 
 sessions_lock = threading.Lock()
 
+# Retransmission, pacing, idle and delayed-ACK timers; callbacks run holding sessions_lock
+scheduler = TimerScheduler(lock=sessions_lock)
+
+# Threads per process admitting new sessions off the datagram loop
+ADMISSION_WORKERS = 4
+_admission_pool = None
+_admission_pool_lock = threading.Lock()
+# Chunks an upload holds while the first DATA has its partial file opened
+EARLY_CHUNKS_MAX = 64
+
+SESSION_IDLE_TIMEOUT = 60.0
+DOWNLOAD_MAX_RETRIES = 5
+
+# Largest slice of a TCP DOWNLOAD body handed to the socket per writable event
+TCP_SEND_BLOCK = 1024 * 1024
+# Threads running the TCP commands that wait on the room service or the disk
+TCP_COMMAND_WORKERS = 4
+TCP_BLOCKING_COMMANDS = {"LIST", "DOWNLOAD", "RANGE", "SIGNATURE", "STATS"}
+
+# (index, process, pipe) of each UDP worker when running with --workers > 1
+worker_links = []
+# One STATS exchange on the worker pipes at a time; each request carries an id
+# that the worker echoes, so a reply that arrives after its deadline is dropped
+worker_links_lock = threading.Lock()
+WORKER_STATS_TIMEOUT = 1.0
+_worker_stats_request = 0
+
+# Classic BPF for SO_ATTACH_REUSEPORT_CBPF (linux/filter.h)
+SO_ATTACH_REUSEPORT_CBPF = 51
+SKF_NET_OFF = -0x100000
+BPF_LD, BPF_H, BPF_ABS = 0x00, 0x08, 0x20
+BPF_ALU, BPF_MOD, BPF_K = 0x04, 0x90, 0x00
+BPF_RET, BPF_A = 0x06, 0x10
+
 def get_room_dir(room: str) -> Optional[Path]:
     """Validate room code and return its directory path."""
     if len(room) != 4 or not room.isdigit():
@@ -47,133 +139,1517 @@ def get_room_dir(room: str) -> Optional[Path]:
     room_dir.mkdir(parents=True, exist_ok=True)
     return room_dir
 
-# --- TCP Server Logic ---
+def partial_paths(room_dir: Path, key: str) -> Tuple[Path, Path]:
+    """Partial file and resume state of the upload keyed by `key` (content or session id)."""
+    base = room_dir / PARTIAL_DIR_NAME
+    return base / f"{key}.part", base / f"{key}.state"
+
+def upload_state(sess: dict) -> Optional[dict]:
+    """What a resuming SYN needs of `sess`, or None if there is nothing to resume. Cheap; no I/O."""
+    receiver = sess.get("receiver")
+    if receiver is None or not sess.get("content_id") or receiver.is_complete():
+        return None
+    return {
+        "content_id": sess["content_id"],
+        "filename": sess["filename"],
+        "size": sess.get("size"),
+        "chunk_size": receiver.chunk_size,
+        "total_packets": receiver.total_packets,
+        "receiver": receiver.resume_state()
+    }
 
-def handle_tcp_client(conn: socket.socket, addr):
-    print(f"[TCP FILE] New connection from {addr}")
-    buffer = b""
+def write_upload_state(sess: dict, state: dict):
+    """Flush the partial file, then store `state` beside it: every chunk it lists is on disk."""
+    room_dir = get_room_dir(sess["room"])
+    if room_dir is None:
+        return
+    _, state_path = partial_paths(room_dir, state["content_id"])
+    tmp_path = state_path.with_suffix(".tmp")
     try:
-        while True:
-            if b"\n" not in buffer:
-                try:
-                    data = conn.recv(CHUNK_SIZE)
-                except ConnectionResetError:
-                    break
-                if not data:
-                    break
-                buffer += data
-            
-            if b"\n" not in buffer:
-                continue
-                
-            line_end = buffer.index(b"\n")
-            line_bytes = buffer[:line_end]
-            buffer = buffer[line_end + 1:]
-            
+        sess["receiver"].flush()
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+    except OSError as e:
+        print(f"[UDP FILE] Could not checkpoint upload {state['content_id']}: {e}")
+
+def save_upload_state(sess: dict):
+    """Checkpoint a resumable upload so a later SYN with the same content id can continue it."""
+    state = upload_state(sess)
+    if state is not None:
+        write_upload_state(sess, state)
+        sess["checkpoint_at"] = time.time()
+
+def checkpoint_upload(sess: dict):
+    """
+    Periodic checkpoint from the data path: the state is taken here and
+    the admission pool does the flush and the write. One at a time per
+    session; the writer and session teardown wait for it to finish.
+    """
+    if not checkpoint_done(sess):
+        return
+    pool = admission_pool()
+    if pool is None:
+        save_upload_state(sess)
+        return
+    state = upload_state(sess)
+    if state is not None:
+        sess["checkpoint_at"] = time.time()
+        sess["checkpoint_job"] = pool.submit(write_upload_state, sess, state)
+
+def checkpoint_done(sess: dict) -> bool:
+    job = sess.get("checkpoint_job")
+    return job is None or job.done()
+
+def load_upload_state(room_dir: Path, content_id: str, size) -> Optional[dict]:
+    """Saved state of an interrupted upload of the same bytes, if there is one."""
+    part_path, state_path = partial_paths(room_dir, content_id)
+    try:
+        with open(state_path, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("size") != size or not part_path.exists():
+        return None
+    return state
+
+def drop_upload_state(room_dir: Path, key: str):
+    for path in partial_paths(room_dir, key):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+def expire_partials(room_dir: Path):
+    """Remove partial uploads nobody has touched in PARTIAL_TTL."""
+    cutoff = time.time() - PARTIAL_TTL
+    try:
+        entries = list((room_dir / PARTIAL_DIR_NAME).iterdir())
+    except OSError:
+        return
+    for path in entries:
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
+
+def mark_created(room_dir: Path, filename: str):
+    marker = room_dir / CREATED_DIR_NAME / filename
+    try:
+        marker.parent.mkdir(exist_ok=True)
+        marker.touch()
+    except OSError:
+        pass
+
+def created_time(room_dir: Path, path: Path, st: os.stat_result) -> float:
+    """When `path` appeared in the room; files the store never saw fall back to their ctime."""
+    try:
+        return (room_dir / CREATED_DIR_NAME / path.name).stat().st_mtime
+    except OSError:
+        return st.st_ctime
+
+def is_shared(path: Path) -> bool:
+    """Whether `path` is a link to a store object (replacing it may leave the object unused)."""
+    try:
+        return path.stat().st_nlink > 1
+    except OSError:
+        return False
+
+def upload_write_job(receiver: FileReceiver, room_dir: Path, filename: str, spec: Optional[dict], done) -> WriteJob:
+    """
+    The write-behind job that stores a complete upload as `filename` in the
+    room: its partial file, or for a delta upload (`spec`) the file rebuilt
+    from it. Once that is durable the bytes go into the content store too.
+    """
+    dest = room_dir / filename
+    state = {}
+
+    def stage() -> Optional[str]:
+        # Replacing a file other rooms share may leave its object unused
+        state["replaced_shared"] = is_shared(dest)
+        if spec:
+            error, state["digest"] = rebuild_delta(receiver, room_dir, filename, spec)
+            return error
+        receiver.seal()
+        return None
+
+    def publish():
+        mark_created(room_dir, filename)
+        if store.add(dest, state.get("digest")) is None:
+            print(f"[UDP FILE] Could not add {filename} to the content store")
+        if state["replaced_shared"]:
+            store.prune()
+
+    temp = receiver.path.with_suffix(".out") if spec else receiver.path
+    return WriteJob(temp, dest, stage, publish, done)
+
+def file_tag(path: Path) -> str:
+    """Changes whenever the file at `path` is replaced or rewritten."""
+    st = path.stat()
+    return f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+def is_room_file_name(name: str) -> bool:
+    """Whether `name` names an entry directly in a room directory (no path, no parent)."""
+    return bool(name) and name not in (".", "..") and "/" not in name and "\\" not in name \
+        and "\0" not in name and Path(name).name == name
+
+def check_delta_spec(room_dir: Path, spec) -> Tuple[Optional[dict], Optional[str]]:
+    """Validate the "delta" of a SYN: (spec, None) if its base is as the client saw it, else (None, error)."""
+    try:
+        spec = {
+            "base": str(spec["base"]),
+            "base_tag": str(spec["base_tag"]),
+            "block": int(spec["block"]),
+            "target_id": str(spec["target_id"]),
+            "target_size": int(spec["target_size"])
+        }
+    except (TypeError, KeyError, ValueError):
+        return None, "DeltaInvalid"
+    if not MIN_BLOCK <= spec["block"] <= MAX_BLOCK or not CONTENT_ID_RE.fullmatch(spec["target_id"]) \
+            or not is_room_file_name(spec["base"]):
+        return None, "DeltaInvalid"
+    try:
+        if not (room_dir / spec["base"]).is_file() or file_tag(room_dir / spec["base"]) != spec["base_tag"]:
+            return None, "DeltaBaseChanged"
+    except OSError:
+        return None, "DeltaBaseChanged"
+    return spec, None
+
+def rebuild_delta(receiver: FileReceiver, room_dir: Path, filename: str, spec: dict) -> Tuple[Optional[str], Optional[tuple]]:
+    """
+    Rebuild a delta upload against its base into the receiver's ".out"
+    file. Returns (None, manifest) if the result has the content id the
+    client computed, else (error code, None) and no file.
+    """
+    delta_path = receiver.path.with_suffix(".delta")
+    out_path = receiver.path.with_suffix(".out")
+    receiver.finalize_to_file(delta_path)
+    base = delta = out = None
+    error, digest = None, None
+    try:
+        if file_tag(room_dir / spec["base"]) != spec["base_tag"]:
+            error = "DeltaBaseChanged"
+        else:
+            base = map_file(room_dir / spec["base"])
+            delta = map_file(delta_path)
+            with open(out_path, "wb") as f:
+                apply_delta(base, delta, spec["block"], f)
+            out = map_file(out_path)
+            digest = manifest(out)
+            if digest[0] != spec["target_id"] or len(out) != spec["target_size"]:
+                error = "DeltaMismatch"
+    except (OSError, ValueError) as e:
+        print(f"[UDP FILE] Cannot apply delta for {filename}: {e}")
+        error = "DeltaFailed"
+    finally:
+        for mapped in (base, delta, out):
+            if hasattr(mapped, "close"):
+                mapped.close()
+        for path in (delta_path, out_path) if error else (delta_path,):
             try:
-                line = line_bytes.decode("utf-8").strip()
-            except UnicodeDecodeError:
-                print(f"[TCP FILE] Invalid encoding from {addr}")
-                buffer = b""
-                conn.sendall(b"ERROR Invalid command encoding\n")
-                continue
-            
-            if not line:
+                path.unlink()
+            except OSError:
+                pass
+    return (error, None) if error else (None, digest)
+
+def link_stored(room_dir: Path, filename: str, cid: str) -> bool:
+    """Place stored object `cid` in the room as `filename`."""
+    dest = room_dir / filename
+    replaced_shared = is_shared(dest)
+    if not store.link(cid, dest):
+        return False
+    mark_created(room_dir, filename)
+    if replaced_shared:
+        store.prune()
+    return True
+
+def prefill_upload(room_dir: Path, key: str, hashes: list, size: int, chunk_size: int,
+                   among: set) -> Optional[FileReceiver]:
+    """
+    A receiver for an upload of `size` bytes whose blocks (by manifest hash)
+    the stored objects `among` already hold are copied in and count as
+    received; None if they hold none of them.
+    """
+    if len(hashes) != -(-size // MANIFEST_BLOCK):
+        return None
+    known = store.find_blocks(hashes, among)
+    for i, found in enumerate(known):
+        # A stored block of another length cannot be the same bytes
+        if found is not None and found[2] != min(MANIFEST_BLOCK, size - i * MANIFEST_BLOCK):
+            known[i] = None
+    if not any(known):
+        return None
+
+    part_path, _ = partial_paths(room_dir, key)
+    receiver = FileReceiver(total_packets=-(-size // chunk_size), path=part_path, chunk_size=chunk_size,
+                            budget=receive_budget)
+    try:
+        i = 0
+        while i < len(known):
+            if known[i] is None:
+                i += 1
                 continue
+            start = i
+            while i < len(known) and known[i] is not None:
+                cid, offset, length = known[i]
+                receiver.prefill(i * MANIFEST_BLOCK, store.read(cid, offset, length))
+                i += 1
+            run_start = start * MANIFEST_BLOCK
+            receiver.mark_prefilled(run_start, min(i * MANIFEST_BLOCK, size) - run_start, size)
+    except OSError as e:
+        print(f"[UDP FILE] Cannot prefill upload from the store: {e}")
+        receiver.discard()
+        return None
+    return receiver
 
-            print(f"[TCP FILE] Command from {addr}: {line[:80]}")
-            parts = line.split()
-            cmd = parts[0].upper()
+def resolve_range(size: int, offset, length) -> Optional[Tuple[int, int]]:
+    """(offset, length) of a byte-range request clamped to the file, or None if it is invalid."""
+    try:
+        offset = int(offset)
+        length = size - offset if length is None else int(length)
+    except (TypeError, ValueError):
+        return None
+    if offset < 0 or length < 0 or offset > size:
+        return None
+    return offset, min(length, size - offset)
 
-            if cmd == "LIST":
-                if len(parts) < 2:
-                    conn.sendall(b"ERROR LIST needs room code\n")
-                    continue
-                room = parts[1]
-                # Validate room exists in central service
-                if not room_client.room_exists(room):
-                    conn.sendall(b"ERROR RoomNotFound\n")
-                    continue
-                
-                room_dir = get_room_dir(room)
-                if room_dir is None:
-                    conn.sendall(b"ERROR Invalid room configuration\n")
-                    continue
+# --- TCP Server Logic ---
 
-                files = []
-                for p in room_dir.iterdir():
-                    if p.is_file():
-                        st = p.stat()
-                        created = datetime.datetime.fromtimestamp(st.st_ctime).isoformat(timespec="seconds")
-                        files.append((p.name, st.st_size, created))
-                files.sort(key=lambda x: x[2], reverse=True)
-                
-                header = f"FILES {len(files)}\n"
-                conn.sendall(header.encode("utf-8"))
-                for name, size, created in files:
-                    line = f"{size} {created} {name}\n"
-                    conn.sendall(line.encode("utf-8"))
-
-            elif cmd == "DOWNLOAD":
-                if len(parts) < 3:
-                    conn.sendall(b"ERROR DOWNLOAD needs room and filename\n")
-                    continue
-                room = parts[1]
-                # Validate room exists in central service
-                if not room_client.room_exists(room):
-                    conn.sendall(b"ERROR RoomNotFound\n")
-                    continue
+def collect_stats(sessions: dict, timers=None) -> dict:
+    """Snapshot of live transfer sessions and process memory for the STATS command."""
+    timers = scheduler if timers is None else timers
+    if worker_links:
+        stats = collect_worker_stats()
+        stats["store"] = store.stats()
+        return stats
+    with sessions_lock:
+        snapshot = list(sessions.values())
+    result = []
+    for sess in snapshot:
+        holder = sess.get("sender") or sess.get("receiver")
+        result.append({
+            "session_id": sess["session_id"],
+            "type": sess.get("type", "UPLOAD"),
+            "room": sess["room"],
+            "filename": sess["filename"],
+            "state": sess["handshake_step"],
+            "chunk_size": sess.get("chunk_size", CHUNK_SIZE),
+            "resident_bytes": holder.resident_bytes if holder is not None else 0
+        })
+    stats = {"sessions": result, "memory": process_memory(), "store": store.stats(),
+             "receive_budget": receive_budget.stats(), "writer": upload_writer.stats(),
+             "file_cache": file_cache.stats(), "egress": egress.stats()}
+    if isinstance(timers, TimerScheduler):
+        stats["timers"] = {"pending": len(timers), "fired": timers.fired}
+    return stats
 
-                room_dir = get_room_dir(room)
-                if room_dir is None:
-                    conn.sendall(b"ERROR Invalid room configuration\n")
-                    continue
 
-                filename = " ".join(parts[2:])
-                path = room_dir / filename
-                if not path.exists() or not path.is_file():
-                    conn.sendall(b"ERROR NotFound\n")
-                    continue
-                
-                size = path.stat().st_size
-                header = f"OK {size}\n"
-                conn.sendall(header.encode("utf-8"))
-                
-                with path.open("rb") as f:
-                    while True:
-                        chunk = f.read(CHUNK_SIZE)
-                        if not chunk:
-                            break
-                        conn.sendall(chunk)
-
-            elif cmd == "BYE":
-                conn.sendall(b"OK Bye\n")
-                break
+def collect_worker_stats() -> dict:
+    """Merge every UDP worker's STATS snapshot; the parent only runs the TCP loop."""
+    merged = {
+        "sessions": [],
+        "memory": process_memory(),
+        "timers": {"pending": 0, "fired": 0},
+        "receive_budget": {"limit": 0, "used": 0},
+        "file_cache": {"mappings": 0, "in_use": 0, "mapped_bytes": 0, "budget": 0,
+                       "hits": 0, "misses": 0, "evictions": 0},
+        "egress": {"rate": 0, "flows": 0, "parked": 0, "sent_bytes": 0, "throttled": 0, "small_grants": 0},
+        "writer": {"queued": 0, "writing": 0, "peak_queued": 0, "written": 0, "failed": 0,
+                   "refused": 0, "batches": 0, "avg_ms": 0.0, "max_ms": 0.0},
+        "workers": []
+    }
+    latency_total = 0.0
+    for index, proc, stats in query_workers():
+        worker = {"worker": index, "pid": proc.pid, "alive": proc.is_alive()}
+        if stats is not None:
+            for sess in stats["sessions"]:
+                sess["worker"] = index
+            merged["sessions"].extend(stats["sessions"])
+            for key in ("pending", "fired"):
+                merged["timers"][key] += stats.get("timers", {}).get(key, 0)
+            for key in ("limit", "used"):
+                merged["receive_budget"][key] += stats.get("receive_budget", {}).get(key, 0)
+            for section in ("file_cache", "egress"):
+                for key, value in stats.get(section, {}).items():
+                    merged[section][key] += value
+            writer = stats.get("writer", {})
+            for key in ("queued", "writing", "written", "failed", "refused", "batches"):
+                merged["writer"][key] += writer.get(key, 0)
+            for key in ("peak_queued", "max_ms"):
+                merged["writer"][key] = max(merged["writer"][key], writer.get(key, 0))
+            latency_total += writer.get("avg_ms", 0.0) * (writer.get("written", 0) + writer.get("failed", 0))
+            worker["memory"] = stats["memory"]
+            worker["sessions"] = len(stats["sessions"])
+        merged["workers"].append(worker)
+    finished = merged["writer"]["written"] + merged["writer"]["failed"]
+    if finished:
+        merged["writer"]["avg_ms"] = round(latency_total / finished, 2)
+    return merged
+
+
+def query_workers() -> List[Tuple[int, object, Optional[dict]]]:
+    """Ask every UDP worker for its STATS; None for one that did not answer in time."""
+    global _worker_stats_request
+    with worker_links_lock:
+        _worker_stats_request += 1
+        request = _worker_stats_request
+        asked = []
+        for index, proc, link in worker_links:
+            try:
+                link.send(request)
+                asked.append((index, proc, link))
+            except (EOFError, OSError):
+                pass
+        answers = {}
+        deadline = time.monotonic() + WORKER_STATS_TIMEOUT
+        for index, proc, link in asked:
+            try:
+                while link.poll(max(0.0, deadline - time.monotonic())):
+                    reply_to, stats = link.recv()
+                    # Anything else answers an earlier request that timed out
+                    if reply_to == request:
+                        answers[index] = stats
+                        break
+            except (EOFError, OSError):
+                pass
+        return [(index, proc, answers.get(index)) for index, proc, _ in worker_links]
+
+
+class TcpClient:
+    """Per-connection state for the selector-driven TCP control loop."""
+
+    def __init__(self, conn: socket.socket, addr):
+        self.conn = conn
+        self.addr = addr
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        # [file, offset, remaining] of a DOWNLOAD body still being streamed
+        self.body = None
+        self.closing = False
+        # A command of this client is running on the TCP command pool
+        self.pending = False
+
+    def send(self, data: bytes):
+        self.outbuf += data
+
+    @property
+    def wants_write(self) -> bool:
+        return bool(self.outbuf) or self.body is not None
+
+    def close(self):
+        if self.body is not None:
+            self.body[0].close()
+            self.body = None
+        self.conn.close()
+
+
+def handle_tcp_command(client: TcpClient, line: str, sessions: dict):
+    print(f"[TCP FILE] Command from {client.addr}: {line[:80]}")
+    parts = line.split()
+    cmd = parts[0].upper()
+
+    if cmd == "LIST":
+        if len(parts) < 2:
+            client.send(b"ERROR LIST needs room code\n")
+            return
+        room = parts[1]
+        # Validate room exists in central service
+        if not room_client.room_exists(room):
+            client.send(b"ERROR RoomNotFound\n")
+            return
+
+        room_dir = get_room_dir(room)
+        if room_dir is None:
+            client.send(b"ERROR Invalid room configuration\n")
+            return
+
+        files = []
+        for p in room_dir.iterdir():
+            if p.is_file():
+                st = p.stat()
+                created = datetime.datetime.fromtimestamp(created_time(room_dir, p, st)).isoformat(timespec="seconds")
+                files.append((p.name, st.st_size, created))
+        files.sort(key=lambda x: x[2], reverse=True)
+
+        header = f"FILES {len(files)}\n"
+        client.send(header.encode("utf-8"))
+        for name, size, created in files:
+            line = f"{size} {created} {name}\n"
+            client.send(line.encode("utf-8"))
+
+    elif cmd == "DOWNLOAD":
+        if len(parts) < 3:
+            client.send(b"ERROR DOWNLOAD needs room and filename\n")
+            return
+        room = parts[1]
+        # Validate room exists in central service
+        if not room_client.room_exists(room):
+            client.send(b"ERROR RoomNotFound\n")
+            return
+
+        room_dir = get_room_dir(room)
+        if room_dir is None:
+            client.send(b"ERROR Invalid room configuration\n")
+            return
+
+        filename = " ".join(parts[2:])
+        path = room_dir / filename
+        if not path.exists() or not path.is_file():
+            client.send(b"ERROR NotFound\n")
+            return
+
+        size = path.stat().st_size
+        header = f"OK {size}\n"
+        client.send(header.encode("utf-8"))
+        # The body is streamed by write_tcp_client as the socket drains
+        client.body = [path.open("rb"), 0, size]
+
+    elif cmd == "RANGE":
+        # RANGE <room> <offset> <length|*> <filename>: bytes [offset, offset+length)
+        if len(parts) < 5:
+            client.send(b"ERROR RANGE needs room, offset, length and filename\n")
+            return
+        room = parts[1]
+        if not room_client.room_exists(room):
+            client.send(b"ERROR RoomNotFound\n")
+            return
+
+        room_dir = get_room_dir(room)
+        if room_dir is None:
+            client.send(b"ERROR Invalid room configuration\n")
+            return
+
+        filename = " ".join(parts[4:])
+        path = room_dir / filename
+        if not path.exists() or not path.is_file():
+            client.send(b"ERROR NotFound\n")
+            return
+
+        size = path.stat().st_size
+        byte_range = resolve_range(size, parts[2], None if parts[3] == "*" else parts[3])
+        if byte_range is None:
+            client.send(b"ERROR BadRange\n")
+            return
+        offset, length = byte_range
+        client.send(f"OK {length} {size}\n".encode("utf-8"))
+        client.body = [path.open("rb"), offset, length]
+
+    elif cmd == "SIGNATURE":
+        # SIGNATURE <room> <filename>: rsync block signature of a file, for
+        # delta uploads of a new version; OK <block> <length> <size> <tag>
+        if len(parts) < 3:
+            client.send(b"ERROR SIGNATURE needs room and filename\n")
+            return
+        room = parts[1]
+        if not room_client.room_exists(room):
+            client.send(b"ERROR RoomNotFound\n")
+            return
+
+        room_dir = get_room_dir(room)
+        if room_dir is None:
+            client.send(b"ERROR Invalid room configuration\n")
+            return
+
+        filename = " ".join(parts[2:])
+        path = room_dir / filename
+        if not path.exists() or not path.is_file():
+            client.send(b"ERROR NotFound\n")
+            return
+
+        # Hashes the whole file: this runs on the TCP command pool.
+        # A delta against a file replaced in the meantime is refused by its tag.
+        tag = file_tag(path)
+        data = map_file(path)
+        size = len(data)
+        try:
+            block = block_size_for(size)
+            sig = signature(data, block)
+        finally:
+            if hasattr(data, "close"):
+                data.close()
+        client.send(f"OK {block} {len(sig)} {size} {tag}\n".encode("utf-8"))
+        client.send(sig)
+
+    elif cmd == "STATS":
+        stats = collect_stats(sessions)
+        client.send(f"STATS {json.dumps(stats)}\n".encode("utf-8"))
+
+    elif cmd == "BYE":
+        client.send(b"OK Bye\n")
+        client.closing = True
+    else:
+        client.send(b"ERROR Unknown command\n")
+
+
+class TcpCommandPool:
+    """
+    Runs the commands in TCP_BLOCKING_COMMANDS on worker threads. Each
+    fills a reply of its own, which the selector loop collects when the
+    wakeup socket turns readable. A client has one command running at a
+    time, so its replies keep their order.
+    """
+
+    def __init__(self, sel: selectors.BaseSelector, workers: int = TCP_COMMAND_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="syncrox-tcp")
+        self.finished = deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        sel.register(self._wake_r, selectors.EVENT_READ, self)
+
+    def submit(self, client: TcpClient, line: str, sessions: dict):
+        client.pending = True
+        reply = TcpClient(None, client.addr)
+
+        def job():
+            try:
+                handle_tcp_command(reply, line, sessions)
+            except Exception as e:
+                print(f"[TCP FILE] Error with client {client.addr}: {e}")
+                drop_tcp_output(reply)
+                reply.closing = True
+            self.finished.append((client, reply))
+            try:
+                self._wake_w.send(b"\0")
+            except OSError:
+                # Full: the loop has a wakeup pending already
+                pass
+        self.executor.submit(job)
+
+    def collect(self) -> List[TcpClient]:
+        """Hand finished replies to their clients; returns those clients."""
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        clients = []
+        while self.finished:
+            client, reply = self.finished.popleft()
+            client.pending = False
+            if client.closing:
+                # The client hung up while its command ran
+                drop_tcp_output(reply)
             else:
-                conn.sendall(b"ERROR Unknown command\n")
+                client.outbuf += reply.outbuf
+                client.body = reply.body
+                client.closing = reply.closing
+            clients.append(client)
+        return clients
+
+
+def drop_tcp_output(client: TcpClient):
+    client.outbuf.clear()
+    if client.body is not None:
+        client.body[0].close()
+        client.body = None
+
 
+def process_tcp_lines(client: TcpClient, sessions: dict, commands: Optional[TcpCommandPool] = None):
+    # Pipelined commands wait until a DOWNLOAD body or command ahead of them is done
+    while not client.closing and not client.pending and client.body is None and b"\n" in client.inbuf:
+        line_end = client.inbuf.index(b"\n")
+        line_bytes = bytes(client.inbuf[:line_end])
+        del client.inbuf[:line_end + 1]
+
+        try:
+            line = line_bytes.decode("utf-8").strip()
+        except UnicodeDecodeError:
+            print(f"[TCP FILE] Invalid encoding from {client.addr}")
+            client.inbuf.clear()
+            client.send(b"ERROR Invalid command encoding\n")
+            continue
+
+        if not line:
+            continue
+        if commands is not None and line.split()[0].upper() in TCP_BLOCKING_COMMANDS:
+            commands.submit(client, line, sessions)
+        else:
+            handle_tcp_command(client, line, sessions)
+
+
+def read_tcp_client(client: TcpClient, sessions: dict, commands: Optional[TcpCommandPool] = None):
+    try:
+        data = client.conn.recv(CHUNK_SIZE)
+    except BlockingIOError:
+        return
+    if not data:
+        client.closing = True
+        drop_tcp_output(client)
+        return
+    client.inbuf += data
+    process_tcp_lines(client, sessions, commands)
+
+
+def write_tcp_client(client: TcpClient, sessions: dict, commands: Optional[TcpCommandPool] = None):
+    if client.outbuf:
+        try:
+            sent = client.conn.send(client.outbuf)
+        except BlockingIOError:
+            return
+        del client.outbuf[:sent]
+        if client.outbuf:
+            return
+
+    if client.body is not None:
+        f, offset, remaining = client.body
+        try:
+            if hasattr(os, "sendfile"):
+                # Zero-copy from the page cache straight into the socket
+                sent = os.sendfile(client.conn.fileno(), f.fileno(), offset, min(remaining, TCP_SEND_BLOCK))
+            else:
+                f.seek(offset)
+                sent = client.conn.send(f.read(min(remaining, TCP_SEND_BLOCK)))
+        except BlockingIOError:
+            return
+        client.body[1] += sent
+        client.body[2] -= sent
+        # A file truncated mid-download ends the body early
+        if client.body[2] <= 0 or sent == 0:
+            f.close()
+            client.body = None
+            process_tcp_lines(client, sessions, commands)
+
+
+def serve_tcp_client(sel: selectors.BaseSelector, client: TcpClient, events: int, sessions: dict,
+                     commands: TcpCommandPool):
+    """Read and write what `client`'s socket is ready for, then update what the selector waits on."""
+    try:
+        if events & selectors.EVENT_READ:
+            read_tcp_client(client, sessions, commands)
+        else:
+            # Lines held back while a command ran on the pool
+            process_tcp_lines(client, sessions, commands)
+        if events & selectors.EVENT_WRITE or client.wants_write:
+            write_tcp_client(client, sessions, commands)
     except Exception as e:
-        print(f"[TCP FILE] Error with client {addr}: {e}")
-    finally:
-        conn.close()
+        print(f"[TCP FILE] Error with client {client.addr}: {e}")
+        client.closing = True
+        drop_tcp_output(client)
+
+    mask = 0 if client.closing else selectors.EVENT_READ
+    if client.wants_write:
+        mask |= selectors.EVENT_WRITE
+    try:
+        registered = sel.get_key(client.conn).events
+    except KeyError:
+        registered = 0
+    if client.closing and not mask and not client.pending:
+        if registered:
+            sel.unregister(client.conn)
+        client.close()
+    elif not mask:
+        # Hung up with a command still running; nothing to wait for until it ends
+        if registered:
+            sel.unregister(client.conn)
+    elif not registered:
+        sel.register(client.conn, mask, client)
+    elif mask != registered:
+        sel.modify(client.conn, mask, client)
 
-def tcp_server():
+
+def tcp_server(sessions: dict, host: str = HOST, port: int = TCP_PORT):
+    """
+    Single-threaded TCP control loop: every connection is a non-blocking
+    socket multiplexed by a selector instead of a thread of its own.
+    Commands that wait on the room service or the disk run on a
+    TcpCommandPool; the loop only moves bytes.
+    """
+    sel = selectors.DefaultSelector()
+    commands = TcpCommandPool(sel)
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, TCP_PORT))
-        s.listen(5)
-        print(f"[TCP FILE] Server listening on {HOST}:{TCP_PORT}")
+        s.bind((host, port))
+        s.listen(128)
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ, None)
+        print(f"[TCP FILE] Server listening on {host}:{port}")
+
         while True:
-            conn, addr = s.accept()
-            threading.Thread(target=handle_tcp_client, args=(conn, addr), daemon=True).start()
+            for key, events in sel.select():
+                if key.data is None:
+                    try:
+                        conn, addr = s.accept()
+                    except BlockingIOError:
+                        continue
+                    conn.setblocking(False)
+                    print(f"[TCP FILE] New connection from {addr}")
+                    sel.register(conn, selectors.EVENT_READ, TcpClient(conn, addr))
+                elif key.data is commands:
+                    # Replies are sent at once where the socket takes them
+                    for client in commands.collect():
+                        serve_tcp_client(sel, client, 0, sessions, commands)
+                else:
+                    serve_tcp_client(sel, key.data, events, sessions, commands)
 
 # --- UDP Server Logic ---
 # The FileReceiver class is imported from .protocol
 
-def udp_server(sessions: dict):
-    server_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server_sock.bind((HOST, UDP_PORT))
-    print(f"[UDP FILE] Server listening on {HOST}:{UDP_PORT}")
+def cancel_timers(sess: dict, keys=("rto_timer", "pace_timer", "idle_timer", "ack_timer", "write_timer")):
+    for key in keys:
+        handle = sess.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+
+def discard_session(sess: Optional[dict]):
+    """
+    Release whatever a finished or abandoned session still holds open. The
+    data path only stops its timers and egress share; the admission pool
+    closes its files.
+    """
+    if not sess:
+        return
+    detach_session(sess)
+    pool = admission_pool()
+    if pool is None:
+        release_session(sess)
+    else:
+        pool.submit(release_session, sess)
+
+def detach_session(sess: dict):
+    """Data-path half of discard_session()."""
+    if sess.get("write_timer") is not None:
+        # A finished upload the writer never accepted
+        sess["unwritten"] = True
+    cancel_timers(sess)
+    if sess.get("type") == "DOWNLOAD" and "sender" in sess:
+        egress.close(sess["sender"].egress)
+
+def release_session(sess: dict):
+    """Blocking half of discard_session(): checkpoint, flush and close the session's files."""
+    job = sess.get("checkpoint_job")
+    if job is not None:
+        # Let a running checkpoint finish with the partial file first
+        wait_futures([job])
+    if sess.get("unwritten"):
+        sess["receiver"].discard()
+    if sess.get("type") == "DOWNLOAD" and "metrics" in sess:
+        sess["metrics"].close()
+        sess["sender"].close()
+    receiver = sess.get("receiver")
+    if receiver is not None and not receiver.is_complete():
+        if sess.get("content_id"):
+            # Keep the partial file for a resuming SYN
+            save_upload_state(sess)
+            receiver.close()
+        else:
+            receiver.discard()
+
+# Session timers live on sess["timers"]: the shared TimerScheduler in the
+# threaded server, the event loop in the asyncio one. A fired timer clears
+# its own slot first, since asyncio handles don't report having fired.
+
+def arm_idle_timer(sessions: dict, addr, sess: dict, delay: float = SESSION_IDLE_TIMEOUT):
+    sess["idle_timer"] = sess["timers"].call_later(delay, on_idle_timer, sessions, addr, sess)
+
+def on_idle_timer(sessions: dict, addr, sess: dict):
+    sess["idle_timer"] = None
+    if sessions.get(addr) is not sess:
+        return
+    # Activity only stamps last_activity; the timer re-arms itself from it
+    idle = time.time() - sess["last_activity"]
+    if idle > SESSION_IDLE_TIMEOUT:
+        print(f"[UDP FILE] Session {sess['session_id']} idle for {idle:.0f}s, dropping")
+        discard_session(sessions.pop(addr))
+    else:
+        arm_idle_timer(sessions, addr, sess, SESSION_IDLE_TIMEOUT - idle)
+
+def send_upload_ack(server_sock, addr, sess: dict):
+    """ACK everything an upload's receiver holds, dropping any delayed ACK still pending."""
+    receiver = sess["receiver"]
+    cancel_timers(sess, ("ack_timer",))
+    receiver.ack_sent()
+    rwnd = receiver.advertised_window(sess.get("rwnd_bytes", False))
+    ack = encode_ack(sess["session_id"], receiver.get_ack_seq(), rwnd,
+                     wire=sess.get("wire", WIRE_JSON), room=sess["room"], filename=sess["filename"],
+                     sack=receiver.get_sack_blocks(), repaired=receiver.repaired)
+    server_sock.sendto(ack, addr)
+
+def on_ack_timer(sessions: dict, addr, sess: dict, server_sock):
+    sess["ack_timer"] = None
+    if sessions.get(addr) is not sess or sess["receiver"] is None or not sess["receiver"].unacked:
+        return
+    try:
+        send_upload_ack(server_sock, addr, sess)
+    except OSError:
+        pass
+
+def acknowledge_upload(sessions: dict, addr, sess: dict, server_sock):
+    """Send the cumulative ACK for newly received chunks, then checkpoint or store the upload."""
+    receiver = sess["receiver"]
+    send_upload_ack(server_sock, addr, sess)
+
+    if not receiver.is_complete():
+        if sess.get("content_id") and time.time() - sess["checkpoint_at"] >= UPLOAD_CHECKPOINT_INTERVAL:
+            checkpoint_upload(sess)
+    elif sess["handshake_step"] == "FIN_SENT":
+        # Duplicate DATA after completion only re-triggers the FIN
+        send_upload_fin(server_sock, addr, sess)
+    elif sess["handshake_step"] != "WRITING":
+        # The writer stores the file; FIN follows once it is durable
+        sess["handshake_step"] = "WRITING"
+        queue_upload_write(sessions, addr, sess, server_sock)
+
+def create_upload_receiver(sess: dict, total: int) -> Optional[FileReceiver]:
+    room_dir = get_room_dir(sess["room"])
+    if room_dir is None:
+        return None
+    partial_path, _ = partial_paths(room_dir, sess.get("content_id") or sess["session_id"])
+    try:
+        return FileReceiver(total_packets=total, path=partial_path, chunk_size=sess.get("chunk_size", CHUNK_SIZE),
+                            budget=receive_budget, rtt=sess.get("rtt"))
+    except OSError as e:
+        print(f"[UDP FILE] Cannot open partial upload for {sess['filename']}: {e}")
+        return None
+
+def open_upload_receiver(sessions: dict, addr, sess: dict, server_sock, total: int, seq: int, payload):
+    """
+    First DATA of an upload whose SYN gave no size: open its partial file.
+    The admission pool does that while this chunk and the next few wait in
+    the session (the client resends any beyond EARLY_CHUNKS_MAX); None
+    until then. Without a pool the receiver is opened and returned here.
+    """
+    early = sess.get("early_chunks")
+    if early is None:
+        pool = admission_pool()
+        if pool is None:
+            sess["receiver"] = create_upload_receiver(sess, total)
+            if sess["receiver"] is None:
+                discard_session(sessions.pop(addr))
+            return sess["receiver"]
+        sess["early_chunks"] = early = {}
+
+        def job():
+            receiver = create_upload_receiver(sess, total)
+            hand_back(sess["timers"], upload_receiver_opened, sessions, addr, sess, server_sock, receiver)
+        pool.submit(job)
+    if len(early) < EARLY_CHUNKS_MAX:
+        # The payload may be a view of the datagram buffer, which is reused
+        early[seq] = bytes(payload)
+    return None
+
+def upload_receiver_opened(sessions: dict, addr, sess: dict, server_sock, receiver: Optional[FileReceiver]):
+    """Data-path half of open_upload_receiver(): store the chunks that waited and ACK them."""
+    early = sess.pop("early_chunks", {})
+    if sessions.get(addr) is not sess:
+        discard_session({"receiver": receiver})
+        return
+    if receiver is None:
+        discard_session(sessions.pop(addr))
+        return
+    sess["receiver"] = receiver
+    for seq, payload in early.items():
+        receiver.add_chunk(seq, payload)
+    try:
+        acknowledge_upload(sessions, addr, sess, server_sock)
+    except OSError:
+        pass
+
+def send_upload_fin(server_sock, addr, sess: dict):
+    fin = {"type": "FIN", "filename": sess["filename"], "session_id": sess["session_id"]}
+    if sess.get("error"):
+        fin["error"] = sess["error"]
+    server_sock.sendto(json.dumps(fin).encode("utf-8"), addr)
+
+def queue_upload_write(sessions: dict, addr, sess: dict, server_sock):
+    """Hand a complete upload to the writer, retrying shortly while its backlog is full."""
+    sess["write_timer"] = None
+    if sessions.get(addr) is not sess:
+        return
+    room_dir = sess.get("room_dir") or get_room_dir(sess["room"])
+    if room_dir is None:
+        finish_upload(sessions, addr, sess, server_sock, "RoomNotFound")
+        return
+    timers = sess["timers"]
+    content_id = sess.get("content_id")
+    if not checkpoint_done(sess):
+        # The checkpoint still has the partial file open; the writer closes it
+        sess["write_timer"] = timers.call_later(WRITE_RETRY_DELAY, queue_upload_write,
+                                                sessions, addr, sess, server_sock)
+        return
+
+    def done(error):
+        # Writer thread: the file is durable (or abandoned); the FIN goes out from the data path
+        if content_id:
+            drop_upload_state(room_dir, content_id)
+        hand_back(timers, finish_upload, sessions, addr, sess, server_sock, error)
+
+    job = upload_write_job(sess["receiver"], room_dir, sess["filename"], sess.get("delta"), done)
+    if not upload_writer.submit(job):
+        sess["write_timer"] = timers.call_later(WRITE_RETRY_DELAY, queue_upload_write,
+                                                sessions, addr, sess, server_sock)
+
+def finish_upload(sessions: dict, addr, sess: dict, server_sock, error: Optional[str]):
+    if error:
+        print(f"[UDP FILE] Upload of {sess['filename']} from {addr} failed: {error}")
+    else:
+        print(f"[UDP FILE] Saved {sess['filename']} in room {sess['room']} from {addr} (Session={sess['session_id']})")
+    if sessions.get(addr) is not sess:
+        return
+    sess["error"] = error
+    sess["handshake_step"] = "FIN_SENT"
+    try:
+        send_upload_fin(server_sock, addr, sess)
+    except OSError:
+        pass
+
+def arm_download_timers(sessions: dict, addr, sess: dict):
+    """(Re)arm a download's retransmission and pacing timers after its window moved."""
+    if sess["handshake_step"] == "FIN_SENT":
+        cancel_timers(sess, ("rto_timer", "pace_timer"))
+        return
+    sender = sess["sender"]
+    metrics = sess["metrics"]
+    timers = sess["timers"]
+
+    # One RTO timer per session, for the oldest unacknowledged packet (RFC 6298).
+    # A pending timer due earlier is kept: it re-checks and re-arms when it fires,
+    # so ACKs that only push the deadline later don't touch the heap.
+    delay = sender.next_timeout_delay(metrics.last_ack + 1)
+    handle = sess.get("rto_timer")
+    if delay is None:
+        cancel_timers(sess, ("rto_timer",))
+    else:
+        when = timers.time() + max(delay, 0.001)
+        if handle is None or handle.when() > when:
+            if handle is not None:
+                handle.cancel()
+            sess["rto_timer"] = timers.call_at(when, on_rto_timer, sessions, addr, sess)
+
+    # Paced senders release the rest of their window between ACKs
+    pace = sender.next_send_delay()
+    handle = sess.get("pace_timer")
+    if pace and handle is None:
+        sess["pace_timer"] = timers.call_later(max(pace, 0.001), on_pace_timer, sessions, addr, sess)
+
+def on_rto_timer(sessions: dict, addr, sess: dict):
+    sess["rto_timer"] = None
+    if sessions.get(addr) is not sess or sess["handshake_step"] == "FIN_SENT":
+        return
+    sender = sess["sender"]
+    metrics = sess["metrics"]
+    new_next, ok = sender.handle_timeout(metrics.last_ack + 1, max_retries=DOWNLOAD_MAX_RETRIES)
+    if not ok:
+        print(f"[UDP FILE] Download session {sess['session_id']} failed (MAX_RETRIES)")
+        discard_session(sessions.pop(addr))
+        return
+    if new_next != -1:
+        sess["next_seq"] = new_next
+    arm_download_timers(sessions, addr, sess)
+
+def on_egress_ready(sessions: dict, addr, sess: dict):
+    """The egress scheduler granted a parked download more of the cap."""
+    if sessions.get(addr) is not sess or sess["handshake_step"] == "FIN_SENT":
+        return
+    sender = sess["sender"]
+    sess["next_seq"] = sender.send_window(sess.get("next_seq", 1), sess["metrics"].last_ack + 1)
+    arm_download_timers(sessions, addr, sess)
+
+def on_pace_timer(sessions: dict, addr, sess: dict):
+    sess["pace_timer"] = None
+    if sessions.get(addr) is not sess or sess["handshake_step"] == "FIN_SENT":
+        return
+    sender = sess["sender"]
+    sess["next_seq"] = sender.send_window(sess.get("next_seq", 1), sess["metrics"].last_ack + 1)
+    arm_download_timers(sessions, addr, sess)
+
+# --- Admission ---
+# A SYN or DOWNLOAD asks room_mgmt whether the room exists, opens files and
+# creates metrics CSVs. That runs on the admission pool, so a slow room
+# service or disk never stalls the datagram loop: the loop parks the
+# client in an "ADMITTING" session and answers once the pool hands the
+# result back through `timers`. The same threads open the partial file of
+# an upload whose SYN gave no size, write its periodic checkpoints and
+# close the files of ended sessions. ADMISSION_WORKERS = 0 does all of
+# that inline.
+
+def admission_pool() -> Optional[ThreadPoolExecutor]:
+    """This process's admission threads, started on first use (UDP workers fork first)."""
+    global _admission_pool
+    if ADMISSION_WORKERS <= 0:
+        return None
+    with _admission_pool_lock:
+        if _admission_pool is None:
+            _admission_pool = ThreadPoolExecutor(max_workers=ADMISSION_WORKERS,
+                                                 thread_name_prefix="syncrox-admission")
+        return _admission_pool
+
+def hand_back(timers, callback, *args):
+    """Run `callback` on the data path: as a due timer (under sessions_lock) or on the event loop."""
+    if hasattr(timers, "call_soon_threadsafe"):
+        timers.call_soon_threadsafe(callback, *args)
+    else:
+        timers.call_later(0, callback, *args)
+
+def start_admission(sessions: dict, addr, sess: dict, server_sock, admit, msg: dict, stale: list):
+    """
+    Admit the pending session `sess`: `admit(msg, addr, sess, server_sock)`
+    runs on the admission pool, after the `stale` sessions it replaces are
+    released there, and finish_admission() takes its result.
+    """
+    for old in stale:
+        if old is not None:
+            detach_session(old)
+    pool = admission_pool()
+    if pool is None:
+        finish_admission(sessions, addr, sess, server_sock, run_admission(admit, msg, addr, sess, server_sock, stale))
+        return
+
+    def job():
+        admitted = run_admission(admit, msg, addr, sess, server_sock, stale)
+        hand_back(sess["timers"], finish_admission, sessions, addr, sess, server_sock, admitted)
+    pool.submit(job)
+
+def run_admission(admit, msg: dict, addr, sess: dict, server_sock, stale: list):
+    for old in stale:
+        if old is not None:
+            release_session(old)
+    try:
+        return admit(msg, addr, sess, server_sock)
+    except Exception as e:
+        print(f"[UDP FILE] Admission of {sess['filename']} from {addr} failed: {e}")
+        return None, None
+
+def finish_admission(sessions: dict, addr, sess: dict, server_sock, admitted):
+    """
+    Data-path half of admission: `admitted` is (fields, reply). Fields
+    complete the session, which then answers with its SYN-ACK; without
+    them the session is dropped and `reply`, if any, is the answer.
+    """
+    fields, reply = admitted
+    if sessions.get(addr) is not sess:
+        # Replaced or timed out while admitting; release what was opened for it
+        if fields:
+            leftover = {key: value for key, value in sess.items() if not key.endswith("_timer")}
+            leftover.update(fields)
+            discard_session(leftover)
+        return
+    if fields is None:
+        discard_session(sessions.pop(addr))
+        if reply is not None:
+            server_sock.sendto(json.dumps(reply).encode("utf-8"), addr)
+        return
+
+    sess.update(fields)
+    sess["handshake_step"] = "SYN-ACK_SENT"
+    sess["last_activity"] = time.time()
+    if sess.get("type") == "DOWNLOAD":
+        sess["sender"].egress = egress.open(sess["room"], sess["length"],
+                                            lambda: on_egress_ready(sessions, addr, sess), sess["timers"])
+        server_sock.sendto(json.dumps(download_synack(sess)).encode("utf-8"), addr)
+        print(f"[UDP FILE] DOWNLOAD Received from {addr}: Room={sess['room']}, File={sess['filename']} "
+              f"-> Session={sess['session_id']} (resident={sess['sender'].resident_bytes}B)")
+    else:
+        sess["synack_at"] = time.time()
+        server_sock.sendto(json.dumps(upload_synack(sess)).encode("utf-8"), addr)
+        receiver = sess["receiver"]
+        print(f"[UDP FILE] SYN Received from {addr}: Room={sess['room']}, File={sess['filename']} "
+              f"-> Session={sess['session_id']}"
+              + (f" (resuming after seq {receiver.get_ack_seq()})" if sess.get("resumed") else ""))
+
+def admit_upload(msg: dict, addr, sess: dict, server_sock) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    Admission work of a SYN (room check, stored and resumable copies,
+    the partial file). Reads the pending session's negotiated fields.
+    """
+    room = sess["room"]
+    filename = sess["filename"]
+    session_id = sess["session_id"]
+    content_id = sess["content_id"]
+    chunk_size = sess["chunk_size"]
+
+    if not room_client.room_exists(room):
+        print(f"[UDP FILE] SYN Rejected: Room {room} not found")
+        return None, None
+    room_dir = get_room_dir(room)
+    receiver = None
+
+    # Clients that send a block manifest understand "have": the server
+    # stores these bytes already, so there is nothing to transfer
+    hashes = msg.get("manifest")
+    size = msg.get("size")
+    if not isinstance(hashes, list) or len(hashes) > MANIFEST_MAX_BLOCKS \
+            or not isinstance(size, int) or size < 0 or room_dir is None:
+        hashes = None
+    # Only objects this room links to already may stand in for the client's
+    # bytes: the store is shared by all rooms, and an id proves nothing
+    room_objects = store.linked_from(room_dir) if room_dir is not None and (hashes or "delta" in msg) else set()
+    if hashes is not None and content_id in room_objects and store.lookup(content_id, size) is not None \
+            and link_stored(room_dir, filename, content_id):
+        print(f"[UDP FILE] SYN from {addr}: {filename} already stored, linked into room {room}")
+        return None, {"type": "SYN-ACK", "filename": filename, "session_id": session_id, "have": True}
+
+    # Delta uploads send an rsync delta against a file in the room; the
+    # new version is rebuilt from it once the delta has arrived
+    delta_spec = None
+    if "delta" in msg and room_dir is not None:
+        delta_spec, error = check_delta_spec(room_dir, msg["delta"])
+        if error is None and delta_spec["target_id"] in room_objects \
+                and store.lookup(delta_spec["target_id"], delta_spec["target_size"]) is not None \
+                and link_stored(room_dir, filename, delta_spec["target_id"]):
+            print(f"[UDP FILE] SYN from {addr}: new version of {filename} already stored")
+            return None, {"type": "SYN-ACK", "filename": filename, "session_id": session_id, "have": True}
+        if error is not None:
+            print(f"[UDP FILE] Delta SYN from {addr} rejected: {error}")
+            return None, {"type": "SYN-ACK", "filename": filename, "session_id": session_id, "error": error}
+
+    if content_id and room_dir is not None:
+        expire_partials(room_dir)
+        state = load_upload_state(room_dir, content_id, size)
+        if state is not None:
+            chunk_size = state["chunk_size"]
+            part_path, _ = partial_paths(room_dir, content_id)
+            try:
+                receiver = FileReceiver(total_packets=state["total_packets"], path=part_path,
+                                        chunk_size=chunk_size, resume=state["receiver"],
+                                        budget=receive_budget)
+            except (OSError, KeyError, ValueError) as e:
+                print(f"[UDP FILE] Cannot resume upload {content_id}: {e}")
+                drop_upload_state(room_dir, content_id)
+    if receiver is None and hashes:
+        # Blocks of the room's other stored files need not be sent again
+        receiver = prefill_upload(room_dir, content_id or session_id, hashes, size, chunk_size, room_objects)
+        if receiver is not None and receiver.is_complete():
+            # Admission runs off the datagram loop already; store it right here
+            errors = []
+            upload_writer.commit([upload_write_job(receiver, room_dir, filename, None, errors.append)])
+            if errors[0] is not None:
+                return None, {"type": "SYN-ACK", "filename": filename, "session_id": session_id, "error": errors[0]}
+            print(f"[UDP FILE] SYN from {addr}: {filename} assembled from stored blocks in room {room}")
+            return None, {"type": "SYN-ACK", "filename": filename, "session_id": session_id, "have": True}
+
+    resumed = receiver is not None
+    if receiver is None and isinstance(size, int) and size > 0 and room_dir is not None:
+        # The SYN says how much is coming: open the partial file now, not on the first DATA
+        part_path, _ = partial_paths(room_dir, content_id or session_id)
+        try:
+            receiver = FileReceiver(total_packets=-(-size // chunk_size), path=part_path,
+                                    chunk_size=chunk_size, budget=receive_budget)
+        except OSError as e:
+            print(f"[UDP FILE] Cannot open partial upload for {filename}: {e}")
+    return {"receiver": receiver, "resumed": resumed, "delta": delta_spec, "chunk_size": chunk_size,
+            "room_dir": room_dir}, None
+
+def upload_synack(sess: dict) -> dict:
+    # Upload receivers always attach SACK blocks; the client
+    # decides whether its sender uses them.
+    resp = {
+        "type": "SYN-ACK",
+        "filename": sess["filename"],
+        "session_id": sess["session_id"],
+        "wire": sess["wire"],
+        "sack": True,
+        "chunk_size": sess["chunk_size"]
+    }
+    if sess["compression"] is not None:
+        resp["compress"] = compression_spec(sess["compression"])
+    if sess["fec"]:
+        # Our receivers rebuild lost chunks from parity packets
+        resp["fec"] = True
+    if sess["rwnd_bytes"]:
+        resp["rwnd"] = RWND_BYTES
+    if sess.get("resumed"):
+        # Everything the partial file already holds
+        receiver = sess["receiver"]
+        resp["resume"] = {
+            "ack": receiver.get_ack_seq(),
+            "sack": [list(block) for block in receiver.get_sack_blocks(receiver.total_packets)]
+        }
+    return resp
+
+def admit_download(msg: dict, addr, sess: dict, server_sock) -> Tuple[Optional[dict], Optional[dict]]:
+    """Admission work of a DOWNLOAD: room check, the file and its range, sender and metrics."""
+    room = sess["room"]
+    filename = sess["filename"]
+    chunk_size = sess["chunk_size"]
+
+    if not room_client.room_exists(room):
+        print(f"[UDP FILE] DOWNLOAD Rejected: Room {room} not found")
+        return None, None
+
+    room_dir = get_room_dir(room)
+    if not room_dir:
+        return None, None
+
+    path = room_dir / filename
+    if not path.exists() or not path.is_file():
+        print(f"[UDP FILE] DOWNLOAD Rejected: File {filename} not found in room {room}")
+        return None, None
+
+    # Sessions downloading the same version of a file share its mapping
+    try:
+        data, release = file_cache.acquire(path)
+    except OSError as e:
+        print(f"[UDP FILE] DOWNLOAD Rejected: cannot open {filename} in room {room}: {e}")
+        return None, None
+
+    # Optional byte range (offset/length), or a starting chunk of this
+    # session's chunk size; the whole file otherwise
+    size = len(data)
+    offset = msg.get("offset", 0)
+    if "start_chunk" in msg:
+        try:
+            offset = (int(msg["start_chunk"]) - 1) * chunk_size
+        except (TypeError, ValueError):
+            offset = -1
+    byte_range = resolve_range(size, offset, msg.get("length"))
+    if byte_range is None:
+        print(f"[UDP FILE] DOWNLOAD Rejected: bad range for {filename} ({size} bytes)")
+        if release is not None:
+            release()
+        return None, None
+    offset, length = byte_range
+
+    metrics = FileTransferMetrics(room, filename, METRICS_DIR, algo=msg.get("algo", "reno"), direction="download")
+    metrics.on_start()
+    sender = FileSender(room, filename, data, addr, server_sock, metrics,
+                        loss_prob=SYNCROX_LOSS_PROB, session_id=sess["session_id"],
+                        wire=sess["wire"], sack=sess["sack"], chunk_size=chunk_size,
+                        offset=offset, length=length, compression=sess["compression"], fec=sess["fec"],
+                        byte_window=sess["rwnd_bytes"], release=release)
+    return {"sender": sender, "metrics": metrics, "offset": offset, "length": length, "size": size}, None
+
+def download_synack(sess: dict) -> dict:
+    resp = {
+        "type": "SYN-ACK",
+        "filename": sess["filename"],
+        "session_id": sess["session_id"],
+        "wire": sess["wire"],
+        "sack": sess["sack"],
+        "chunk_size": sess["chunk_size"],
+        "offset": sess["offset"],
+        "length": sess["length"],
+        "size": sess["size"]
+    }
+    if sess["compression"] is not None:
+        resp["compress"] = compression_spec(sess["compression"])
+    if sess["fec"]:
+        resp["fec"] = True
+    if sess["rwnd_bytes"]:
+        resp["rwnd"] = RWND_BYTES
+    return resp
+
+def handle_datagram(sessions: dict, server_sock, timers, packet: bytes, addr):
+    """
+    Handle one datagram from `addr`. `server_sock` is anything with
+    sendto() (a socket or an asyncio transport) and `timers` anything with
+    call_later()/call_at()/time() (a TimerScheduler or an asyncio loop).
+    The threaded server calls this holding sessions_lock. SYN and
+    DOWNLOAD only park the client; the admission pool does the rest.
+    """
+    try:
+        msg = parse_datagram(packet)
+    except:
+        return
+
+    msg_type = msg.get("type")
+
+    if msg_type == "PROBE":
+        # Path MTU probe: report the size that arrived intact; no session state
+        resp = {"type": "PROBE-ACK", "id": msg.get("id"), "size": len(packet)}
+        server_sock.sendto(json.dumps(resp).encode("utf-8"), addr)
+
+    elif msg_type == "SYN":
+        room = msg.get("room")
+        filename = msg.get("filename")
+        pending = sessions.get(addr)
+        if pending is not None and pending["handshake_step"] == "ADMITTING" \
+                and pending.get("type") != "DOWNLOAD" and pending["filename"] == filename:
+            # A retransmitted SYN; admitting the first one answers both
+            return
+
+        # Clients that understand binary framing ask for it; old
+        # clients get JSON DATA/ACK exactly as before.
+        wire = WIRE_BINARY if msg.get("wire") == WIRE_BINARY else WIRE_JSON
+        chunk_size = negotiate_chunk_size(msg.get("chunk_size"))
+        # Codecs we know are accepted; the client's sender decides per chunk
+        compression = parse_compression(msg.get("compress"))
+        session_id = str(uuid.uuid4())[:8]
+        stale = [sessions.pop(addr, None)]
+
+        # Clients that send a content id can resume an interrupted upload of
+        # the same bytes, even from a new address after a restart
+        content_id = msg.get("content_id")
+        if not isinstance(content_id, str) or not CONTENT_ID_RE.fullmatch(content_id):
+            content_id = None
+        if content_id:
+            for other_addr, other in list(sessions.items()):
+                if other.get("content_id") != content_id or other["room"] != room:
+                    continue
+                if time.time() - other["last_activity"] < UPLOAD_TAKEOVER_IDLE:
+                    # Someone else is uploading the same bytes right now
+                    content_id = None
+                    break
+                # The old session's client is gone; checkpoint and take over
+                stale.append(sessions.pop(other_addr))
+
+        sessions[addr] = {
+            "session_id": session_id,
+            "room": room,
+            "filename": filename,
+            "receiver": None,
+            "content_id": content_id,
+            "size": msg.get("size"),
+            "delta": None,
+            "wire": wire,
+            "chunk_size": chunk_size,
+            "compression": compression,
+            "fec": msg.get("fec") is True,
+            "rwnd_bytes": msg.get("rwnd") == RWND_BYTES,
+            "timers": timers,
+            "handshake_step": "ADMITTING",
+            "checkpoint_at": time.time(),
+            "last_activity": time.time()
+        }
+        arm_idle_timer(sessions, addr, sessions[addr])
+        start_admission(sessions, addr, sessions[addr], server_sock, admit_upload, msg, stale)
+
+    elif msg_type == "DOWNLOAD":
+        filename = msg.get("filename")
+        pending = sessions.get(addr)
+        if pending is not None and pending["handshake_step"] == "ADMITTING" \
+                and pending.get("type") == "DOWNLOAD" and pending["filename"] == filename:
+            return
+
+        # A client reusing its socket for the next download replaces any
+        # session it left behind (e.g. when its FIN-ACK was lost)
+        stale = [sessions.pop(addr, None)]
+        sessions[addr] = {
+            "session_id": str(uuid.uuid4())[:8],
+            "type": "DOWNLOAD",
+            "room": msg.get("room"),
+            "filename": filename,
+            "next_seq": 1,
+            "wire": WIRE_BINARY if msg.get("wire") == WIRE_BINARY else WIRE_JSON,
+            "chunk_size": negotiate_chunk_size(msg.get("chunk_size")),
+            "sack": msg.get("sack") is True,
+            "compression": parse_compression(msg.get("compress")),
+            "fec": msg.get("fec") is True,
+            "rwnd_bytes": msg.get("rwnd") == RWND_BYTES,
+            "timers": timers,
+            "handshake_step": "ADMITTING",
+            "last_activity": time.time()
+        }
+        arm_idle_timer(sessions, addr, sessions[addr])
+        start_admission(sessions, addr, sessions[addr], server_sock, admit_download, msg, stale)
+
+    elif msg_type == "ACK":
+        session_id = msg.get("session_id")
+        if addr in sessions and sessions[addr]["session_id"] == session_id:
+            sess = sessions[addr]
+            sess["last_activity"] = time.time()
+            
+            if sess.get("type") == "DOWNLOAD":
+                # Outbound transfer (Server -> Client)
+                ack_val = int(msg.get("ack", 0))
+                metrics = sess["metrics"]
+                sender = sess["sender"]
+                if "rwnd" in msg:
+                    sender.update_rwnd(int(msg["rwnd"]))
+                
+                # RTT sample, congestion control, fast/SACK retransmit
+                sender.handle_ack(ack_val, msg.get("sack"), msg.get("repaired"))
+
+                # Push next window using stateful tracking
+                current_next = sess.get("next_seq", 1)
+                new_next = sender.send_window(current_next, metrics.last_ack + 1)
+                sess["next_seq"] = new_next
+                
+                # Repeated ACKs after completion must not log the transfer again
+                if metrics.last_ack >= sender.total_packets and sess["handshake_step"] != "FIN_SENT":
+                    print(f"[UDP FILE] Download complete for {sess['filename']} to {addr} (Session={session_id})")
+                    metrics.on_complete(sender.logical_bytes, sender.wire_bytes,
+                                        sender.compression and compression_spec(sender.compression))
+                    fin = {
+                        "type": "FIN",
+                        "filename": sess["filename"],
+                        "session_id": session_id
+                    }
+                    server_sock.sendto(json.dumps(fin).encode("utf-8"), addr)
+                    sess["handshake_step"] = "FIN_SENT"
+                arm_download_timers(sessions, addr, sess)
+            else:
+                # Inbound transfer handshake (Client -> Server); its round
+                # trip seeds the receive-window autotuning
+                if sess["handshake_step"] == "SYN-ACK_SENT":
+                    sess["rtt"] = time.time() - sess["synack_at"]
+                    if sess["receiver"] is not None:
+                        sess["receiver"].rtt = sess["rtt"]
+                sess["handshake_step"] = "READY"
+                print(f"[UDP FILE] Handshake complete for session {session_id} from {addr}")
+
+    elif msg_type in ("DATA", "PARITY"):
+        session_id = msg.get("session_id")
+        if addr not in sessions or sessions[addr]["session_id"] != session_id:
+            return
+        
+        sess = sessions[addr]
+        sess["last_activity"] = time.time()
+        room = sess["room"]
+        filename = sess["filename"]
+
+        if msg_type == "PARITY":
+            # FEC parity: may rebuild a lost chunk of its group. Parity that
+            # beats every DATA packet of the transfer is of no use yet.
+            receiver = sess["receiver"]
+            if receiver is None or receiver.is_complete():
+                return
+            try:
+                if not receiver.add_parity(int(msg["first"]), int(msg["k"]), int(msg["len_xor"]),
+                                           data_payload(msg)):
+                    return
+            except (KeyError, TypeError, ValueError):
+                return
+        else:
+            seq = msg["seq"]
+            total = msg["total"]
+
+            try:
+                payload = data_payload(msg, sess.get("compression"), sess.get("chunk_size", CHUNK_SIZE))
+            except:
+                return
+
+            # Chunks stream into a hidden partial file until the upload completes
+            receiver = sess["receiver"]
+            if receiver is None:
+                receiver = open_upload_receiver(sessions, addr, sess, server_sock, total, seq, payload)
+                if receiver is None:
+                    return
+            receiver.add_chunk(seq, payload)
+            if not receiver.ack_due(ack_requested(msg)):
+                # Coalesced into the next packet's ACK, or sent by the delay timer
+                if sess.get("ack_timer") is None:
+                    sess["ack_timer"] = timers.call_later(receiver.ack_delay(), on_ack_timer,
+                                                          sessions, addr, sess, server_sock)
+                return
+
+        # Send Cumulative ACK
+        acknowledge_upload(sessions, addr, sess, server_sock)
+
+    elif msg_type == "FIN-ACK":
+        session_id = msg.get("session_id")
+        if addr in sessions and sessions[addr]["session_id"] == session_id:
+            print(f"[UDP FILE] Session {session_id} terminated gracefully")
+            discard_session(sessions.pop(addr))
+
+    elif msg_type == "FIN":
+        # Download clients confirm receipt of the whole file with FIN
+        session_id = msg.get("session_id")
+        if addr in sessions and sessions[addr]["session_id"] == session_id:
+            fin_ack = {
+                "type": "FIN-ACK",
+                "filename": sessions[addr]["filename"],
+                "session_id": session_id
+            }
+            server_sock.sendto(json.dumps(fin_ack).encode("utf-8"), addr)
+            print(f"[UDP FILE] Session {session_id} closed by client")
+            discard_session(sessions.pop(addr))
+
+def udp_server(sessions: dict, server_sock: Optional[socket.socket] = None):
+    if server_sock is None:
+        server_sock = open_udp_sockets(HOST, UDP_PORT, 1)[0]
+    print(f"[UDP FILE] Server listening on {server_sock.getsockname()}")
     
     # (addr) -> { 
     #   "session_id": id, 
@@ -183,266 +1659,194 @@ def udp_server(sessions: dict):
     #   "receiver": FileReceiver (if upload),
     #   "sender": FileSender (if download),
     #   "metrics": FileTransferMetrics (if download),
-    #   "handshake_step": ...
+    #   "handshake_step": "ADMITTING"|"SYN-ACK_SENT"|"READY"|"WRITING"|"FIN_SENT",
     #   "last_activity": float
     # }
 
+    # Preallocated receive buffer; with UDP_GRO one read can return a whole
+    # run of a client's DATA packets. Each datagram is handled (and its
+    # payload written out) before the buffer is reused.
+    reader = DatagramReader(server_sock)
+    if reader.gro:
+        print("[UDP FILE] UDP_GRO enabled")
+
     while True:
         try:
-            packet, addr = server_sock.recvfrom(65536)
-            try:
-                msg = json.loads(packet.decode("utf-8"))
-            except:
-                continue
-
-            with sessions_lock:
-                msg_type = msg.get("type")
-
-            if msg_type == "SYN":
-                room = msg.get("room")
-                filename = msg.get("filename")
-                
-                if not room_client.room_exists(room):
-                    print(f"[UDP FILE] SYN Rejected: Room {room} not found")
-                    continue
-                
-                session_id = str(uuid.uuid4())[:8]
-                sessions[addr] = {
-                    "session_id": session_id,
-                    "room": room,
-                    "filename": filename,
-                    "receiver": None,
-                    "handshake_step": "SYN-ACK_SENT"
-                }
-                
-                resp = {
-                    "type": "SYN-ACK",
-                    "filename": filename,
-                    "session_id": session_id
-                }
-                server_sock.sendto(json.dumps(resp).encode("utf-8"), addr)
-                print(f"[UDP FILE] SYN Received from {addr}: Room={room}, File={filename} -> Session={session_id}")
-
-            elif msg_type == "DOWNLOAD":
-                room = msg.get("room")
-                filename = msg.get("filename")
-                algo = msg.get("algo", "reno")
-                
-                if not room_client.room_exists(room):
-                    print(f"[UDP FILE] DOWNLOAD Rejected: Room {room} not found")
-                    continue
-                
-                room_dir = get_room_dir(room)
-                if not room_dir:
-                    continue
-                
-                path = room_dir / filename
-                if not path.exists() or not path.is_file():
-                    print(f"[UDP FILE] DOWNLOAD Rejected: File {filename} not found in room {room}")
-                    continue
-                
-                with path.open("rb") as f:
-                    data = f.read()
+            datagrams = reader.recv()
+        except OSError as e:
+            print(f"[UDP FILE] Error: {e}")
+            continue
 
-                session_id = str(uuid.uuid4())[:8]
-                metrics = FileTransferMetrics(room, filename, METRICS_DIR, algo=algo, direction="download")
-                metrics.on_start()
-                sender = FileSender(room, filename, data, addr, server_sock, metrics, loss_prob=SYNCROX_LOSS_PROB, session_id=session_id)
-                
-                sessions[addr] = {
-                    "session_id": session_id,
-                    "type": "DOWNLOAD",
-                    "room": room,
-                    "filename": filename,
-                    "sender": sender,
-                    "metrics": metrics,
-                    "next_seq": 1,
-                    "handshake_step": "SYN-ACK_SENT",
-                    "last_activity": time.time()
-                }
-                
-                resp = {
-                    "type": "SYN-ACK",
-                    "filename": filename,
-                    "session_id": session_id
-                }
-                server_sock.sendto(json.dumps(resp).encode("utf-8"), addr)
-                print(f"[UDP FILE] DOWNLOAD Received from {addr}: Room={room}, File={filename} -> Session={session_id}")
-
-            elif msg_type == "ACK":
-                session_id = msg.get("session_id")
-                if addr in sessions and sessions[addr]["session_id"] == session_id:
-                    sess = sessions[addr]
-                    sess["last_activity"] = time.time()
-                    
-                    if sess.get("type") == "DOWNLOAD":
-                        # Outbound transfer (Server -> Client)
-                        ack_val = int(msg.get("ack", 0))
-                        rwnd = int(msg.get("rwnd", 32))
-                        
-                        metrics = sess["metrics"]
-                        sender = sess["sender"]
-                        
-                        # Calculate RTT if we have timing info
-                        sent_t = sender.sent_times.get(ack_val)
-                        if sent_t is None:
-                            sent_t = sender.sent_times.get(metrics.last_ack + 1, time.time())
-                        rtt_ms = (time.time() - sent_t) * 1000.0
-                        
-                        # Update metrics and check if we should retransmit lost packet
-                        should_retransmit = metrics.on_ack(ack_val, CHUNK_SIZE, rtt_ms)
-                        
-                        if should_retransmit:
-                            # Fast retransmit
-                            lost_seq = metrics.last_ack + 1
-                            offset = (lost_seq - 1) * CHUNK_SIZE
-                            pkt = {
-                                "type": "DATA",
-                                "room": sess["room"],
-                                "filename": sess["filename"],
-                                "seq": lost_seq,
-                                "total": sender.total_packets,
-                                "payload_b64": base64.b64encode(sender.data[offset:offset+CHUNK_SIZE]).decode("ascii"),
-                                "session_id": session_id
-                            }
-                            server_sock.sendto(json.dumps(pkt).encode("utf-8"), addr)
-
-                        # Push next window using stateful tracking
-                        current_next = sess.get("next_seq", 1)
-                        new_next = sender.send_window(current_next, metrics.last_ack + 1, rwnd)
-                        sess["next_seq"] = new_next
-                        
-                        if metrics.last_ack >= sender.total_packets:
-                            print(f"[UDP FILE] Download complete for {sess['filename']} to {addr} (Session={session_id})")
-                            metrics.on_complete()
-                            fin = {
-                                "type": "FIN",
-                                "filename": sess["filename"],
-                                "session_id": session_id
-                            }
-                            server_sock.sendto(json.dumps(fin).encode("utf-8"), addr)
-                            sess["handshake_step"] = "FIN_SENT"
-                    else:
-                        # Inbound transfer handshake (Client -> Server)
-                        sess["handshake_step"] = "READY"
-                        print(f"[UDP FILE] Handshake complete for session {session_id} from {addr}")
-
-            elif msg_type == "DATA":
-                session_id = msg.get("session_id")
-                if addr not in sessions or sessions[addr]["session_id"] != session_id:
-                    continue
-                
-                sess = sessions[addr]
-                sess["last_activity"] = time.time()
-                room = msg["room"]
-                filename = msg["filename"]
-                seq = msg["seq"]
-                total = msg["total"]
-                
-                # Dynamic initialization of receiver on first data packet or ACK
-                if sess["receiver"] is None:
-                    sess["receiver"] = FileReceiver(total_packets=total)
-                
+        # Datagrams are handled entirely under the lock the timer thread
+        # also holds, so sessions never change mid-update
+        with sessions_lock:
+            for packet, addr in datagrams:
                 try:
-                    payload = base64.b64decode(msg["payload_b64"])
-                except:
-                    continue
-                
-                receiver = sess["receiver"]
-                receiver.add_chunk(seq, payload)
-                
-                # Send Cumulative ACK
-                ack = {
-                    "type": "ACK", 
-                    "room": room, 
-                    "filename": filename, 
-                    "session_id": session_id,
-                    "ack": receiver.get_ack_seq(),
-                    "rwnd": receiver.rwnd
-                }
-                server_sock.sendto(json.dumps(ack).encode("utf-8"), addr)
-                
-                if receiver.is_complete():
-                    room_dir = get_room_dir(room)
-                    if room_dir:
-                        receiver.finalize_to_file(room_dir / filename)
-                        print(f"[UDP FILE] Saved {filename} in room {room} from {addr} (Session={session_id})")
-                        
-                        # Initiate termination
-                        fin = {
-                            "type": "FIN",
-                            "filename": filename,
-                            "session_id": session_id
-                        }
-                        server_sock.sendto(json.dumps(fin).encode("utf-8"), addr)
-                        sess["handshake_step"] = "FIN_SENT"
-
-            elif msg_type == "FIN-ACK":
-                session_id = msg.get("session_id")
-                if addr in sessions and sessions[addr]["session_id"] == session_id:
-                    print(f"[UDP FILE] Session {session_id} terminated gracefully")
-                    del sessions[addr]
-
-        except Exception as e:
-            print(f"[UDP FILE] Error: {e}")
+                    handle_datagram(sessions, server_sock, scheduler, packet, addr)
+                except Exception as e:
+                    print(f"[UDP FILE] Error: {e}")
 
 def session_timeout_handler(sessions: dict):
-    """Background thread to handle retransmissions and session cleanup."""
+    """
+    Background thread firing retransmission, pacing and idle timers as they
+    come due; each wakeup only touches the sessions whose timers fired.
+    """
+    scheduler.run_forever()
+
+# --- Multi-core mode ---
+
+def open_udp_sockets(host: str, port: int, count: int) -> List[socket.socket]:
+    """
+    Bind `count` UDP sockets to one port. With more than one, SO_REUSEPORT
+    spreads datagrams across them and a classic BPF program picks the socket
+    from the client's source port, so a session (keyed by client address)
+    always lands on the same worker.
+
+    Each socket's buffers are sized for its share of the receive budget:
+    every upload window may be in flight at once, and downloads send
+    windows of the same size.
+    """
+    socks = []
+    for _ in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if count > 1:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        rcvbuf, sndbuf = size_socket_buffers(sock, RCV_MEMORY_BUDGET // count, RCV_MEMORY_BUDGET // count)
+        if rcvbuf < RCV_MEMORY_BUDGET // count:
+            print(f"[UDP FILE] Socket buffers capped at {rcvbuf}/{sndbuf} bytes (raise net.core.rmem_max/wmem_max)")
+        sock.bind((host, port))
+        port = sock.getsockname()[1]
+        socks.append(sock)
+    if count > 1:
+        attach_port_affinity(socks[0], count)
+    return socks
+
+
+def attach_port_affinity(sock: socket.socket, count: int):
+    # ldh [IPv4 header + 20] (UDP source port); A %= count; return A
+    program = [
+        (BPF_LD | BPF_H | BPF_ABS, 0, 0, (SKF_NET_OFF + 20) & 0xFFFFFFFF),
+        (BPF_ALU | BPF_MOD | BPF_K, 0, 0, count),
+        (BPF_RET | BPF_A, 0, 0, 0),
+    ]
+    insns = ctypes.create_string_buffer(b"".join(struct.pack("HBBI", *insn) for insn in program))
+    fprog = struct.pack("HL", len(program), ctypes.addressof(insns))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, fprog)
+    except OSError as e:
+        # The kernel's 4-tuple hash still keeps a client on one socket
+        # as long as the set of workers doesn't change
+        print(f"[UDP FILE] Port-affinity BPF unavailable ({e}); using kernel hash")
+
+
+def serve_worker_stats(link, sessions: dict):
     while True:
-        time.sleep(0.1)
-        now = time.time()
-        to_delete = []
-        
-        with sessions_lock:
-            for addr, sess in sessions.items():
-                # Prune sessions inactive for > 60s
-                if now - sess["last_activity"] > 60.0:
-                    to_delete.append(addr)
-                    continue
-                
-                if sess.get("type") == "DOWNLOAD" and sess["handshake_step"] != "FIN_SENT":
-                    sender = sess["sender"]
-                    metrics = sess["metrics"]
-                    
-                    # Handle retransmission if needed
-                    # MAX_RETRIES = 5 is defined in config or hardcoded
-                    new_next, ok = sender.handle_timeout(metrics.last_ack + 1, max_retries=5)
-                    if not ok:
-                        print(f"[UDP FILE] Download session {sess['session_id']} failed (MAX_RETRIES)")
-                        to_delete.append(addr)
-                        metrics.close()
-                    elif new_next != -1:
-                        sess["next_seq"] = new_next
-            
-            for addr in to_delete:
-                if addr in sessions:
-                    sess = sessions[addr]
-                    if sess.get("type") == "DOWNLOAD" and "metrics" in sess:
-                        sess["metrics"].close()
-                    del sessions[addr]
+        try:
+            request = link.recv()
+            link.send((request, collect_stats(sessions)))
+        except (EOFError, OSError):
+            return
+
+
+def udp_worker(index: int, sock: socket.socket, link):
+    """Entry point of one UDP worker process: its own sessions, timers and socket."""
+    global _admission_pool
+    worker_links.clear()
+    # A pool inherited from the parent has no threads in this process
+    _admission_pool = None
+    sessions = {}
+    print(f"[UDP FILE] Worker {index} (pid {os.getpid()}) serving {sock.getsockname()}")
+    threading.Thread(target=session_timeout_handler, args=(sessions,), daemon=True).start()
+    threading.Thread(target=serve_worker_stats, args=(link, sessions), daemon=True).start()
+    udp_server(sessions, sock)
+
+
+def start_udp_workers(socks: List[socket.socket]):
+    ctx = multiprocessing.get_context("fork")
+    # Workers split the receive budget and the egress cap as they split the traffic
+    receive_budget.limit = RCV_MEMORY_BUDGET // len(socks)
+    egress.rate = egress.rate / len(socks)
+    for index, sock in enumerate(socks):
+        parent_end, child_end = ctx.Pipe()
+        proc = ctx.Process(target=udp_worker, args=(index, sock, child_end), daemon=True)
+        proc.start()
+        child_end.close()
+        worker_links.append((index, proc, parent_end))
+    # Each worker holds its own socket; the parent's copies would keep dead
+    # workers' sockets in the reuseport group
+    for sock in socks:
+        sock.close()
+
+
+def stop_udp_workers():
+    while worker_links:
+        _, proc, link = worker_links.pop()
+        proc.terminate()
+        proc.join()
+        link.close()
+
+
+def start_servers(sessions: dict, workers: int = 1, host: str = HOST, tcp_port: int = TCP_PORT) -> threading.Thread:
+    """
+    Start the UDP data plane, in-process or as `workers` SO_REUSEPORT
+    processes, then the TCP control loop. Returns the TCP thread.
+    """
+    udp_port = tcp_port + 1
+    # Files removed from rooms while the server was down may leave objects unused
+    store.prune()
+    if workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        print("[FILE SERVER] SO_REUSEPORT not supported here, running one UDP worker")
+        workers = 1
+
+    if workers > 1:
+        # Fork before any server thread exists
+        start_udp_workers(open_udp_sockets(host, udp_port, workers))
+    else:
+        sock = open_udp_sockets(host, udp_port, 1)[0]
+        threading.Thread(target=udp_server, args=(sessions, sock), daemon=True).start()
+        threading.Thread(target=session_timeout_handler, args=(sessions,), daemon=True).start()
+
+    tcp_thread = threading.Thread(target=tcp_server, args=(sessions, host, tcp_port), daemon=True)
+    tcp_thread.start()
+    return tcp_thread
 
 # --- Main Entry Point ---
 
+def egress_weight(text: str) -> Tuple[str, float]:
+    """argparse type for NAME=WEIGHT."""
+    name, sep, weight = text.rpartition("=")
+    try:
+        value = float(weight)
+    except ValueError:
+        value = 0.0
+    if not sep or not name or value <= 0:
+        raise argparse.ArgumentTypeError(f"expected NAME=WEIGHT with a positive weight, got {text!r}")
+    return name, value
+
 def main():
+    parser = argparse.ArgumentParser(description="SyncroX file transfer server")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="UDP worker processes sharing the port via SO_REUSEPORT")
+    parser.add_argument("--egress-mbit", type=float, default=EGRESS_RATE * 8 / 1e6,
+                        help="cap on all downloads together in Mbit/s, shared fairly (0 = none)")
+    parser.add_argument("--egress-room-weight", type=egress_weight, action="append", default=[],
+                        metavar="ROOM=WEIGHT", help="share of the cap a room's downloads get (default 1; repeatable)")
+    args = parser.parse_args()
+    egress.rate = args.egress_mbit * 1e6 / 8
+    egress.room_weights.update(args.egress_room_weight)
+
     print(f"[FILE SERVER] Starting...")
     print(f"[FILE SERVER] Root upload dir: {ROOT_UPLOAD_DIR}")
-    
+
     sessions = {}
-    
-    tcp_thread = threading.Thread(target=tcp_server, daemon=True)
-    udp_thread = threading.Thread(target=udp_server, args=(sessions,), daemon=True)
-    timeout_thread = threading.Thread(target=session_timeout_handler, args=(sessions,), daemon=True)
-    
-    tcp_thread.start()
-    udp_thread.start()
-    timeout_thread.start()
-    
+    tcp_thread = start_servers(sessions, workers=args.workers)
+
     try:
         while True:
             tcp_thread.join(timeout=1.0)
-            udp_thread.join(timeout=1.0)
     except KeyboardInterrupt:
         print("[FILE SERVER] Shutting down...")
+        stop_udp_workers()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,246 @@
+"""
+Content-addressed store behind the room directories.
+
+A finished upload is hashed into its content id and block hashes
+(protocol.manifest) and kept once, as `<root>/<content id>`; the file in
+each room that holds it is a hard link to that object, so LIST, DOWNLOAD
+and RANGE keep seeing ordinary files and the same dataset shared in twenty
+rooms takes the disk space of one. `<content id>.json` records the
+object's size and block hashes. The block index built from those manifests
+lets the server answer a SYN's manifest with the blocks it already has.
+The store is shared by every room, but a SYN may only be answered from
+objects its own room links to: a content id or block hash proves nothing
+about holding the bytes, and must not fetch another room's files.
+
+Objects no room links to any more are pruned. Several UDP worker processes
+may share one store: each keeps its own index and re-reads the manifests
+whenever the store directory changes.
+"""
+import json
+import os
+import stat
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    from .protocol import manifest, map_file, MANIFEST_BLOCK
+except (ImportError, ValueError):
+    from protocol import manifest, map_file, MANIFEST_BLOCK
+
+# link() renames its temporary link into place at once; older ones are debris
+STALE_LINK_AGE = 60.0
+
+
+class ContentStore:
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.RLock()
+        # Block hash -> (content id, offset, length) of a block holding those bytes
+        self._blocks: Dict[str, Tuple[str, int, int]] = {}
+        # Content id -> (size, block hashes) of every manifest indexed
+        self._manifests: Dict[str, Tuple[int, List[str]]] = {}
+        self._version = None
+
+    def object_path(self, cid: str) -> Path:
+        return self.root / cid
+
+    def manifest_path(self, cid: str) -> Path:
+        return self.root / f"{cid}.json"
+
+    def lookup(self, cid: str, size) -> Optional[Path]:
+        """The stored object with this content id and size, if there is one."""
+        path = self.object_path(cid)
+        try:
+            if path.stat().st_size == size:
+                return path
+        except OSError:
+            pass
+        return None
+
+    def link(self, cid: str, dest: Path) -> bool:
+        """Make `dest` a hard link to object `cid`, replacing whatever is there."""
+        try:
+            # rename() over a link to the same file does nothing and would leave tmp behind
+            if os.path.samefile(self.object_path(cid), dest):
+                return True
+        except OSError:
+            pass
+        tmp = self.root / f".{uuid.uuid4().hex[:12]}.link"
+        try:
+            os.link(self.object_path(cid), tmp)
+            os.replace(tmp, dest)
+            return True
+        except OSError:
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+            return False
+
+    def add(self, path: Path, digest: Optional[Tuple[str, List[str]]] = None) -> Optional[str]:
+        """
+        Store the finished file at `path`: it becomes the object for its
+        content, or a link to the existing one. `digest` is the file's
+        manifest() when the caller already has it. Returns the content id,
+        or None if the file could not be stored (it is left as it is).
+        """
+        try:
+            size = path.stat().st_size
+            if digest is None:
+                data = map_file(path)
+                try:
+                    digest = manifest(data)
+                finally:
+                    if hasattr(data, "close"):
+                        data.close()
+        except OSError:
+            return None
+        cid, blocks = digest
+
+        with self.lock:
+            if self.lookup(cid, size) is not None:
+                return cid if self.link(cid, path) else None
+            try:
+                os.link(path, self.object_path(cid))
+            except FileExistsError:
+                # Another worker stored the same bytes first
+                return cid if self.link(cid, path) else None
+            except OSError:
+                return None
+            tmp = self.manifest_path(cid).with_suffix(".tmp")
+            try:
+                with open(tmp, "w") as f:
+                    json.dump({"size": size, "block": MANIFEST_BLOCK, "blocks": blocks}, f)
+                os.replace(tmp, self.manifest_path(cid))
+            except OSError:
+                pass
+            self._index(cid, size, blocks)
+        return cid
+
+    def _index(self, cid: str, size: int, blocks: List[str]):
+        self._manifests[cid] = (size, blocks)
+        for i, block in enumerate(blocks):
+            offset = i * MANIFEST_BLOCK
+            self._blocks.setdefault(block, (cid, offset, min(MANIFEST_BLOCK, size - offset)))
+
+    def _unindex(self, cid: str):
+        if self._manifests.pop(cid, None) is None:
+            return
+        # Blocks this object shared with others must now point at a survivor
+        self._blocks = {}
+        for other, (size, blocks) in list(self._manifests.items()):
+            self._index(other, size, blocks)
+
+    def _sync(self):
+        """Bring the block index up to date with the manifests on disk."""
+        try:
+            version = self.root.stat().st_mtime_ns
+        except OSError:
+            return
+        if version == self._version:
+            return
+        self._version = version
+        on_disk = {p.stem for p in self.root.glob("*.json")}
+        for cid in set(self._manifests) - on_disk:
+            self._unindex(cid)
+        for cid in on_disk - set(self._manifests):
+            try:
+                with open(self.manifest_path(cid), "r") as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if info.get("block") == MANIFEST_BLOCK:
+                self._index(cid, int(info["size"]), info["blocks"])
+
+    def linked_from(self, directory: Path) -> Set[str]:
+        """Content ids of the objects that files in `directory` are links to."""
+        inodes = set()
+        try:
+            entries = list(directory.iterdir())
+        except OSError:
+            return set()
+        for path in entries:
+            try:
+                st = path.lstat()
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode) and st.st_nlink > 1:
+                inodes.add((st.st_dev, st.st_ino))
+        cids = set()
+        if not inodes:
+            return cids
+        for path in self.root.glob("*.json"):
+            try:
+                st = self.object_path(path.stem).stat()
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in inodes:
+                cids.add(path.stem)
+        return cids
+
+    def find_blocks(self, hashes: List[str], among: Set[str]) -> List[Optional[Tuple[str, int, int]]]:
+        """For each block hash, (content id, offset, length) of a copy in one of the objects `among`, or None."""
+        with self.lock:
+            self._sync()
+            if among >= set(self._manifests):
+                return [self._blocks.get(h) for h in hashes]
+            blocks = {}
+            for cid in among:
+                size, cid_blocks = self._manifests.get(cid, (0, []))
+                for i, block in enumerate(cid_blocks):
+                    offset = i * MANIFEST_BLOCK
+                    blocks.setdefault(block, (cid, offset, min(MANIFEST_BLOCK, size - offset)))
+            return [blocks.get(h) for h in hashes]
+
+    def read(self, cid: str, offset: int, length: int) -> bytes:
+        with open(self.object_path(cid), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def prune(self) -> int:
+        """Delete objects no room links to any more; returns how many went."""
+        removed = 0
+        with self.lock:
+            # Temporary links a crashed link() left behind would keep their objects alive
+            cutoff = time.time() - STALE_LINK_AGE
+            for path in self.root.glob(".*.link"):
+                try:
+                    if path.stat().st_ctime < cutoff:
+                        path.unlink()
+                except OSError:
+                    pass
+            for path in self.root.glob("*.json"):
+                cid = path.stem
+                obj = self.object_path(cid)
+                try:
+                    if obj.stat().st_nlink > 1:
+                        continue
+                    obj.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                self._unindex(cid)
+                removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        """Objects and bytes stored, and the bytes the room links to them would take without sharing."""
+        objects, stored, logical = 0, 0, 0
+        for path in self.root.glob("*.json"):
+            try:
+                st = self.object_path(path.stem).stat()
+            except OSError:
+                continue
+            objects += 1
+            stored += st.st_size
+            logical += st.st_size * (st.st_nlink - 1)
+        return {"objects": objects, "stored_bytes": stored, "logical_bytes": logical}
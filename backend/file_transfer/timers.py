@@ -0,0 +1,150 @@
+"""
+Heap-based timer scheduler for the file transfer server.
+
+Retransmission, pacing and idle deadlines are pushed onto one min-heap and a
+single thread sleeps until the earliest one is due, so each wakeup costs
+O(log n) per timer that actually fires instead of a sweep over every session.
+Cancelling is O(1): the entry stays in the heap and is skipped when popped,
+and the heap is compacted once cancelled entries outnumber live ones.
+"""
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Optional
+
+# Compact only heaps big enough for the rebuild to be worth it
+COMPACT_MIN_SIZE = 256
+
+
+class TimerHandle:
+    """
+    Returned by call_at/call_later; `cancel()` stops the callback from
+    running. Mirrors asyncio.TimerHandle so server code can be handed either
+    this scheduler or an asyncio event loop.
+    """
+    __slots__ = ("_when", "callback", "args", "_cancelled", "_scheduler")
+
+    def __init__(self, when: float, callback: Callable, args: tuple, scheduler: "TimerScheduler"):
+        self._when = when
+        self.callback = callback
+        self.args = args
+        self._cancelled = False
+        self._scheduler = scheduler
+
+    def cancel(self):
+        if not self._cancelled:
+            self._cancelled = True
+            # Only entries still in the heap count towards compaction
+            if self._scheduler is not None:
+                self._scheduler._on_cancel()
+
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def when(self) -> float:
+        return self._when
+
+
+class TimerScheduler:
+    """
+    Min-heap of deadlines on the monotonic clock with millisecond-level
+    resolution. Callbacks run on the thread calling `run_due` or
+    `run_forever`, holding `lock` (when given) so they can touch state
+    other threads guard with the same lock.
+    """
+
+    def __init__(self, lock: Optional[threading.Lock] = None, clock: Callable[[], float] = time.monotonic):
+        self.lock = lock
+        self.clock = clock
+        self.fired = 0
+        self._heap = []
+        self._counter = itertools.count()
+        self._cancelled = 0
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._heap) - self._cancelled
+
+    def time(self) -> float:
+        return self.clock()
+
+    def call_at(self, when: float, callback: Callable, *args) -> TimerHandle:
+        handle = TimerHandle(when, callback, args, self)
+        with self._cond:
+            heapq.heappush(self._heap, (when, next(self._counter), handle))
+            # Wake the runner if this is now the earliest deadline
+            if self._heap[0][2] is handle:
+                self._cond.notify()
+        return handle
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        return self.call_at(self.time() + max(delay, 0.0), callback, *args)
+
+    def next_deadline(self) -> Optional[float]:
+        with self._cond:
+            self._drop_cancelled_head()
+            return self._heap[0][0] if self._heap else None
+
+    def _on_cancel(self):
+        with self._cond:
+            self._cancelled += 1
+            if len(self._heap) > COMPACT_MIN_SIZE and self._cancelled * 2 > len(self._heap):
+                self._heap = [entry for entry in self._heap if not entry[2]._cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def _drop_cancelled_head(self):
+        while self._heap and self._heap[0][2]._cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+
+    def _pop_due(self, now: float) -> list:
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, handle = heapq.heappop(self._heap)
+                if handle._cancelled:
+                    self._cancelled -= 1
+                    continue
+                # Out of the heap: a later cancel() must not skew the cancelled
+                # count, but still stops it if an earlier callback of this batch cancels it
+                handle._scheduler = None
+                due.append(handle)
+        return due
+
+    def run_due(self, now: Optional[float] = None) -> int:
+        """Run every callback whose deadline has passed; returns how many ran."""
+        due = self._pop_due(self.time() if now is None else now)
+        if not due:
+            return 0
+        ran = 0
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            for handle in due:
+                if handle._cancelled:
+                    continue
+                ran += 1
+                try:
+                    handle.callback(*handle.args)
+                except Exception as e:
+                    print(f"[TIMERS] Callback error: {e}")
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+        self.fired += ran
+        return ran
+
+    def run_forever(self):
+        while True:
+            with self._cond:
+                self._drop_cancelled_head()
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                wait = self._heap[0][0] - self.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+            self.run_due()
@@ -48,7 +48,7 @@ def visualize(metrics_data, output_path: Path):
         rel_ts = [t - start_ts for t in vals["ts"]]
         
         # Use different colors and markers to distinguish
-        color = 'tab:blue' if 'reno' in algo else 'tab:orange'
+        color = {'reno': 'tab:blue', 'tahoe': 'tab:orange', 'cubic': 'tab:purple', 'bbr': 'tab:green', 'ledbat': 'tab:olive'}.get(algo, 'tab:gray')
         
         plt.step(rel_ts, vals["cwnd"], label=f"{algo.upper()} CWND", where='post', linewidth=2.5, color=color)
         
@@ -0,0 +1,214 @@
+"""
+Write-behind pipeline for finished uploads.
+
+The datagram loop hands a complete upload to UploadWriter and goes back
+to other sessions' packets; writer threads make it durable and report
+back. Each thread takes whatever jobs are queued (up to `batch`) and:
+
+1. stages every job: the job finishes its temporary file (trims a
+   partial upload, or rebuilds a delta upload's file from its base);
+2. fdatasyncs the staged files back to back;
+3. renames each into place, atomically within the room's filesystem;
+4. fsyncs every directory that received a file, once for the batch;
+5. runs each job's publish step, then its done callback.
+
+A rename is durable only once its directory is synced, so done() (which
+sends the FIN) never runs before step 4. A job that fails at any step,
+for whatever reason, is reported with WRITE_FAILED and its temporary
+file removed; the thread goes on with the next job. Submitting never blocks: with
+`max_pending` jobs queued or being written, submit() refuses the job and
+the caller retries later. A writer with no workers commits each job
+inline, inside submit().
+"""
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+WRITE_WORKERS = 2
+WRITE_QUEUE_MAX = 64
+WRITE_BATCH_MAX = 16
+
+# Error code passed to done() when the disk refused the write
+WRITE_FAILED = "WriteFailed"
+
+
+class WriteJob:
+    """
+    One finished upload. `stage()` completes the temporary file `temp` and
+    returns an error code to abandon the job, or None; the writer then
+    syncs it and renames it to `dest`. `publish()` runs once that is
+    durable and `done(error)` last, with None on success.
+    """
+    __slots__ = ("temp", "dest", "stage", "publish", "done", "queued_at")
+
+    def __init__(self, temp: Path, dest: Path, stage: Callable[[], Optional[str]],
+                 publish: Callable[[], None], done: Callable[[Optional[str]], None]):
+        self.temp = temp
+        self.dest = dest
+        self.stage = stage
+        self.publish = publish
+        self.done = done
+        self.queued_at = time.monotonic()
+
+
+def sync_file(path: Path):
+    fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+    try:
+        getattr(os, "fdatasync", os.fsync)(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_directory(path: Path):
+    """Persist the entries of `path` (a no-op where directories cannot be opened)."""
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def discard_temp(job: WriteJob):
+    """Remove what a failed job left of its temporary file."""
+    try:
+        job.temp.unlink()
+    except OSError:
+        pass
+
+
+class UploadWriter:
+    """
+    Bounded pool of writer threads, started on first use in each process
+    (UDP workers fork with the parent's writer, but not its threads).
+    """
+
+    def __init__(self, workers: int = WRITE_WORKERS, max_pending: int = WRITE_QUEUE_MAX,
+                 batch: int = WRITE_BATCH_MAX):
+        self.workers = max(0, workers)
+        self.max_pending = max(1, max_pending)
+        self.batch = max(1, batch)
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._threads = []
+        self.writing = 0
+        self.peak_queued = 0
+        self.written = 0
+        self.failed = 0
+        self.refused = 0
+        self.batches = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def submit(self, job: WriteJob) -> bool:
+        """Queue `job` for the writer threads; False (at once) if the backlog is full."""
+        if self._pid != os.getpid():
+            self._reset()
+        if not self.workers:
+            self.commit([job])
+            return True
+        with self._cond:
+            if len(self._queue) + self.writing >= self.max_pending:
+                self.refused += 1
+                return False
+            # Start the pool, replacing any thread that has died
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._run, name=f"syncrox-writer-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            job.queued_at = time.monotonic()
+            self._queue.append(job)
+            self.peak_queued = max(self.peak_queued, len(self._queue))
+            self._cond.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                batch = [self._queue.popleft() for _ in range(min(self.batch, len(self._queue)))]
+                self.writing += len(batch)
+            try:
+                self.commit(batch)
+            except Exception as e:
+                print(f"[WRITER] Batch failed: {e}")
+            finally:
+                with self._cond:
+                    self.writing -= len(batch)
+
+    def commit(self, batch: List[WriteJob]):
+        """Make every job of `batch` durable and report it; callers may also run this inline."""
+        errors: Dict[WriteJob, str] = {}
+        for job in batch:
+            try:
+                error = job.stage()
+            except Exception as e:
+                print(f"[WRITER] Cannot finish {job.dest.name}: {e}")
+                error = WRITE_FAILED
+            if error is not None:
+                errors[job] = error
+                discard_temp(job)
+
+        # File contents must be on disk before the rename that publishes them
+        staged = [job for job in batch if job not in errors]
+        for job in staged:
+            try:
+                sync_file(job.temp)
+                os.replace(job.temp, job.dest)
+            except Exception as e:
+                print(f"[WRITER] Cannot store {job.dest}: {e}")
+                errors[job] = WRITE_FAILED
+                discard_temp(job)
+        for directory in {job.dest.parent for job in staged if job not in errors}:
+            sync_directory(directory)
+        with self._cond:
+            self.batches += 1
+
+        for job in batch:
+            error = errors.get(job)
+            if error is None:
+                try:
+                    job.publish()
+                except Exception as e:
+                    print(f"[WRITER] Stored {job.dest.name} but could not publish it: {e}")
+            latency = time.monotonic() - job.queued_at
+            with self._cond:
+                if error is None:
+                    self.written += 1
+                else:
+                    self.failed += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+            try:
+                job.done(error)
+            except Exception as e:
+                print(f"[WRITER] Completion callback error: {e}")
+
+    def stats(self) -> dict:
+        """Backlog and write latency (queued to durable) for STATS."""
+        with self._cond:
+            finished = self.written + self.failed
+            return {
+                "queued": len(self._queue),
+                "writing": self.writing,
+                "peak_queued": self.peak_queued,
+                "written": self.written,
+                "failed": self.failed,
+                "refused": self.refused,
+                "batches": self.batches,
+                "avg_ms": round(self.latency_total * 1000.0 / finished, 2) if finished else 0.0,
+                "max_ms": round(self.latency_max * 1000.0, 2)
+            }
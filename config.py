@@ -30,6 +30,8 @@ SYNCROX_LOSS_PROB = 0.1  # Set to 0.0 for reliable transfers
 # =============================
 # NETWORKING CONSTANTS
 # =============================
+# Largest chunk a transfer may negotiate (sessions probe the path MTU and
+# usually settle lower), and the size used with peers that don't negotiate
 CHUNK_SIZE = 4096
 ALPHA = 0.125
 BETA = 0.25
@@ -37,6 +39,16 @@ MIN_RTO = 200.0
 INITIAL_CWND = 1.0
 INITIAL_SSTHRESH = 16.0
 DEFAULT_RWND = 32
+# Receivers ACK every ACK_EVERY in-order DATA packets, or ACK_DELAY_MS after
+# the first one left unacknowledged (1 = an ACK for every packet)
+ACK_EVERY = 2
+ACK_DELAY_MS = 10.0
+# Receive windows start at RCV_WINDOW_INITIAL bytes and grow with measured
+# throughput x RTT up to RCV_WINDOW_MAX. Upload receivers of one server
+# process share RCV_MEMORY_BUDGET, which also sizes its socket buffers.
+RCV_WINDOW_INITIAL = 128 * 1024
+RCV_WINDOW_MAX = 16 * 1024 * 1024
+RCV_MEMORY_BUDGET = 64 * 1024 * 1024
 
 # =============================
 # TIMEOUTS & RETRIES
@@ -13,6 +13,7 @@ if PROJECT_ROOT not in sys.path:
 import streamlit as st
 from PIL import Image
 from config import SERVER_HOST, CHAT_PORT, FILE_PORT, COLLAB_PORT, EXEC_PORT, ROOM_MGMT_PORT
+from backend.file_transfer.congestion import CONGESTION_CONTROLS
 
 try:
     import pandas as pd
@@ -483,7 +484,7 @@ if HAS_PLOTTING:
                             st.markdown("**🔧 Filter by Algorithm**")
                             algo_choice = st.selectbox(
                                 "Select algorithm",
-                                ["All algorithms", "Reno", "Tahoe"],
+                                ["All algorithms"] + [cc.label for cc in CONGESTION_CONTROLS.values()],
                                 help="Filter metrics by congestion control algorithm",
                                 key="filter_algo"
                             )
@@ -501,7 +502,7 @@ if HAS_PLOTTING:
                         
                         # Gather data for all algos in the current room
                         comp_data = {}
-                        for a in ["reno", "tahoe"]:
+                        for a in CONGESTION_CONTROLS:
                             # IMPORTANT: Apply ALL current filters to the comparison data
                             a_df = pd.read_csv(fp)
                             a_df = a_df[a_df["algo"].str.lower() == a].copy()
@@ -525,14 +526,14 @@ if HAS_PLOTTING:
                             
                             with col_comp1:
                                 fig_comp, ax_comp = plt.subplots(figsize=(10, 6))
-                                colors = {"reno": "#60a5fa", "tahoe": "#f59e0b"}
+                                colors = {"reno": "#60a5fa", "tahoe": "#f59e0b", "cubic": "#a78bfa", "bbr": "#34d399", "ledbat": "#9ca3af"}
                                 
                                 for algo, adf in comp_data.items():
                                     ax_comp.step(adf["rel_ts"], adf["cwnd"], label=f"{algo.upper()} CWND", where='post', linewidth=1.5, color=colors.get(algo, "#888"), marker='.', markersize=4)
                                     if "ssthresh" in adf.columns and adf["ssthresh"].max() > 0:
                                         ax_comp.step(adf["rel_ts"], adf["ssthresh"], ':', label=f"{algo.upper()} ssthresh", where='post', alpha=0.7, color=colors.get(algo, "#888"))
                                 
-                                ax_comp.set_title("CWND DYNAMICS: TAHOE vs RENO", fontweight='bold')
+                                ax_comp.set_title(f"CWND DYNAMICS: {' vs '.join(a.upper() for a in comp_data)}", fontweight='bold')
                                 ax_comp.set_xlabel("TIME (S)")
                                 ax_comp.set_ylabel("CWND (PKTS)")
                                 ax_comp.legend(loc='upper right', frameon=True, facecolor='white', edgecolor='#cbd5e1')
@@ -554,7 +555,7 @@ if HAS_PLOTTING:
                                     st.table(stats)
                                     st.caption("Note: Reno's Fast Recovery usually results in higher avg KB/s.")
                         else:
-                            st.warning("Not enough data for comparison. Try uploading files using both Reno and Tahoe.")
+                            st.warning("Not enough data for comparison. Try uploading files using different congestion control algorithms.")
                         
                         st.markdown("---")
                     
@@ -573,6 +574,29 @@ if HAS_PLOTTING:
                     # Show recent events (filtered)
                     st.markdown("**📋 Recent Events Table**")
                     st.dataframe(df.tail(30), use_container_width=True, height=400)
+
+                    # Per-transfer payload bytes before and after chunk compression
+                    summary_fp = metrics_dir / f"room_{current_room}_transfer_summary.csv"
+                    if summary_fp.exists():
+                        sdf = pd.read_csv(summary_fp)
+                        if file_choice != "All files":
+                            sdf = sdf[sdf["file"] == file_choice]
+                        if dir_choice != "All directions":
+                            sdf = sdf[sdf["direction"].str.lower() == dir_choice.lower()]
+                        if not sdf.empty and sdf["wire_bytes"].sum() > 0:
+                            st.markdown("**🗜️ Compression**")
+                            comp_col1, comp_col2, comp_col3 = st.columns(3)
+                            with comp_col1:
+                                st.metric("Logical Data", f"{sdf['logical_bytes'].sum() / 1048576:.2f} MB")
+                            with comp_col2:
+                                st.metric("On the Wire", f"{sdf['wire_bytes'].sum() / 1048576:.2f} MB")
+                            with comp_col3:
+                                st.metric("Compression Ratio",
+                                          f"{sdf['logical_bytes'].sum() / sdf['wire_bytes'].sum():.2f}x")
+                            st.dataframe(
+                                sdf[["file", "direction", "compression", "logical_bytes", "wire_bytes", "ratio"]].tail(10),
+                                use_container_width=True
+                            )
                     
                     # Plot RTT if available
                     ack_df = df[df["event"] == "ACK"].copy()
@@ -653,10 +677,8 @@ if HAS_PLOTTING:
                             ax2.grid(True, alpha=0.2, linestyle='--', linewidth=0.5)
                             
                             # Add algorithm behavior note in legend
-                            if current_algo == "tahoe":
-                                ax2.legend(loc='best', framealpha=0.9, title="Tahoe: cwnd→1 on loss")
-                            else:
-                                ax2.legend(loc='best', framealpha=0.9, title="Reno: cwnd→ssthresh on loss")
+                            cc_cls = CONGESTION_CONTROLS.get(current_algo, CONGESTION_CONTROLS["reno"])
+                            ax2.legend(loc='best', framealpha=0.9, title=f"{cc_cls.label}: {cc_cls.loss_response}")
                             ax2.spines['top'].set_visible(False)
                             ax2.spines['right'].set_visible(False)
                             plt.tight_layout()
@@ -715,6 +737,12 @@ if HAS_PLOTTING:
                         # Algorithm-specific legend title
                         if current_algo == "tahoe":
                             legend_title = "TAHOE: On loss → cwnd = 1 (restart slow start)"
+                        elif current_algo == "cubic":
+                            legend_title = "CUBIC: On loss → cwnd = 0.7·cwnd (cubic regrowth)"
+                        elif current_algo == "bbr":
+                            legend_title = "BBR: On loss → cwnd kept (paced at BtlBw)"
+                        elif current_algo == "ledbat":
+                            legend_title = "LEDBAT: On queuing delay → cwnd shrinks (background)"
                         else:
                             legend_title = "RENO: On loss → cwnd = ssthresh (fast recovery)"
                         ax3.legend(loc="best", fontsize=10, framealpha=0.95, edgecolor='#374151', title=legend_title)
@@ -10,6 +10,7 @@ if PROJECT_ROOT not in sys.path:
 
 import streamlit as st
 from backend.file_transfer.client import SyncroXFileClient
+from backend.file_transfer.congestion import CONGESTION_CONTROLS
 from PIL import Image
 from config import SERVER_HOST, FILE_PORT
 
@@ -266,10 +267,12 @@ col_info, col_algo = st.columns([2, 1])
 with col_info:
     st.info("💡 Upload and download files shared within your room")
 with col_algo:
+    algo_names = list(CONGESTION_CONTROLS)
     st.session_state.ft_algo = st.radio(
         "Congestion Control",
-        ["reno", "tahoe"],
-        index=0 if st.session_state.ft_algo == "reno" else 1,
+        algo_names,
+        index=algo_names.index(st.session_state.ft_algo) if st.session_state.ft_algo in algo_names else 0,
+        format_func=lambda name: CONGESTION_CONTROLS[name].label,
         horizontal=True,
         help="Simulates TCP congestion control algorithms",
         key="algo_radio"
@@ -298,13 +301,18 @@ if up_file is not None:
     file_size = len(up_file.getvalue())
     st.write(f"**File:** {filename}")
     st.write(f"**Size:** {file_size:,} bytes ({file_size/1024:.2f} KB)")
+    background = st.checkbox(
+        "🐌 Background upload",
+        help="Use LEDBAT so this upload yields to chat and collab traffic"
+    )
     
     if st.button("⬆️ Upload File", type="primary", use_container_width=True):
         data = up_file.getvalue()
         try:
             client = SyncroXFileClient(host=SERVER_HOST, port=FILE_PORT, algo=algo)
             with st.spinner(f"Uploading {filename}..."):
-                resp = client.upload_bytes(st.session_state.current_room, filename, data)
+                resp = client.upload_bytes(st.session_state.current_room, filename, data,
+                                           algo="ledbat" if background else None)
             client.close()
             
             if resp.startswith("OK"):
@@ -328,7 +336,7 @@ if "download_file" not in st.session_state:
     st.session_state.download_file = None
 
 try:
-    client = SyncroXFileClient(host=SERVER_HOST, port=FILE_PORT, algo=algo)
+    client = SyncroXFileClient(host=SERVER_HOST, port=FILE_PORT, algo=algo, user=st.session_state.username)
     files = client.list_files(st.session_state.current_room)
 except Exception as e:
     files = []
@@ -0,0 +1,105 @@
+"""
+Congestion-control strategies driven by a synthetic ACK stream.
+
+Run with `python -m pytest tests` (or `python -m unittest discover tests`)
+from the repository root.
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer.protocol import FileTransferMetrics
+from backend.file_transfer.benchmark import LinkEmulator, run_transfer
+
+
+def ack_stream(metrics: FileTransferMetrics, rtts):
+    """Acknowledge one new packet per RTT sample, as a sender's ACK clock would."""
+    for rtt_ms in rtts:
+        metrics.on_ack(metrics.last_ack + 1, 1024, rtt_ms)
+
+
+class QueuingDelayTest(unittest.TestCase):
+    """LEDBAT yields once queuing delay rises; Reno, blind to delay, keeps growing."""
+
+    BASE_RTT = 20.0
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def run_algo(self, algo: str):
+        """cwnd after an uncongested warm-up, and after the RTT climbs to 6x its base."""
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            metrics = FileTransferMetrics("0000", "test.bin", Path(self._tmp.name), algo=algo)
+            # Start in congestion avoidance so both strategies grow additively
+            metrics.cwnd, metrics.ssthresh = 20.0, 10.0
+            try:
+                ack_stream(metrics, [self.BASE_RTT] * 40)
+                warm = metrics.cwnd
+                ack_stream(metrics, [self.BASE_RTT + 2.5 * i for i in range(1, 41)])
+                ack_stream(metrics, [self.BASE_RTT * 6] * 40)
+                return warm, metrics.cwnd
+            finally:
+                metrics.close()
+
+    def test_ledbat_shrinks_under_rising_delay(self):
+        warm, loaded = self.run_algo("ledbat")
+        self.assertGreater(warm, 20.0)
+        self.assertLess(loaded, warm / 2)
+
+    def test_reno_grows_under_the_same_acks(self):
+        warm, loaded = self.run_algo("reno")
+        self.assertGreater(warm, 20.0)
+        self.assertGreater(loaded, warm)
+
+
+class SharedBottleneckTest(unittest.TestCase):
+    """A Reno upload joins a LEDBAT bulk sync on one emulated link, as `benchmark.py yield` runs them."""
+
+    MBIT = 20.0
+    RTT_MS = 20.0
+    BUFFER = 48
+    DELAY = 0.3
+
+    def test_reno_takes_most_of_a_link_shared_with_ledbat(self):
+        fg_data = os.urandom(1024 * 1024)
+        bg_data = os.urandom(3 * 1024 * 1024)
+        link = LinkEmulator(self.MBIT * 1e6, self.RTT_MS, self.BUFFER)
+        results = {}
+
+        def transfer(key, data, algo):
+            results[key] = run_transfer(data, algo=algo, sack=True, link=link, quiet=False)
+
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                bg = threading.Thread(target=transfer, args=("bg", bg_data, "ledbat"))
+                bg.start()
+                time.sleep(self.DELAY)
+                fg = threading.Thread(target=transfer, args=("fg", fg_data, "reno"))
+                fg.start()
+                fg.join()
+                bg.join()
+        finally:
+            link.close()
+
+        self.assertTrue(results["fg"]["ok"] and results["bg"]["ok"])
+        # The bulk sync was still running for all of the foreground upload
+        self.assertGreater(results["bg"]["seconds"], self.DELAY + results["fg"]["seconds"])
+        # Reno alone gets ~75% of the link here and ~37% against another Reno flow
+        goodput = len(fg_data) * 8 / results["fg"]["seconds"] / 1e6
+        self.assertGreater(goodput, 0.55 * self.MBIT)
+
+
+if __name__ == "__main__":
+    unittest.main()
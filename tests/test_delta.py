@@ -0,0 +1,99 @@
+"""
+rsync-style delta: a delta computed against a base's signature rebuilds the new version.
+
+Run with `python -m pytest tests` (or `python -m unittest discover tests`)
+from the repository root.
+"""
+import io
+import os
+import random
+import sys
+import unittest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer.delta import (
+    MIN_BLOCK, signature, parse_signature, compute_delta, apply_delta, COPY_OP, LITERAL_OP, OP_LITERAL
+)
+
+BLOCK = MIN_BLOCK
+
+
+def literal_bytes(delta: bytes) -> int:
+    """Bytes a delta carries as literals rather than copies."""
+    total, pos = 0, 0
+    while pos < len(delta):
+        if delta[pos] == OP_LITERAL:
+            _, length = LITERAL_OP.unpack_from(delta, pos)
+            total += length
+            pos += LITERAL_OP.size + length
+        else:
+            pos += COPY_OP.size
+    return total
+
+
+class DeltaRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(1234)
+        # Not a multiple of the block, so the base ends in a short block
+        self.base = self.rng.randbytes(40 * BLOCK + 777)
+
+    def round_trip(self, new: bytes, max_literal=None) -> bytes:
+        records = parse_signature(signature(self.base, BLOCK))
+        delta = compute_delta(records, BLOCK, len(self.base), new, max_literal=max_literal)
+        self.assertIsNotNone(delta)
+        out = io.BytesIO()
+        self.assertEqual(apply_delta(self.base, delta, BLOCK, out), len(new))
+        self.assertEqual(out.getvalue(), new)
+        return delta
+
+    def test_unchanged_file_is_all_copies(self):
+        delta = self.round_trip(self.base)
+        self.assertEqual(literal_bytes(delta), 0)
+
+    def test_edits(self):
+        base = self.base
+        edits = {
+            "overwrite": base[:5000] + self.rng.randbytes(300) + base[5300:],
+            "insert": base[:10 * BLOCK + 5] + b"inserted bytes" + base[10 * BLOCK + 5:],
+            "delete": base[:7 * BLOCK + 100] + base[9 * BLOCK + 100:],
+            "append": base + self.rng.randbytes(5000),
+            "truncate": base[:25 * BLOCK + 11],
+            "prepend": b"header\n" + base,
+            "several": (base[:3 * BLOCK] + b"x" * 10 + base[3 * BLOCK + 10:20 * BLOCK]
+                        + base[22 * BLOCK:30 * BLOCK] + b"tail"),
+        }
+        for name, new in edits.items():
+            with self.subTest(edit=name):
+                delta = self.round_trip(new)
+                # Only the edited regions travel as literals, not the whole file
+                self.assertLess(literal_bytes(delta), 4 * BLOCK)
+
+    def test_moved_blocks_are_copied(self):
+        new = self.base[20 * BLOCK:] + self.base[:20 * BLOCK]
+        delta = self.round_trip(new)
+        self.assertLess(literal_bytes(delta), 2 * BLOCK)
+
+    def test_small_and_empty_files(self):
+        self.round_trip(b"")
+        self.round_trip(b"short")
+        self.round_trip(self.base[:BLOCK - 1])
+
+    def test_unrelated_file_gives_up(self):
+        new = self.rng.randbytes(len(self.base))
+        records = parse_signature(signature(self.base, BLOCK))
+        self.assertIsNone(compute_delta(records, BLOCK, len(self.base), new, max_literal=len(new) // 2))
+
+    def test_corrupt_delta_is_refused(self):
+        records = parse_signature(signature(self.base, BLOCK))
+        delta = compute_delta(records, BLOCK, len(self.base), self.base[:5 * BLOCK] + b"!" + self.base[5 * BLOCK:])
+        for bad in (delta[:-1], b"C" + (10 ** 6).to_bytes(4, "big") + (1).to_bytes(4, "big"), b"Z"):
+            with self.subTest(delta=bad[:9]):
+                with self.assertRaises(ValueError):
+                    apply_delta(self.base, bad, BLOCK, io.BytesIO())
+
+
+if __name__ == "__main__":
+    unittest.main()
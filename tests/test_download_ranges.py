@@ -0,0 +1,132 @@
+"""
+Empty byte ranges complete at once instead of waiting for DATA that never comes.
+
+Run with `python -m pytest tests` (or `python -m unittest discover tests`)
+from the repository root.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer.server import resolve_range
+from backend.file_transfer.client import SyncroXFileClient
+from backend.file_transfer.async_client import AsyncSyncroXFileClient
+
+SIZE = 1000
+
+
+class ScriptedServer:
+    """
+    TCP listener plus the UDP port after it, as the client expects. BYE is
+    the only TCP command it answers. Every DOWNLOAD gets the SYN-ACK the
+    server sends for an empty range, and every FIN a FIN-ACK; no DATA is
+    ever sent.
+    """
+
+    def __init__(self):
+        for _ in range(20):
+            self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.tcp.bind(("127.0.0.1", 0))
+            self.port = self.tcp.getsockname()[1]
+            self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                self.udp.bind(("127.0.0.1", self.port + 1))
+                break
+            except OSError:
+                self.tcp.close()
+                self.udp.close()
+        else:
+            raise unittest.SkipTest("no free TCP/UDP port pair")
+        self.tcp.listen()
+        self.tcp.settimeout(0.1)
+        self.udp.settimeout(0.1)
+        self.fins = []
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._serve_tcp, daemon=True),
+                         threading.Thread(target=self._serve_udp, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def _serve_tcp(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self.tcp.accept()
+            except socket.timeout:
+                continue
+            with conn, conn.makefile("rb") as lines:
+                for line in lines:
+                    if line.strip() == b"BYE":
+                        conn.sendall(b"OK Bye\n")
+                        break
+
+    def _serve_udp(self):
+        while not self._stop.is_set():
+            try:
+                packet, addr = self.udp.recvfrom(65536)
+            except socket.timeout:
+                continue
+            msg = json.loads(packet)
+            if msg["type"] == "DOWNLOAD":
+                offset = msg.get("offset", 0)
+                reply = {"type": "SYN-ACK", "filename": msg["filename"], "session_id": "0badcafe",
+                         "wire": "json", "sack": True, "chunk_size": msg["chunk_size"],
+                         "offset": offset, "length": 0, "size": SIZE}
+            elif msg["type"] == "FIN":
+                self.fins.append(msg["session_id"])
+                reply = {"type": "FIN-ACK", "filename": msg["filename"], "session_id": msg["session_id"]}
+            else:
+                continue
+            self.udp.sendto(json.dumps(reply).encode("utf-8"), addr)
+
+    def close(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self.tcp.close()
+        self.udp.close()
+
+
+class EmptyRangeTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ScriptedServer()
+        self.addCleanup(self.server.close)
+
+    def test_resolve_range_allows_empty_ranges(self):
+        self.assertEqual(resolve_range(SIZE, 0, 0), (0, 0))
+        self.assertEqual(resolve_range(SIZE, SIZE, None), (SIZE, 0))
+        self.assertIsNone(resolve_range(SIZE, SIZE + 1, None))
+
+    def test_client_returns_empty_bytes(self):
+        client = SyncroXFileClient("127.0.0.1", self.server.port, probe_mtu=False)
+        self.addCleanup(client.close)
+        for offset, length in ((0, 0), (SIZE, None)):
+            start = time.time()
+            self.assertEqual(client.download_bytes("0000", "f.bin", offset=offset, length=length), b"")
+            self.assertLess(time.time() - start, 1.0)
+        # The server's session is closed as for any finished download
+        self.assertEqual(self.server.fins, ["0badcafe", "0badcafe"])
+
+    def test_async_client_returns_empty_bytes(self):
+        async def fetch():
+            async with AsyncSyncroXFileClient("127.0.0.1", self.server.port, probe_mtu=False) as client:
+                return await client.download_bytes("0000", "f.bin", offset=SIZE)
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.time()
+            self.assertEqual(asyncio.run(fetch()), b"")
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(self.server.fins, ["0badcafe"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Forward error correction: one parity packet per group rebuilds any single lost chunk of it.
+
+Run with `python -m pytest tests` (or `python -m unittest discover tests`)
+from the repository root.
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer.protocol import FileReceiver, xor_chunks
+
+CHUNK = 1024
+GROUP = 4
+
+
+class FecRepairTest(unittest.TestCase):
+    def setUp(self):
+        # 22 chunks, the last one short: groups 1-4, ..., 17-20, 21-22
+        self.data = os.urandom(21 * CHUNK + 123)
+        self.total = -(-len(self.data) // CHUNK)
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+
+    def chunk(self, seq: int) -> bytes:
+        return self.data[(seq - 1) * CHUNK:seq * CHUNK]
+
+    def parity(self, first: int):
+        """(first, k, len_xor, payload) as FileSender._send_parity builds them."""
+        last = min(first + GROUP - 1, self.total)
+        chunks = [self.chunk(seq) for seq in range(first, last + 1)]
+        len_xor = 0
+        for chunk in chunks:
+            len_xor ^= len(chunk)
+        return first, last - first + 1, len_xor, xor_chunks(chunks).to_bytes(CHUNK, "little")
+
+    def receivers(self):
+        """An in-memory receiver (client downloads) and one writing to disk (server uploads)."""
+        yield "memory", FileReceiver(self.total, max_buf=64, chunk_size=CHUNK)
+        path = Path(self._tmp.name) / "upload.part"
+        receiver = FileReceiver(self.total, max_buf=64, path=path, chunk_size=CHUNK)
+        self.addCleanup(receiver.close)
+        yield "disk", receiver
+
+    def test_one_lost_chunk_per_group_is_rebuilt(self):
+        # First, middle and last chunks of groups, including the short final chunk
+        lost = {1, 7, 12, 16, 17, 22}
+        for name, receiver in self.receivers():
+            with self.subTest(receiver=name):
+                for first in range(1, self.total + 1, GROUP):
+                    for seq in range(first, min(first + GROUP, self.total + 1)):
+                        if seq not in lost:
+                            receiver.add_chunk(seq, self.chunk(seq))
+                    self.assertEqual(receiver.add_parity(*self.parity(first)), 1)
+                self.assertTrue(receiver.is_complete())
+                self.assertEqual(receiver.repaired, len(lost))
+                self.assertEqual(receiver.finalize_to_bytes(), self.data)
+
+    def test_parity_ahead_of_its_data_waits_for_the_group(self):
+        for name, receiver in self.receivers():
+            with self.subTest(receiver=name):
+                # Parity overtakes the data: nothing to rebuild with three chunks missing
+                self.assertEqual(receiver.add_parity(*self.parity(5)), 0)
+                receiver.add_chunk(5, self.chunk(5))
+                receiver.add_chunk(7, self.chunk(7))
+                self.assertFalse(receiver.has_chunk(6) or receiver.has_chunk(8))
+                # The last of the group but one arrives and the parity rebuilds the other
+                receiver.add_chunk(8, self.chunk(8))
+                self.assertTrue(receiver.has_chunk(6))
+                self.assertEqual(receiver.repaired, 1)
+                self.assertEqual(receiver.parity, {})
+
+    def test_two_losses_in_a_group_need_a_retransmission(self):
+        for name, receiver in self.receivers():
+            with self.subTest(receiver=name):
+                for seq in (1, 4):
+                    receiver.add_chunk(seq, self.chunk(seq))
+                self.assertEqual(receiver.add_parity(*self.parity(1)), 0)
+                self.assertFalse(receiver.has_chunk(2) or receiver.has_chunk(3))
+                # The retransmission of one lets the kept parity rebuild the other
+                receiver.add_chunk(3, self.chunk(3))
+                self.assertTrue(receiver.has_chunk(2))
+                self.assertEqual(receiver.get_ack_seq(), 4)
+                self.assertEqual(receiver.repaired, 1)
+
+    def test_parity_of_a_received_group_changes_nothing(self):
+        receiver = FileReceiver(self.total, max_buf=64, chunk_size=CHUNK)
+        for seq in range(1, self.total + 1):
+            receiver.add_chunk(seq, self.chunk(seq))
+        self.assertEqual(receiver.add_parity(*self.parity(1)), 0)
+        self.assertEqual(receiver.repaired, 0)
+        self.assertEqual(receiver.finalize_to_bytes(), self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Resumable uploads: the chunk bitmap checkpointed beside the partial file survives a restart.
+
+Run with `python -m pytest tests` (or `python -m unittest discover tests`)
+from the repository root.
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer import server
+from backend.file_transfer.protocol import FileReceiver, manifest
+
+CHUNK = 1024
+ROOM = "1234"
+
+
+class ResumeStateTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        patcher = mock.patch.object(server, "ROOT_UPLOAD_DIR", Path(self._tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.room_dir = server.get_room_dir(ROOM)
+        # The last chunk is short
+        self.data = os.urandom(10 * CHUNK + 300)
+        self.total = -(-len(self.data) // CHUNK)
+        self.content_id = manifest(self.data)[0]
+        self.part_path, self.state_path = server.partial_paths(self.room_dir, self.content_id)
+
+    def chunk(self, seq: int) -> bytes:
+        return self.data[(seq - 1) * CHUNK:seq * CHUNK]
+
+    def interrupted_upload(self, received):
+        """Receive `received`, checkpoint as the server does, then lose the process's state."""
+        receiver = FileReceiver(self.total, path=self.part_path, chunk_size=CHUNK)
+        for seq in received:
+            receiver.add_chunk(seq, self.chunk(seq))
+        sess = {"room": ROOM, "filename": "f.bin", "content_id": self.content_id,
+                "size": len(self.data), "receiver": receiver}
+        server.save_upload_state(sess)
+        receiver.close()
+
+    def resumed_receiver(self) -> FileReceiver:
+        state = server.load_upload_state(self.room_dir, self.content_id, len(self.data))
+        self.assertIsNotNone(state)
+        self.assertEqual((state["chunk_size"], state["total_packets"]), (CHUNK, self.total))
+        receiver = FileReceiver(state["total_packets"], path=self.part_path,
+                                chunk_size=state["chunk_size"], resume=state["receiver"])
+        self.addCleanup(receiver.close)
+        return receiver
+
+    def test_bitmap_survives_restart(self):
+        received = [1, 2, 3, 6, 7, 11]
+        self.interrupted_upload(received)
+
+        receiver = self.resumed_receiver()
+        for seq in range(1, self.total + 1):
+            self.assertEqual(receiver.has_chunk(seq), seq in received, seq)
+        self.assertEqual(receiver.get_ack_seq(), 3)
+        self.assertEqual(receiver.get_sack_blocks(), [(6, 7), (11, 11)])
+
+        for seq in range(1, self.total + 1):
+            if seq not in received:
+                receiver.add_chunk(seq, self.chunk(seq))
+        self.assertTrue(receiver.is_complete())
+        # Chunks from before the restart were read back from the partial file
+        dest = self.room_dir / "f.bin"
+        receiver.finalize_to_file(dest)
+        self.assertEqual(dest.read_bytes(), self.data)
+
+    def test_chunks_past_the_cumulative_ack_are_kept(self):
+        self.interrupted_upload([2, 4, 5])
+        receiver = self.resumed_receiver()
+        self.assertEqual(receiver.get_ack_seq(), 0)
+        self.assertEqual(receiver.get_sack_blocks(), [(2, 2), (4, 5)])
+
+    def test_state_for_other_bytes_is_ignored(self):
+        self.interrupted_upload([1, 2])
+        self.assertIsNone(server.load_upload_state(self.room_dir, self.content_id, len(self.data) + 1))
+        self.part_path.unlink()
+        self.assertIsNone(server.load_upload_state(self.room_dir, self.content_id, len(self.data)))
+
+    def test_complete_upload_writes_no_state(self):
+        self.interrupted_upload(range(1, self.total + 1))
+        self.assertFalse(self.state_path.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Selective acknowledgements: the receiver reports what it holds above a hole, the sender resends only holes.
+
+Run with `python -m pytest tests` (or `python -m unittest discover tests`)
+from the repository root.
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer.protocol import (
+    FileReceiver, FileSender, FileTransferMetrics, parse_datagram, WIRE_BINARY
+)
+
+CHUNK = 1024
+PACKETS = 20
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.seqs = []
+
+    def sendto(self, packet: bytes, addr) -> int:
+        self.seqs.append(parse_datagram(packet)["seq"])
+        return len(packet)
+
+
+class SackBlocksTest(unittest.TestCase):
+    def test_blocks_above_the_cumulative_ack(self):
+        receiver = FileReceiver(PACKETS, max_buf=32, chunk_size=CHUNK)
+        for seq in (1, 2, 4, 5, 7, 9, 10):
+            receiver.add_chunk(seq, b"x" * CHUNK)
+        self.assertEqual(receiver.get_ack_seq(), 2)
+        self.assertEqual(receiver.get_sack_blocks(), [(4, 5), (7, 7), (9, 10)])
+        self.assertEqual(receiver.get_sack_blocks(max_blocks=2), [(4, 5), (7, 7)])
+        # Filling the first hole moves the ACK up to the next one
+        receiver.add_chunk(3, b"x" * CHUNK)
+        self.assertEqual(receiver.get_ack_seq(), 5)
+        self.assertEqual(receiver.get_sack_blocks(), [(7, 7), (9, 10)])
+
+
+class SackSenderTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        quiet = contextlib.ExitStack()
+        self.addCleanup(quiet.close)
+        quiet.enter_context(contextlib.redirect_stdout(quiet.enter_context(open(os.devnull, "w"))))
+
+        self.metrics = FileTransferMetrics("0000", "test.bin", Path(self._tmp.name), algo="reno")
+        self.addCleanup(self.metrics.close)
+        self.sock = RecordingSocket()
+        self.sender = FileSender("0000", "test.bin", os.urandom(PACKETS * CHUNK), ("127.0.0.1", 9), self.sock,
+                                 self.metrics, session_id="0badcafe", wire=WIRE_BINARY, sack=True,
+                                 gso=False, chunk_size=CHUNK)
+        self.addCleanup(self.sender.close)
+        self.metrics.cwnd = float(PACKETS)
+        self.sender.send_window(1, 1)
+        self.assertEqual(self.sock.seqs, list(range(1, PACKETS + 1)))
+        self.sock.seqs.clear()
+
+    def test_hole_is_resent_once_enough_is_sacked_above_it(self):
+        self.sender.handle_ack(2, [(4, 4)])
+        self.assertEqual(self.sock.seqs, [])
+        self.sender.handle_ack(2, [(4, 6)])
+        self.assertEqual(self.sock.seqs, [3])
+        self.assertEqual(self.sender.sacked, {4, 5, 6})
+
+    def test_timeout_skips_sacked_packets(self):
+        self.sender.handle_ack(2, [(4, 6), (9, 9)])
+        self.sock.seqs.clear()
+        # Packet 3 is overdue: resend it and go back from there
+        self.sender.sent_times[3] = 0.0
+        next_seq, ok = self.sender.handle_timeout(3, 5)
+        self.assertTrue(ok)
+        self.assertEqual(self.sock.seqs, [3])
+        self.metrics.cwnd = float(PACKETS)
+        self.sender.send_window(next_seq, 3)
+        self.assertEqual(self.sock.seqs, [3, 7, 8] + list(range(10, PACKETS + 1)))
+
+    def test_cumulative_ack_clears_the_scoreboard(self):
+        self.sender.handle_ack(2, [(4, 6)])
+        self.sender.handle_ack(7, [(9, 10)])
+        self.assertEqual(self.sender.sacked, {9, 10})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+ContentStore: one object per content, hard-linked into rooms, pruned once no room links it.
+
+Run with `python -m pytest tests` (or `python -m unittest discover tests`)
+from the repository root.
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer.protocol import manifest, MANIFEST_BLOCK
+from backend.file_transfer.store import ContentStore
+
+
+class ContentStoreTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        root = Path(self._tmp.name)
+        self.store = ContentStore(root / ".store")
+        self.rooms = {room: root / room for room in ("1111", "2222")}
+        for room_dir in self.rooms.values():
+            room_dir.mkdir()
+
+    def put(self, room: str, name: str, data: bytes) -> Path:
+        path = self.rooms[room] / name
+        path.write_bytes(data)
+        self.assertIsNotNone(self.store.add(path))
+        return path
+
+    def test_same_content_is_stored_once(self):
+        data = os.urandom(3 * MANIFEST_BLOCK + 100)
+        a = self.put("1111", "a.bin", data)
+        b = self.put("2222", "b.bin", data)
+        cid = manifest(data)[0]
+        self.assertTrue(os.path.samefile(a, b))
+        # The object and both room files
+        self.assertEqual(self.store.object_path(cid).stat().st_nlink, 3)
+        self.assertEqual(self.store.stats(),
+                         {"objects": 1, "stored_bytes": len(data), "logical_bytes": 2 * len(data)})
+
+    def test_prune_keeps_objects_still_linked(self):
+        data = os.urandom(1000)
+        a = self.put("1111", "a.bin", data)
+        b = self.put("2222", "b.bin", data)
+        cid = manifest(data)[0]
+
+        self.assertEqual(self.store.prune(), 0)
+        a.unlink()
+        self.assertEqual(self.store.prune(), 0)
+        self.assertEqual(b.read_bytes(), data)
+
+        b.unlink()
+        self.assertEqual(self.store.prune(), 1)
+        self.assertFalse(self.store.object_path(cid).exists())
+        self.assertFalse(self.store.manifest_path(cid).exists())
+        self.assertEqual(self.store.stats()["objects"], 0)
+
+    def test_overwritten_file_releases_its_object(self):
+        old, new = os.urandom(1000), os.urandom(1000)
+        path = self.put("1111", "f.bin", old)
+        # A new version replaces the room's link, as an upload's rename does
+        tmp = path.with_name("f.tmp")
+        tmp.write_bytes(new)
+        os.replace(tmp, path)
+        self.store.add(path)
+        self.assertEqual(self.store.prune(), 1)
+        self.assertFalse(self.store.object_path(manifest(old)[0]).exists())
+        self.assertEqual(path.read_bytes(), new)
+
+    def test_link_into_another_room(self):
+        data = os.urandom(1000)
+        self.put("1111", "a.bin", data)
+        cid = manifest(data)[0]
+        dest = self.rooms["2222"] / "copy.bin"
+        self.assertTrue(self.store.link(cid, dest))
+        self.assertEqual(dest.read_bytes(), data)
+        self.assertEqual(self.store.object_path(cid).stat().st_nlink, 3)
+        # Linking again over the same file changes nothing
+        self.assertTrue(self.store.link(cid, dest))
+        self.assertEqual(self.store.object_path(cid).stat().st_nlink, 3)
+        self.assertEqual([p.name for p in self.store.root.glob(".*.link")], [])
+
+    def test_rooms_only_see_their_own_objects(self):
+        mine = os.urandom(2 * MANIFEST_BLOCK)
+        theirs = os.urandom(2 * MANIFEST_BLOCK)
+        self.put("1111", "mine.bin", mine)
+        self.put("2222", "theirs.bin", theirs)
+        mine_cid, mine_blocks = manifest(mine)
+        theirs_cid, theirs_blocks = manifest(theirs)
+
+        self.assertEqual(self.store.linked_from(self.rooms["1111"]), {mine_cid})
+        self.assertEqual(self.store.linked_from(self.rooms["2222"]), {theirs_cid})
+
+        among = self.store.linked_from(self.rooms["1111"])
+        found = self.store.find_blocks([mine_blocks[1], theirs_blocks[0]], among)
+        self.assertEqual(found[0], (mine_cid, MANIFEST_BLOCK, MANIFEST_BLOCK))
+        self.assertIsNone(found[1])
+        self.assertEqual(self.store.read(mine_cid, MANIFEST_BLOCK, 10), mine[MANIFEST_BLOCK:MANIFEST_BLOCK + 10])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+TimerScheduler: callbacks run in deadline order, cancelled ones never run.
+
+Run with `python -m pytest tests` (or `python -m unittest discover tests`)
+from the repository root.
+"""
+import os
+import sys
+import threading
+import unittest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer.timers import TimerScheduler, COMPACT_MIN_SIZE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TimerSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.timers = TimerScheduler(clock=self.clock)
+        self.fired = []
+
+    def test_runs_due_callbacks_in_deadline_order(self):
+        for delay in (0.3, 0.1, 0.2, 0.5):
+            self.timers.call_later(delay, self.fired.append, delay)
+        self.assertEqual(self.timers.next_deadline(), 100.1)
+
+        self.clock.now += 0.25
+        self.assertEqual(self.timers.run_due(), 2)
+        self.assertEqual(self.fired, [0.1, 0.2])
+        self.clock.now += 1.0
+        self.assertEqual(self.timers.run_due(), 2)
+        self.assertEqual(self.fired, [0.1, 0.2, 0.3, 0.5])
+        self.assertEqual(len(self.timers), 0)
+        self.assertEqual(self.timers.fired, 4)
+
+    def test_equal_deadlines_run_in_scheduling_order(self):
+        for name in "abcde":
+            self.timers.call_at(101.0, self.fired.append, name)
+        self.timers.run_due(101.0)
+        self.assertEqual(self.fired, list("abcde"))
+
+    def test_cancelled_timers_never_run(self):
+        keep = self.timers.call_later(0.1, self.fired.append, "keep")
+        drop = self.timers.call_later(0.05, self.fired.append, "drop")
+        drop.cancel()
+        drop.cancel()
+        self.assertTrue(drop.cancelled())
+        self.assertEqual(len(self.timers), 1)
+        # The cancelled head no longer sets the next wakeup
+        self.assertEqual(self.timers.next_deadline(), keep.when())
+
+        self.clock.now += 1.0
+        self.assertEqual(self.timers.run_due(), 1)
+        self.assertEqual(self.fired, ["keep"])
+        # Cancelling a timer that already ran is harmless
+        keep.cancel()
+        self.assertEqual(len(self.timers), 0)
+        self.assertIsNone(self.timers.next_deadline())
+
+    def test_callback_can_rearm_and_cancel_others(self):
+        later = self.timers.call_later(0.2, self.fired.append, "later")
+
+        def first():
+            self.fired.append("first")
+            later.cancel()
+            self.timers.call_later(0.0, self.fired.append, "rearmed")
+
+        self.timers.call_later(0.1, first)
+        self.clock.now += 1.0
+        self.timers.run_due()
+        self.assertEqual(self.fired, ["first"])
+        # A timer armed from a callback waits for the next pass
+        self.timers.run_due()
+        self.assertEqual(self.fired, ["first", "rearmed"])
+
+    def test_mass_cancel_compacts_the_heap(self):
+        handles = [self.timers.call_later(i / 1000.0, self.fired.append, i) for i in range(4 * COMPACT_MIN_SIZE)]
+        for handle in handles[:-10]:
+            handle.cancel()
+        self.assertEqual(len(self.timers), 10)
+        self.assertLess(len(self.timers._heap), 2 * COMPACT_MIN_SIZE)
+        self.clock.now += 10.0
+        self.timers.run_due()
+        self.assertEqual(self.fired, list(range(4 * COMPACT_MIN_SIZE - 10, 4 * COMPACT_MIN_SIZE)))
+
+    def test_callbacks_hold_the_lock(self):
+        lock = threading.Lock()
+        timers = TimerScheduler(lock=lock, clock=self.clock)
+        timers.call_later(0.0, lambda: self.fired.append(lock.locked()))
+        timers.run_due()
+        self.assertEqual(self.fired, [True])
+        self.assertFalse(lock.locked())
+
+
+if __name__ == "__main__":
+    unittest.main()
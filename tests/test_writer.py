@@ -0,0 +1,109 @@
+"""
+UploadWriter: finished uploads become durable files before their done() runs; a failed job spoils no other.
+
+Run with `python -m pytest tests` (or `python -m unittest discover tests`)
+from the repository root.
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.file_transfer.writer import UploadWriter, WriteJob, WRITE_FAILED
+
+
+class UploadWriterTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.room = Path(self._tmp.name)
+        self.events = []
+        self.finished = threading.Event()
+        self.expected = 0
+
+    def job(self, name: str, data: bytes, stage_error=None) -> WriteJob:
+        temp = self.room / f".{name}.part"
+        temp.write_bytes(data)
+        dest = self.room / name
+
+        def stage():
+            self.events.append(("stage", name))
+            return stage_error
+
+        def publish():
+            # The file is in place by the time it is published
+            self.events.append(("publish", name, dest.read_bytes() == data))
+
+        def done(error):
+            self.events.append(("done", name, error))
+            if sum(1 for event in self.events if event[0] == "done") == self.expected:
+                self.finished.set()
+
+        return WriteJob(temp, dest, stage, publish, done)
+
+    def run_jobs(self, writer: UploadWriter, jobs):
+        self.expected = len(jobs)
+        for job in jobs:
+            self.assertTrue(writer.submit(job))
+        self.assertTrue(self.finished.wait(10.0))
+
+    def test_inline_writer(self):
+        writer = UploadWriter(workers=0)
+        self.run_jobs(writer, [self.job("a.bin", b"alpha")])
+        self.assertEqual(self.events, [("stage", "a.bin"), ("publish", "a.bin", True), ("done", "a.bin", None)])
+        self.assertFalse((self.room / ".a.bin.part").exists())
+        self.assertEqual(writer.stats()["written"], 1)
+
+    def test_failed_job_leaves_the_batch_intact(self):
+        writer = UploadWriter(workers=2)
+        jobs = [self.job(f"f{i}.bin", os.urandom(1000)) for i in range(6)]
+        jobs.append(self.job("stale.bin", b"old delta", stage_error="DeltaBaseChanged"))
+        self.run_jobs(writer, jobs)
+
+        done = {event[1]: event[2] for event in self.events if event[0] == "done"}
+        self.assertEqual(done.pop("stale.bin"), "DeltaBaseChanged")
+        self.assertEqual(set(done.values()), {None})
+        published = [event for event in self.events if event[0] == "publish"]
+        self.assertEqual(len(published), 6)
+        self.assertTrue(all(event[2] for event in published))
+        # The refused job is neither published nor left behind
+        self.assertFalse((self.room / "stale.bin").exists())
+        self.assertFalse((self.room / ".stale.bin.part").exists())
+        stats = writer.stats()
+        self.assertEqual((stats["written"], stats["failed"], stats["queued"], stats["writing"]), (6, 1, 0, 0))
+
+    def test_unwritable_destination_reports_write_failed(self):
+        job = self.job("gone.bin", b"data")
+        job.dest = self.room / "missing-dir" / "gone.bin"
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            self.run_jobs(UploadWriter(workers=0), [job])
+        self.assertIn(("done", "gone.bin", WRITE_FAILED), self.events)
+        self.assertNotIn("publish", [event[0] for event in self.events])
+        self.assertFalse(job.temp.exists())
+
+    def test_full_backlog_refuses_without_blocking(self):
+        writer = UploadWriter(workers=1, max_pending=2)
+        gate = threading.Event()
+        blocked = self.job("slow.bin", b"slow")
+        stage = blocked.stage
+        blocked.stage = lambda: gate.wait(10.0) and stage()
+        self.expected = 2
+        self.assertTrue(writer.submit(blocked))
+        self.assertTrue(writer.submit(self.job("next.bin", b"next")))
+        self.assertFalse(writer.submit(self.job("refused.bin", b"refused")))
+        self.assertEqual(writer.stats()["refused"], 1)
+        gate.set()
+        self.assertTrue(self.finished.wait(10.0))
+        self.assertEqual(sorted(p.name for p in self.room.iterdir() if not p.name.startswith(".")),
+                         ["next.bin", "slow.bin"])
+
+
+if __name__ == "__main__":
+    unittest.main()